@@ -0,0 +1,69 @@
+"""
+recall@k and query latency of the exact scan against the IVF index on synthetic
+clustered vectors. run from the repository root:
+
+    python -m benchmarks.ann_benchmark --rows 200000 --dimensions 768 --probes 1 4 8 16 32
+"""
+from __future__ import annotations
+import time, argparse, tempfile
+
+import numpy as np
+
+from src.chat_model.ann import IVFIndex
+from src.chat_model.vector_store import normalize
+
+
+
+def clustered_vectors(rows: int, dimensions: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng: np.random.Generator = np.random.default_rng(seed)
+    centers: np.ndarray = rng.normal(size=(clusters, dimensions))
+    points: np.ndarray = centers[rng.integers(0, clusters, rows)] + 0.5 * rng.normal(size=(rows, dimensions))
+    return normalize(points.astype(np.float32))
+
+
+def exact_search(matrix: np.ndarray, query: np.ndarray, top_k: int) -> np.ndarray:
+    scores: np.ndarray = matrix @ query
+    keep: np.ndarray = np.argpartition(-scores, top_k)[:top_k]
+    return keep[np.argsort(-scores[keep])]
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256, help="clusters in the synthetic data")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists, sqrt(rows) by default")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args: argparse.Namespace = parser.parse_args()
+
+    matrix: np.ndarray = clustered_vectors(args.rows, args.dimensions, args.clusters)
+    queries: np.ndarray = clustered_vectors(args.queries, args.dimensions, args.clusters, seed=1)
+    excluded: np.ndarray = np.zeros(args.rows, dtype=bool)
+
+    start: float = time.perf_counter()
+    truth: list[set[int]] = [set(exact_search(matrix, query, args.top_k).tolist()) for query in queries]
+    exact_ms: float = (time.perf_counter() - start) * 1000 / args.queries
+    print(f"{args.rows} rows x {args.dimensions} dimensions, {args.queries} queries, top {args.top_k}")
+    print(f"{'method':<16}{'recall':>10}{'ms/query':>12}{'speedup':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{exact_ms:>12.3f}{1.0:>10.1f}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        index: IVFIndex = IVFIndex(folder, nlist=args.lists)
+        start = time.perf_counter()
+        index.train(matrix)
+        print(f"trained {len(index.lists)} lists in {time.perf_counter() - start:.2f}s")
+
+        for probes in args.probes:
+            index.nprobe = probes
+            start = time.perf_counter()
+            results: list[list[int]] = [index.search(matrix, excluded, query, args.top_k)[0] for query in queries]
+            ivf_ms: float = (time.perf_counter() - start) * 1000 / args.queries
+            found: int = sum(len(expected & set(rows)) for expected, rows in zip(truth, results))
+            recall: float = found / (args.queries * args.top_k)
+            print(f"{f'ivf nprobe={probes}':<16}{recall:>10.3f}{ivf_ms:>12.3f}{exact_ms / ivf_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,45 @@
-from typing import Any
-import platform, requests, os, argparse, subprocess
-import shutil, tarfile, zipfile, tempfile
+from typing import Any, Callable
+import platform, requests, os, argparse, subprocess, asyncio
+import shutil, tarfile, zipfile, hashlib, time, stat, re
+from concurrent.futures import ThreadPoolExecutor
 
 import tomli
 from tqdm import tqdm
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
 from pathlib import Path
 
+from src.paths import CURRENT_LINK, CURRENT_POINTER, current_version
+from src.workers import PullEvent, pull_models
+
 
 ARCHIVE_TYPES: tuple[str, ...] = ()
 ROOT: Path = Path(__file__).parent
+DOWNLOAD_CACHE: Path = ROOT / "data" / "cache" / "downloads"
+GITHUB_API: str = "https://api.github.com"
+
+MIN_CHUNK_SIZE: int = 64 * 1024
+MAX_CHUNK_SIZE: int = 8 * 1024 * 1024
+START_CHUNK_SIZE: int = 256 * 1024
+# the chunk size doubles while a read takes less than the low mark and halves above the high one
+CHUNK_SECONDS: tuple[float, float] = (0.1, 1.0)
+DOWNLOAD_RETRIES: int = 5
+RETRY_BACKOFF: float = 1.0
+REQUEST_TIMEOUT: float = 30.0
+HASH_BLOCK_SIZE: int = 1024 * 1024
+COPY_BUFFER_SIZE: int = 1024 * 1024
+EXTRACT_WORKERS: int = min(8, os.cpu_count() or 1)
+# installed versions kept per tool, the active one and the one a rollback returns to
+KEEP_VERSIONS: int = 2
+INSTALLED_MARKER: str = ".installed"
+LEGACY_VERSION: str = "legacy"
+# launcher scripts written next to the version folders
+LAUNCHER_GLOB: str = "*_portable.*"
+
+# raw reads surface urllib3 errors that iter_content would have wrapped
+_RETRYABLE: tuple[type[Exception], ...] = (
+    requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+    ProtocolError, ReadTimeoutError
+)
 
 
 def prepend_path(path_to_add: str) -> dict:
@@ -17,110 +48,473 @@ def prepend_path(path_to_add: str) -> dict:
     env["PATH"] = path_to_add + os.pathsep + env["PATH"]
     return env
 
+def member_parts(name: str) -> list[str]:
+    """
+    path components of an archive member, absolute paths, drive letters and ".." are rejected
+    """
+    normalized: str = name.replace("\\", "/")
+    parts: list[str] = [part for part in normalized.split("/") if part not in ("", ".")]
+    if normalized.startswith("/") or (parts and ":" in parts[0]) or ".." in parts:
+        raise ValueError(f"Unsafe archive member: {name}")
+    return parts
+
+
+def _check_link(dest_dir: Path, link_path: Path, target: str) -> None:
+    resolved: str = os.path.normpath(os.path.join(link_path.parent, target))
+    if os.path.isabs(target) or os.path.commonpath([resolved, str(dest_dir)]) != str(dest_dir):
+        raise ValueError(f"Unsafe link target: {link_path} -> {target}")
+
+
+def _wrapper_folder(members: list[tuple[list[str], bool]]) -> str | None:
+    """
+    the single top level folder every member sits in, if there is one
+    """
+    tops: set[str] = {parts[0] for parts, _ in members if parts}
+    if len(tops) != 1:
+        return None
+    if any(len(parts) > 1 or is_dir for parts, is_dir in members):
+        return tops.pop()
+    return None
+
+
+def _extract_zip_members(archive_path: Path, dest_dir: Path, jobs: list[tuple[zipfile.ZipInfo, Path]], progress: tqdm) -> None:
+    # every worker reads through its own handle instead of sharing one file position
+    with zipfile.ZipFile(archive_path, "r") as z:
+        for info, target in jobs:
+            mode: int = info.external_attr >> 16
+            if stat.S_ISLNK(mode):
+                link: str = z.read(info).decode("utf-8")
+                _check_link(dest_dir, target, link)
+                target.unlink(missing_ok=True)
+                os.symlink(link, target)
+            else:
+                with z.open(info) as source, open(target, "wb") as out:
+                    shutil.copyfileobj(source, out, COPY_BUFFER_SIZE)
+                if mode & 0o111:
+                    os.chmod(target, mode & 0o777)
+            progress.update(1)
+
+
+def extract_zip(archive_path: Path, dest_dir: Path, workers: int = EXTRACT_WORKERS) -> None:
+    with zipfile.ZipFile(archive_path, "r") as z:
+        infos: list[zipfile.ZipInfo] = z.infolist()
+    members: list[tuple[list[str], bool]] = [(member_parts(info.filename), info.is_dir()) for info in infos]
+    strip: int = 1 if _wrapper_folder(members) is not None else 0
+
+    files: list[tuple[zipfile.ZipInfo, Path]] = []
+    for info, (parts, is_dir) in zip(infos, members):
+        if len(parts) <= strip:
+            continue
+        target: Path = dest_dir.joinpath(*parts[strip:])
+        if is_dir:
+            target.mkdir(parents=True, exist_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            files.append((info, target))
+
+    # largest first round robin keeps the compressed bytes per worker even
+    files.sort(key=lambda job: job[0].file_size, reverse=True)
+    workers = max(1, min(workers, len(files)))
+    with tqdm(total=len(files), desc="Extracting ZIP") as progress, ThreadPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(_extract_zip_members, archive_path, dest_dir, files[i::workers], progress)
+            for i in range(workers)
+        ]
+        for future in futures:
+            future.result()
+
+
+def _unwrap(dest_dir: Path, wrapper: str, created: set[str]) -> None:
+    """
+    moves what was extracted with the wrapper stripped back under it
+    """
+    staging: Path = dest_dir / f".{wrapper}.unwrap"
+    staging.mkdir()
+    for name in created:
+        os.replace(dest_dir / name, staging / name)
+    os.replace(staging, dest_dir / wrapper)
+
+
+def extract_tar(archive_path: Path, dest_dir: Path) -> None:
+    """
+    single pass over the stream. the first member decides whether there is a wrapper
+    folder, a later member outside it puts the already extracted files back under it
+    """
+    extract_kwargs: dict[str, Any] = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+    wrapper: str | None = None
+    decided: bool = False
+    created: set[str] = set()
+
+    with tarfile.open(archive_path, "r:*") as t, tqdm(desc="Extracting TAR", unit=" files") as progress:
+        for member in t:
+            parts: list[str] = member_parts(member.name)
+            if not parts:
+                continue
+            if not decided:
+                decided = True
+                wrapper = parts[0] if member.isdir() or len(parts) > 1 else None
+            if wrapper is not None and parts[0] != wrapper:
+                _unwrap(dest_dir, wrapper, created)
+                created = {wrapper}
+                wrapper = None
+
+            relative: list[str] = parts[1:] if wrapper is not None else parts
+            if not relative:
+                continue
+            created.add(relative[0])
+            member.name = "/".join(relative)
+            target: Path = dest_dir.joinpath(*relative)
+
+            if member.issym():
+                _check_link(dest_dir, target, member.linkname)
+            elif member.islnk():
+                link_parts: list[str] = member_parts(member.linkname)
+                if wrapper is not None and link_parts[:1] == [wrapper]:
+                    link_parts = link_parts[1:]
+                member.linkname = "/".join(link_parts)
+            elif not (member.isfile() or member.isdir()):
+                # devices and fifos have no place in a binary release
+                continue
+
+            t.extract(member, dest_dir, **extract_kwargs)
+            progress.update(1)
+
+
 def safe_extract_archive(archive_path: str, dest_dir: str) -> None:
+    """
+    extracts straight into dest_dir, stripping a single wrapper folder from member
+    paths as they are written. members that would land outside dest_dir are rejected
+    """
     archive_path: Path = Path(archive_path)
-    dest_dir: Path = Path(dest_dir)
+    dest_dir: Path = Path(dest_dir).resolve()
     dest_dir.mkdir(parents=True, exist_ok=True)
-
-    temp_dir: Path = dest_dir / "__extract_tmp__"
-    if temp_dir.exists():
-        shutil.rmtree(temp_dir)
-    temp_dir.mkdir()
     
     lower_name: str = archive_path.name.lower()
 
     if lower_name.endswith(".zip"):
-        with zipfile.ZipFile(archive_path, "r") as z:
-            members = z.infolist()
-            for member in tqdm(members, desc="Extracting ZIP"):
-                z.extract(member, temp_dir)
-
-    elif lower_name.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2")):
-        with tarfile.open(archive_path, "r:*") as t:
-            members = t.getmembers()
-            for member in tqdm(members, desc="Extracting TAR"):
-                t.extract(member, temp_dir)
-
+        extract_zip(archive_path, dest_dir)
+    elif lower_name.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")):
+        extract_tar(archive_path, dest_dir)
     else:
         raise ValueError(f"Unsupported archive format: {archive_path}")
-    top_items: list[Path] = list(temp_dir.iterdir())
-
-    if len(top_items) == 1 and top_items[0].is_dir():
-        # strip "wrapper folder"
-        wrapper: Path = top_items[0]
-        for item in wrapper.iterdir():
-            shutil.move(str(item), dest_dir)
-    else:
-        # Keep structure unchanged
-        for item in top_items:
-            shutil.move(str(item), dest_dir)
-
-    shutil.rmtree(temp_dir)
-
 
-def download_and_install(url: str, install_dir: str, backup_old: bool = True) -> None:
-    suffix: str = Path(url).suffix 
-
-    if url.lower().endswith((".tar.gz", ".tgz")):
-        suffix = ".tar.gz"
-    
-    install_dir: Path = Path(install_dir)
-    install_dir.mkdir(parents=True, exist_ok=True)
-
-    old_install : Path | None = None
-    if backup_old and install_dir.exists() and any(install_dir.iterdir()):
-        old_install = install_dir.with_suffix(".backup")
-        if old_install.exists():
-            shutil.rmtree(old_install)
-        shutil.move(str(install_dir), str(old_install))
-        install_dir.mkdir(parents=True, exist_ok=True)
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-        tmp_path = Path(tmp_file.name)
-        print(f"Downloading {url} to temp file {tmp_path}")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total = int(r.headers.get("content-length", 0))
-            with tqdm(total=total, unit="B", unit_scale=True, desc="Pulling Assets") as pbar:
-                for chunk in r.iter_content(chunk_size=8192):
-                    tmp_file.write(chunk)
-                    pbar.update(len(chunk))
 
+def sha256_file(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(url: str, cache_dir: str | Path = DOWNLOAD_CACHE) -> Path:
+    """
+    release assets keep their name across versions, the url (which holds the tag) keys the cache
+    """
+    key: str = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return Path(cache_dir) / key / url.rstrip("/").split("/")[-1]
+
+
+def _next_chunk_size(chunk_size: int, seconds: float) -> int:
+    if seconds < CHUNK_SECONDS[0]:
+        return min(chunk_size * 2, MAX_CHUNK_SIZE)
+    if seconds > CHUNK_SECONDS[1]:
+        return max(chunk_size // 2, MIN_CHUNK_SIZE)
+    return chunk_size
+
+
+def _fetch(url: str, part: Path, session: requests.Session, progress: tqdm) -> None:
+    """
+    appends the rest of url to part, resuming with a Range request when part has data
+    """
+    offset: int = part.stat().st_size if part.exists() else 0
+    headers: dict[str, str] = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+        if r.status_code == 416:
+            # the partial file already holds everything, the checksum decides
+            return
+        r.raise_for_status()
+        if offset and r.status_code != 206:
+            # the server ignored the range, start over
+            offset = 0
+        progress.reset(total=offset + int(r.headers.get("content-length", 0)) or None)
+        progress.update(offset)
+
+        chunk_size: int = START_CHUNK_SIZE
+        with open(part, "ab" if offset else "wb") as file:
+            while True:
+                started: float = time.monotonic()
+                chunk: bytes = r.raw.read(chunk_size, decode_content=True)
+                if not chunk:
+                    break
+                file.write(chunk)
+                progress.update(len(chunk))
+                chunk_size = _next_chunk_size(chunk_size, time.monotonic() - started)
+
+
+def download_file(
+    url: str, sha256: str | None = None, cache_dir: str | Path = DOWNLOAD_CACHE,
+    session: requests.Session | None = None, position: int = 0
+    ) -> Path:
+    """
+    downloads url into the artifact cache and returns the cached file. a cached file
+    that matches sha256 skips the network, interrupted transfers resume from the
+    .part file and a checksum mismatch discards the download
+    """
+    target: Path = cache_path(url, cache_dir)
+    if target.exists() and (sha256 is None or sha256_file(target) == sha256):
+        print(f"Using cached {target.name}")
+        return target
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    part: Path = target.with_name(target.name + ".part")
+    session = session or requests.Session()
+
+    with tqdm(unit="B", unit_scale=True, desc=target.name, position=position, leave=True) as progress:
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                _fetch(url, part, session, progress)
+                break
+            except _RETRYABLE:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    if sha256 is not None and (actual := sha256_file(part)) != sha256:
+        part.unlink(missing_ok=True)
+        raise ValueError(f"checksum mismatch for {url}: expected {sha256}, got {actual}")
+
+    os.replace(part, target)
+    return target
+
+
+def download_all(
+    assets: list[dict[str, Any]], cache_dir: str | Path = DOWNLOAD_CACHE, workers: int | None = None
+    ) -> list[Path]:
+    """
+    fetches every asset ({"url", "sha256"}) concurrently, in input order
+    """
+    if not assets:
+        return []
+    with ThreadPoolExecutor(workers or len(assets)) as pool:
+        futures = [
+            pool.submit(download_file, asset["url"], asset.get("sha256"), cache_dir, None, position)
+            for position, asset in enumerate(assets)
+        ]
+        return [future.result() for future in futures]
+
+
+def version_name(version: str) -> str:
+    """
+    folder name of a release tag
+    """
+    name: str = re.sub(r"[^\w.+-]", "_", version).lstrip(".")
+    if not name:
+        raise ValueError(f"Invalid version: {version!r}")
+    return name
+
+
+def _installed_at(marker: Path) -> int:
     try:
-        safe_extract_archive(str(tmp_path), str(install_dir))
-    except Exception as e:
-        print(f"Extraction failed: {e}")
-
-        # revert if extraction fails
-        if backup_old and old_install:
-            print("Restoring previous version...")
-            shutil.rmtree(install_dir)
-            shutil.move(str(old_install), str(install_dir))
-        raise
-
-    tmp_path.unlink(missing_ok=True)
+        return int(marker.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0
+
+
+def _mark_installed(version_dir: Path) -> None:
+    # the install time orders versions for rollback and pruning, file times are too coarse
+    (version_dir / INSTALLED_MARKER).write_text(str(time.time_ns()), encoding="utf-8")
+
+
+def installed_versions(tool_dir: str | Path) -> list[str]:
+    """
+    completely extracted versions of a tool, least recently installed first
+    """
+    tool_dir = Path(tool_dir)
+    if not tool_dir.is_dir():
+        return []
+    markers: list[Path] = [
+        entry / INSTALLED_MARKER for entry in tool_dir.iterdir()
+        if not entry.is_symlink() and (entry / INSTALLED_MARKER).is_file()
+    ]
+    markers.sort(key=lambda marker: (_installed_at(marker), marker.parent.name))
+    return [marker.parent.name for marker in markers]
+
+
+def activate_version(tool_dir: str | Path, version: str) -> None:
+    """
+    points the tool at an installed version in one step. the current symlink is
+    swapped with os.replace, windows gets a pointer file replaced the same way since
+    symlinks need extra privileges there
+    """
+    tool_dir = Path(tool_dir)
+    if not (tool_dir / version / INSTALLED_MARKER).is_file():
+        raise FileNotFoundError(f"{tool_dir.name} {version} is not installed")
+
+    if os.name == "nt":
+        temp: Path = tool_dir / f".{CURRENT_POINTER}.{os.getpid()}"
+        temp.write_text(version, encoding="utf-8")
+        os.replace(temp, tool_dir / CURRENT_POINTER)
+        return
 
-    if backup_old and old_install:
-        shutil.rmtree(old_install)
+    temp = tool_dir / f".{CURRENT_LINK}.{os.getpid()}"
+    temp.unlink(missing_ok=True)
+    os.symlink(version, temp, target_is_directory=True)
+    os.replace(temp, tool_dir / CURRENT_LINK)
+    (tool_dir / CURRENT_POINTER).unlink(missing_ok=True)
 
-    print("Install complete.")
 
+def _adopt_flat_install(tool_dir: Path) -> None:
+    """
+    moves an install from before versioning into its own version folder so it
+    stays available for a rollback
+    """
+    if current_version(tool_dir) is not None or installed_versions(tool_dir):
+        return
+    entries: list[Path] = [
+        entry for entry in tool_dir.iterdir()
+        if not entry.name.startswith(".") and not entry.match(LAUNCHER_GLOB)
+    ]
+    if not entries:
+        return
 
-def load_releases_url(owner_name: str, project_name: str, version: str | None = None) -> str:
+    legacy: Path = tool_dir / LEGACY_VERSION
+    legacy.mkdir()
+    moved: list[Path] = []
+    try:
+        for entry in entries:
+            os.replace(entry, legacy / entry.name)
+            moved.append(entry)
+    except OSError as e:
+        # files in use on windows, leave the old install where it was
+        print(f"Could not move the previous {tool_dir.name} install: {e}")
+        for entry in moved:
+            os.replace(legacy / entry.name, entry)
+        legacy.rmdir()
+        return
+    _mark_installed(legacy)
+    activate_version(tool_dir, LEGACY_VERSION)
+
+
+def prune_versions(tool_dir: str | Path, keep: int = KEEP_VERSIONS) -> list[str]:
+    """
+    keeps the active version and the most recently installed others up to keep in
+    total, removes the rest and leftovers of interrupted installs. returns the removed versions
+    """
+    tool_dir = Path(tool_dir)
+    current: str | None = current_version(tool_dir)
+    versions: list[str] = installed_versions(tool_dir)
+    others: list[str] = [version for version in versions if version != current]
+    slots: int = keep - 1 if current in versions else keep
+    kept: set[str] = {current, *(others[-slots:] if slots > 0 else [])}
+
+    removed: list[str] = []
+    for version in versions:
+        if version in kept:
+            continue
+        try:
+            # renamed first so a half deleted folder never looks installed
+            os.replace(tool_dir / version, tool_dir / f".pruned-{version}")
+        except OSError:
+            # still running on windows, tried again on the next prune
+            continue
+        removed.append(version)
+
+    for leftover in [*tool_dir.glob(".pruned-*"), *tool_dir.glob(".staging-*")]:
+        shutil.rmtree(leftover, ignore_errors=True)
+    return removed
+
+
+def rollback_version(tool_dir: str | Path, version: str | None = None) -> str:
+    """
+    switches back to the given version or the one installed before the active one
+    """
+    tool_dir = Path(tool_dir)
+    if version is None:
+        versions: list[str] = installed_versions(tool_dir)
+        current: str | None = current_version(tool_dir)
+        earlier: list[str] = versions[:versions.index(current)] if current in versions else []
+        if not earlier:
+            raise ValueError(f"No earlier {tool_dir.name} version to roll back to")
+        version = earlier[-1]
+    activate_version(tool_dir, version)
+    return version
+
+
+def install_version(
+    archive_path: str | Path, tool_dir: str | Path, version: str | None = None, keep: int = KEEP_VERSIONS
+    ) -> Path:
+    """
+    extracts the archive into its own version folder next to the active one and
+    switches to it once it is complete, the running version keeps working meanwhile
+    and a failed extraction leaves it active. older versions beyond keep are pruned
+    """
+    tool_dir = Path(tool_dir)
+    tool_dir.mkdir(parents=True, exist_ok=True)
+    _adopt_flat_install(tool_dir)
+
+    version = version_name(version or sha256_file(archive_path)[:12])
+    target: Path = tool_dir / version
+    if not (target / INSTALLED_MARKER).is_file():
+        staging: Path = tool_dir / f".staging-{version}-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            safe_extract_archive(str(archive_path), str(staging))
+            if target.exists():
+                # an incomplete folder without the marker
+                shutil.rmtree(target)
+            os.replace(staging, target)
+        except Exception as e:
+            print(f"Extraction failed: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    _mark_installed(target)
+    activate_version(tool_dir, version)
+    prune_versions(tool_dir, keep)
+    print(f"Installed {tool_dir.name} {version}.")
+    return target
+
+
+def download_and_install(
+    url: str, tool_dir: str | Path, version: str | None = None, sha256: str | None = None, keep: int = KEEP_VERSIONS
+    ) -> Path:
+    return install_version(download_file(url, sha256), tool_dir, version, keep)
+
+
+def load_release_assets(
+    owner_name: str, project_name: str, version: str | None = None, api: str = GITHUB_API
+    ) -> list[dict[str, Any]]:
+    """
+    archive assets of a release as {"name", "url", "size", "version", "sha256"}, sha256
+    comes from the asset digest github publishes and is None for releases that predate it
+    """
     global ARCHIVE_TYPES
     
-    url: str = f"https://api.github.com/repos/{owner_name}/{project_name}/releases/latest"
+    url: str = f"{api}/repos/{owner_name}/{project_name}/releases/latest"
     if version is not None:
-        url = f"https://api.github.com/repos/{owner_name}/{project_name}/releases//tags/{version}"
+        url = f"{api}/repos/{owner_name}/{project_name}/releases/tags/{version}"
         
-    response: requests.Response = requests.get(url)
+    response: requests.Response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
     data: dict[str, Any] = response.json()
     
-    return [
-        asset["browser_download_url"]
-        for asset in data.get("assets", [])
-        if asset["name"].endswith(ARCHIVE_TYPES)
-    ]
+    assets: list[dict[str, Any]] = []
+    for asset in data.get("assets", []):
+        if not asset["name"].endswith(ARCHIVE_TYPES):
+            continue
+        digest: str | None = asset.get("digest")
+        assets.append({
+            "name": asset["name"], "url": asset["browser_download_url"], "size": asset.get("size"),
+            "version": data.get("tag_name"),
+            "sha256": digest.split(":", 1)[1] if digest and digest.startswith("sha256:") else None,
+        })
+    return assets
+
+
+def load_releases_url(owner_name: str, project_name: str, version: str | None = None) -> list[str]:
+    return [asset["url"] for asset in load_release_assets(owner_name, project_name, version)]
     
     
 def load_config() -> dict[str, Any]:
@@ -140,16 +534,42 @@ def run_cmd(args: list[str]) -> None:
     subprocess.run(args, check=True)
 
 
-def install_model(script_path: str, model_url: str, name: str, is_unix: bool = False) -> None:
-    if not is_unix:
-        run_cmd([script_path, "pull", model_url])
-        run_cmd([script_path, "cp", model_url, name])
-        run_cmd([script_path, "rm", model_url])
-        return
-        
-    run_cmd(["bash", script_path, "pull", model_url])
-    run_cmd(["bash", script_path, "cp", model_url, name])
-    run_cmd(["bash", script_path, "rm", model_url])
+def _pull_reporter() -> Callable[[PullEvent], None]:
+    bars: dict[str, tqdm] = dict()
+
+    def report(event: PullEvent) -> None:
+        if event.kind == "progress":
+            bar: tqdm | None = bars.get(event.model)
+            if bar is None:
+                bar = bars[event.model] = tqdm(
+                    total=event.total, desc=event.model, unit="B", unit_scale=True, position=len(bars)
+                )
+            bar.total, bar.n = event.total, event.completed
+            bar.refresh()
+        elif event.kind in ("done", "failed", "cancelled"):
+            if event.model in bars:
+                bars.pop(event.model).close()
+            tqdm.write(f"{event.model}: {event.status or event.kind}")
+
+    return report
+
+
+def install_models(script_path: str, models: list[tuple[str, str | None]], is_unix: bool = False) -> None:
+    """
+    pulls every (pull name, name) at once and then copies the ones given a name to it
+    """
+    command: list[str] = ["bash", script_path] if is_unix else [script_path]
+    results: dict[str, PullEvent] = asyncio.run(
+        pull_models([model_url for model_url, _ in models], command, report=_pull_reporter())
+    )
+    failed: list[str] = [model_url for model_url, event in results.items() if event.kind != "done"]
+    if failed:
+        raise RuntimeError(f"Failed to pull: {', '.join(failed)}")
+
+    for model_url, name in models:
+        if name:
+            run_cmd([*command, "cp", model_url, name])
+            run_cmd([*command, "rm", model_url])
     
     
 def get_first_match(key: str, data: list[str])-> str:
@@ -169,15 +589,29 @@ def main() -> None:
     )
 
     parser.add_argument(
-        "--os", required=True,
+        "--os",
         choices=["linux", "darwin", "windows"]
     )
 
     parser.add_argument("--pandoc-version", help="version of pandoc to install")
     parser.add_argument("--ollama-version", help="version of ollama to install")
+    parser.add_argument(
+        "--keep", type=int, default=KEEP_VERSIONS, help="installed versions to keep per tool"
+    )
+    parser.add_argument(
+        "--rollback", choices=["pandoc", "ollama"], help="switch a tool back to its previous version and exit"
+    )
+    parser.add_argument("--to", help="version to roll back to instead of the previous one")
 
     args: argparse.Namespace = parser.parse_args()
     
+    if args.rollback:
+        version: str = rollback_version(ROOT / "data" / "bin" / args.rollback, args.to)
+        print(f"{args.rollback} now points at {version}.")
+        return
+    if args.os is None:
+        parser.error("the following arguments are required: --os")
+    
     operating_system: str = args.os
     configs: dict[str, Any] = load_config()
     pandoc_owner: str = configs["Url-Vars"]["pandoc-owner"]
@@ -187,15 +621,17 @@ def main() -> None:
     
     arch: str = platform.machine().lower()
     
-    pandoc_urls: list[str] = load_releases_url(
+    pandoc_assets: list[dict[str, Any]] = load_release_assets(
         pandoc_owner, "pandoc", 
         args.pandoc_version if args.pandoc_version else None
     )
     
-    ollama_urls: list[str] = load_releases_url(
+    ollama_assets: list[dict[str, Any]] = load_release_assets(
         ollama_owner, "ollama", 
         args.ollama_version if args.ollama_version else None
     )
+    pandoc_urls: list[str] = [asset["url"] for asset in pandoc_assets]
+    ollama_urls: list[str] = [asset["url"] for asset in ollama_assets]
     
     binary_path: Path = ROOT / "data" / "bin"
     ollama_portable: Path = binary_path / "ollama" / "ollama_portable"
@@ -211,13 +647,9 @@ def main() -> None:
         make_script(ollama_portable.with_suffix(ext), scripts["ollama-unix"])
     
 
+    # a running server keeps its version folder, the new one is used from its next start
     if not os.path.exists(binary_path / "ollama"):
         os.makedirs(binary_path / "ollama")
-    else:
-        try:
-            run_cmd([str(ollama_portable), "stop"])
-        except Exception as e:
-            pass
     if not os.path.exists(binary_path / "pandoc"):
         os.makedirs(binary_path / "pandoc")
 
@@ -239,8 +671,13 @@ def main() -> None:
         ollama_url = get_first_match(key, ollama_urls)
         #if arch in "arm64":
         
-    download_and_install(pandoc_url, binary_path / "pandoc")  
-    download_and_install(ollama_url, binary_path / "ollama") 
+    releases: dict[str, dict[str, Any]] = {asset["url"]: asset for asset in pandoc_assets + ollama_assets}
+    pandoc_archive, ollama_archive = download_all([
+        {"url": pandoc_url, "sha256": releases[pandoc_url]["sha256"]},
+        {"url": ollama_url, "sha256": releases[ollama_url]["sha256"]},
+    ])
+    install_version(pandoc_archive, binary_path / "pandoc", releases[pandoc_url]["version"], args.keep)
+    install_version(ollama_archive, binary_path / "ollama", releases[ollama_url]["version"], args.keep)
     
     ext: str
         
@@ -263,12 +700,11 @@ def main() -> None:
         if is_unix_like:            
             run_cmd(["chmod", "+x", script_path])
             
-        print("\nDownloading Embedding Model:")
-        install_model(script_path, model_sec["embedding-pull"], model_sec["embedding-name"], is_unix_like)
-        print("Download Finished\n")
-        
-        print("Downloading LLM:")
-        install_model(script_path, model_sec["llm-pull"], model_sec["llm-name"], is_unix_like)
+        print("\nDownloading Embedding Model and LLM:")
+        install_models(script_path, [
+            (model_sec["embedding-pull"], model_sec["embedding-name"]),
+            (model_sec["llm-pull"], model_sec["llm-name"]),
+        ], is_unix_like)
         print("Download Finished\n")
         
 
@@ -0,0 +1,289 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Callable
+import asyncio, argparse, json, uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core.node_parser import LangchainNodeParser
+from pydantic import BaseModel
+
+from src.chat_model import ChatModel, ModelParams, ChatEvent, SessionManager
+from src.chat_model.server import probe
+from src.extractors import *
+from src.paths import UPLOAD_FOLDER
+from src import variables
+
+
+
+MAX_CONCURRENT_RUNS: int = 2
+MAX_QUEUED_RUNS: int = 32
+QUEUE_TIMEOUT: float = 30.0
+MAX_UPLOAD_BYTES: int = 256 * 1024 * 1024
+RETRY_AFTER_SECONDS: int = 2
+
+DEFAULT_PARAMS: ModelParams = ModelParams(
+    temperature=0.7, context_window=32000, rag_top_k=4,
+    history_tokens=5120, long_term_memory=False, long_term_tokens=5120,
+    top_k_memory=4
+)
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: str | None = None
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    response: str
+
+
+class UploadResponse(BaseModel):
+    filename: str
+    ingested: bool
+
+
+class AdmissionGate:
+    """
+    caps how many agent runs hit the ollama backend at once. callers past the cap
+    wait in a bounded queue, a full queue or a wait longer than queue_timeout is
+    answered with 429 so a load balancer can retry elsewhere
+    """
+
+    __slots__ = ("limit", "max_queued", "queue_timeout", "semaphore", "running", "waiting", "rejected")
+
+    def __init__(self, limit: int, max_queued: int, queue_timeout: float = QUEUE_TIMEOUT) -> None:
+        self.limit: int = limit
+        self.max_queued: int = max_queued
+        self.queue_timeout: float = queue_timeout
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(limit)
+        self.running: int = 0
+        self.waiting: int = 0
+        self.rejected: int = 0
+
+    def reject(self, reason: str) -> HTTPException:
+        self.rejected += 1
+        return HTTPException(429, reason, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    async def acquire(self) -> None:
+        if self.running + self.waiting >= self.limit + self.max_queued:
+            raise self.reject("server busy, request queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self.reject("server busy, timed out waiting in the queue")
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self) -> None:
+        self.running -= 1
+        self.semaphore.release()
+
+    def release_once(self) -> Callable[[], None]:
+        """
+        release of one acquired slot that can be called from several places, only
+        the first call gives the slot back
+        """
+        released: bool = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+        return release
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        return {"running": self.running, "queued": self.waiting, "rejected": self.rejected, "limit": self.limit}
+
+
+class SlotResponse(StreamingResponse):
+    """
+    streaming response that gives its admission slot back once it is done, also
+    when the client is gone before the body is iterated
+    """
+
+    def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.release: Callable[[], None] = release
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+def to_sse(event: ChatEvent) -> str:
+    return f"event: {event.kind}\ndata: {event.model_dump_json()}\n\n"
+
+
+def build_router() -> ExtractionRouter:
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=100)
+    )
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("text", plain_extractor, splitter)
+    router.add_extractor("pdf", pdf_page_extractor, splitter)
+    router.add_extractor("excel", excel_row_extractor, splitter)
+    router.add_extractor("word", word_extractor, splitter)
+    router.add_extractor("presentation", presentation_extractor, splitter)
+    router.add_extractor("epub", epub_extractor, splitter)
+
+    router.add_file_mapping("text", ["txt", "text", "md", "csv", "json"])
+    router.add_file_mapping("pdf", ["pdf"])
+    router.add_file_mapping("excel", ["xlsx", "xlsm", "xls", "ods"])
+    router.add_file_mapping("word", ["docx", "odt", "rtf"])
+    router.add_file_mapping("presentation", ["pptx"])
+    router.add_file_mapping("epub", ["epub"])
+    return router
+
+
+def create_app(
+    sessions: SessionManager, router: ExtractionRouter | None = None, max_concurrent: int = MAX_CONCURRENT_RUNS,
+    max_queued: int = MAX_QUEUED_RUNS, queue_timeout: float = QUEUE_TIMEOUT,
+    upload_folder: str | Path = UPLOAD_FOLDER, max_upload_bytes: int = MAX_UPLOAD_BYTES
+    ) -> FastAPI:
+    model: ChatModel = sessions.model
+    router = router or model.extraction_router
+    gate: AdmissionGate = AdmissionGate(max_concurrent, max_queued, queue_timeout)
+    # ingestion embeds through the same backend, run one upload at a time
+    ingest_lock: asyncio.Lock = asyncio.Lock()
+    upload_folder = Path(upload_folder)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        sessions.start()
+        yield
+        sessions.shutdown()
+
+    app: FastAPI = FastAPI(title="LLMChat", lifespan=lifespan)
+    app.state.sessions = sessions
+    app.state.gate = gate
+
+    @app.get("/health")
+    async def health() -> JSONResponse:
+        url: str = model.ollama_server.url if model.ollama_server is not None else variables.SERVER_URL
+        ollama_ready: bool = await asyncio.to_thread(probe, url)
+        healthy: bool = ollama_ready and model.error_flag is None
+        return JSONResponse(
+            {
+                "status": "ok" if healthy else "unavailable", "ollama": ollama_ready,
+                "model": model.llm_name, "sessions": sessions.session_count, **gate.metrics,
+                "scheduler": model.scheduler.metrics
+            },
+            status_code=200 if healthy else 503
+        )
+
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat(request: ChatRequest) -> ChatResponse:
+        session_id: str = request.session_id or uuid.uuid4().hex
+        async with gate.slot():
+            response: str = await sessions.aprompt(session_id, request.message)
+        return ChatResponse(session_id=session_id, response=response)
+
+    @app.post("/chat/stream")
+    async def chat_stream(request: ChatRequest) -> StreamingResponse:
+        session_id: str = request.session_id or uuid.uuid4().hex
+        # admission happens before the response starts so a rejection is still a 429
+        await gate.acquire()
+        release: Callable[[], None] = gate.release_once()
+
+        async def events() -> AsyncIterator[str]:
+            stream: AsyncIterator[ChatEvent] = sessions.astream(session_id, request.message)
+            try:
+                async for event in stream:
+                    yield to_sse(event)
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            finally:
+                # a disconnected client closes this generator, which cancels the run
+                await stream.aclose()
+                release()
+
+        try:
+            return SlotResponse(
+                events(), release, media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Session-Id": session_id}
+            )
+        except BaseException:
+            release()
+            raise
+
+    @app.delete("/sessions/{session_id}")
+    async def close_session(session_id: str) -> dict[str, bool]:
+        return {"closed": sessions.close_session(session_id)}
+
+    @app.post("/documents", response_model=UploadResponse)
+    async def upload_document(request: Request, filename: str = Query(...)) -> UploadResponse:
+        """
+        the raw request body is the file, its name comes from the filename query parameter
+        """
+        name: str = Path(filename).name
+        if not name or isinstance(router.resolve(name), ExtractionErrors):
+            raise HTTPException(415, f"unsupported file type: {filename}")
+
+        upload_folder.mkdir(parents=True, exist_ok=True)
+        target: Path = upload_folder / f"{uuid.uuid4().hex[:8]}-{name}"
+        size: int = 0
+        try:
+            with open(target, "wb") as file:
+                async for chunk in request.stream():
+                    size += len(chunk)
+                    if size > max_upload_bytes:
+                        raise HTTPException(413, "upload is too large")
+                    file.write(chunk)
+
+            async with ingest_lock:
+                errors: list[str] | None = await asyncio.to_thread(model.add_documents, [str(target)])
+        except BaseException:
+            target.unlink(missing_ok=True)
+            raise
+
+        if errors:
+            target.unlink(missing_ok=True)
+            raise HTTPException(422, f"could not extract {name}")
+        return UploadResponse(filename=name, ingested=True)
+
+    return app
+
+
+def build_app(model_name: str = variables.BASE_MODEL, **kwargs: Any) -> FastAPI:
+    model: ChatModel = ChatModel(build_router())
+    model.load_parameters(DEFAULT_PARAMS)
+    model.load_model(model_name)
+    return create_app(SessionManager(model), **kwargs)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="serve ChatModel over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=variables.BASE_MODEL)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_RUNS)
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_RUNS)
+    args: argparse.Namespace = parser.parse_args()
+
+    app: FastAPI = build_app(args.model, max_concurrent=args.max_concurrent, max_queued=args.max_queued)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
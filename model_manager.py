@@ -1,13 +1,17 @@
 from typing import Any
-import platform, requests, os, argparse, subprocess
+import platform, requests, os, argparse, subprocess, asyncio
 import shutil, tarfile, zipfile, tempfile
 
 import tomli
 from tqdm import tqdm
 from pathlib import Path
 
+from src.workers import MAX_CONCURRENT_PULLS, ModelPullManager, PullEvent
+
 
 ROOT: Path = Path(__file__).parent
+MANIFEST: Path = ROOT / "binaries_setup.toml"
+DEFAULT_TAG: str = "latest"
 
 
 def run_cmd(args: list[str], get_output: bool = False) -> str | None:
@@ -40,6 +44,161 @@ def install_model(script_path: str, model_url: str, name: str | None = None, is_
     
     
     
+class ModelPlan:
+    """
+    what a batch run does for one pull name: pull it when missing, alias it to
+    every name that is missing and drop the pull name when it is not wanted itself
+    """
+
+    __slots__ = ("pull", "aliases", "needs_pull", "remove_pull")
+
+    def __init__(self, pull: str, aliases: list[str], needs_pull: bool, remove_pull: bool) -> None:
+        self.pull: str = pull
+        self.aliases: list[str] = aliases
+        self.needs_pull: bool = needs_pull
+        self.remove_pull: bool = remove_pull
+
+
+def normalize(name: str) -> str:
+    """
+    name as `ollama list` shows it, with the default tag
+    """
+    name = name.strip().lower()
+    if ":" not in name.rsplit("/", 1)[-1]:
+        name = f"{name}:{DEFAULT_TAG}"
+    return name
+
+
+def read_manifest(path: str | Path = MANIFEST) -> list[tuple[str, str | None]]:
+    """
+    (pull name, name) of every "<key>-pull" in the [Models] section, the name comes
+    from "<key>-name" and is None when it is missing or empty
+    """
+    with open(path, "rb") as file:
+        models: dict[str, Any] = tomli.load(file).get("Models", {})
+    return [
+        (pull, models.get(f"{key[:-len('-pull')]}-name") or None)
+        for key, pull in models.items() if key.endswith("-pull") and pull
+    ]
+
+
+def parse_list(output: str) -> set[str]:
+    """
+    model names in the output of `ollama list`
+    """
+    names: set[str] = set()
+    for line in output.splitlines():
+        fields: list[str] = line.split()
+        if not fields or fields[0] == "NAME":
+            continue
+        names.add(normalize(fields[0]))
+    return names
+
+
+def plan_models(models: list[tuple[str, str | None]], installed: set[str]) -> list[ModelPlan]:
+    """
+    steps that bring the installed models in line with the manifest, empty when
+    nothing is missing
+    """
+    wanted: dict[str, list[str]] = dict()
+    for pull, name in models:
+        wanted.setdefault(pull, []).append(name or pull)
+
+    plans: list[ModelPlan] = []
+    for pull, names in wanted.items():
+        keep_pull: bool = normalize(pull) in {normalize(name) for name in names}
+        aliases: list[str] = list(dict.fromkeys(
+            name for name in names if normalize(name) != normalize(pull) and normalize(name) not in installed
+        ))
+        needs_pull: bool = normalize(pull) not in installed and (keep_pull or len(aliases) > 0)
+        if needs_pull or aliases:
+            plans.append(ModelPlan(pull, aliases, needs_pull, not keep_pull))
+    return plans
+
+
+async def _run_async(args: list[str]) -> None:
+    process: asyncio.subprocess.Process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    _, error = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(error.decode(errors="replace").strip() or f"{args} failed")
+
+
+async def apply_plans(
+    command: list[str], plans: list[ModelPlan], max_concurrent: int = MAX_CONCURRENT_PULLS,
+    report: Any = None
+    ) -> dict[str, str]:
+    """
+    pulls in parallel and aliases every model as soon as its own pull finished.
+    `ollama cp` only writes a manifest that shares the pulled blobs, so the alias
+    and removing the pull name cost no copy. returns the errors by pull name
+    """
+    manager: ModelPullManager = ModelPullManager(command, max_concurrent)
+    errors: dict[str, str] = dict()
+
+    async def provision(plan: ModelPlan) -> None:
+        try:
+            if plan.needs_pull:
+                event: PullEvent = await manager.pull(plan.pull)
+                if event.kind != "done":
+                    errors[plan.pull] = event.status or event.kind
+                    return
+            for name in plan.aliases:
+                await _run_async([*command, "cp", plan.pull, name])
+            if plan.remove_pull:
+                await _run_async([*command, "rm", plan.pull])
+        except (RuntimeError, OSError) as e:
+            errors[plan.pull] = str(e)
+
+    jobs: asyncio.Future = asyncio.gather(*(provision(plan) for plan in plans))
+    if report is not None:
+        await asyncio.sleep(0)
+        async for event in manager.events():
+            report(event)
+    await jobs
+    return errors
+
+
+def run_batch(
+    command: list[str], manifest: str | Path = MANIFEST, max_concurrent: int = MAX_CONCURRENT_PULLS,
+    dry_run: bool = False
+    ) -> int:
+    # a failed listing prints an error instead of models, planning from it would pull everything
+    try:
+        listing: subprocess.CompletedProcess = subprocess.run(
+            [*command, "list"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+    except OSError as e:
+        print(f"Could not run ollama: {e}")
+        return 1
+    if listing.returncode != 0:
+        print(f"Could not list the installed models, is the ollama server running?\n{listing.stdout.strip()}")
+        return 1
+    installed: set[str] = parse_list(listing.stdout)
+    plans: list[ModelPlan] = plan_models(read_manifest(manifest), installed)
+    if not plans:
+        print("All models are installed.")
+        return 0
+
+    for plan in plans:
+        steps: list[str] = (["pull"] if plan.needs_pull else []) + [f"alias {name}" for name in plan.aliases]
+        if plan.remove_pull:
+            steps.append("remove pull name")
+        print(f"{plan.pull}: {', '.join(steps)}")
+    if dry_run:
+        return 0
+
+    def report(event: PullEvent) -> None:
+        if event.kind in ("done", "failed", "cancelled"):
+            print(f"{event.model}: {event.status or event.kind}")
+
+    errors: dict[str, str] = asyncio.run(apply_plans(command, plans, max_concurrent, report))
+    for pull, error in errors.items():
+        print(f"{pull} failed: {error}")
+    return 1 if errors else 0
+
+
 def main() -> None:
     
     ext: str
@@ -56,6 +215,21 @@ def main() -> None:
     if not os.path.exists(ollama_portable):
         print("binaries have not been set up")
     
+    batch_parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="pull or delete ollama models, interactively or from a manifest"
+    )
+    batch_parser.add_argument(
+        "--batch", nargs="?", const=str(MANIFEST), metavar="MANIFEST",
+        help="install the models of a TOML [Models] section that are missing"
+    )
+    batch_parser.add_argument("--jobs", type=int, default=MAX_CONCURRENT_PULLS, help="pulls running at once")
+    batch_parser.add_argument("--dry-run", action="store_true", help="only print what a batch run would do")
+    batch_args: argparse.Namespace = batch_parser.parse_args()
+    
+    if batch_args.batch:
+        command: list[str] = ["bash", ollama_portable] if current_platform in ("darwin", "linux") else [ollama_portable]
+        raise SystemExit(run_batch(command, batch_args.batch, batch_args.jobs, batch_args.dry_run))
+    
       
     print(run_cmd([ollama_portable, "list"], get_output=True))
     arg_in: str = input("> ")
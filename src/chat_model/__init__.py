@@ -1 +1,2 @@
-from .chat_model import ChatModel, ModelParams
\ No newline at end of file
+from .chat_model import ChatModel, ModelParams, ChatEvent
+from .sessions import SessionManager
@@ -0,0 +1,208 @@
+from __future__ import annotations
+from typing import Any
+import os, math
+from pathlib import Path
+
+import numpy as np
+
+
+
+IVF_FILE: str = "ivf.npz"
+ASSIGN_BLOCK_ROWS: int = 65536
+KMEANS_ITERATIONS: int = 10
+TRAIN_POINTS_PER_LIST: int = 64
+MIN_TRAIN_ROWS: int = 4096
+MIN_NPROBE: int = 8
+# share of the lists a query probes when nprobe is not given, a fixed handful of
+# lists loses recall as nlist grows with the store
+PROBE_FRACTION: float = 0.25
+RETRAIN_GROWTH: float = 4.0
+
+
+def default_list_count(rows: int) -> int:
+    return max(8, int(math.sqrt(rows)))
+
+
+def default_probe_count(lists: int) -> int:
+    return min(lists, max(MIN_NPROBE, math.ceil(lists * PROBE_FRACTION)))
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0
+    ) -> np.ndarray:
+    """
+    k-means on unit vectors with the dot product as similarity, centroids stay unit length
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    centroids: np.ndarray = vectors[rng.choice(vectors.shape[0], clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels: np.ndarray = assign(vectors, centroids)
+        sums: np.ndarray = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        norms: np.ndarray = np.linalg.norm(sums, axis=1)
+
+        # empty clusters restart from random points
+        empty: np.ndarray = norms == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()), replace=False)]
+            norms[empty] = 1
+        centroids = (sums / norms[:, None]).astype(np.float32)
+
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels: np.ndarray = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], ASSIGN_BLOCK_ROWS):
+        block: np.ndarray = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    inverted file index over the rows of a normalized vector matrix. rows are bucketed
+    under their nearest k-means centroid and a query only scores the rows of the nprobe
+    closest buckets, by default a PROBE_FRACTION of them. the index only stores row numbers, vectors are read from the
+    matrix it was built on. new rows are assigned incrementally and the centroids are
+    retrained once the matrix grew by RETRAIN_GROWTH since the last training
+    """
+
+    __slots__ = ("path", "nlist", "nprobe", "centroids", "lists", "covered", "trained_rows", "saved_rows")
+
+    def __init__(self, folder: str | Path, nlist: int | None = None, nprobe: int | None = None) -> None:
+        self.path: Path = Path(folder) / IVF_FILE
+        self.nlist: int | None = nlist
+        self.nprobe: int | None = nprobe
+        self.centroids: np.ndarray | None = None
+        self.lists: list[np.ndarray] = []
+        self.covered: int = 0
+        self.trained_rows: int = 0
+        self.saved_rows: int = 0
+        self.load()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def probes(self) -> int:
+        if self.nprobe is not None:
+            return min(self.nprobe, len(self.lists))
+        return default_probe_count(len(self.lists))
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        sizes: list[int] = [len(rows) for rows in self.lists]
+        return {
+            "trained": self.trained, "lists": len(self.lists), "nprobe": self.probes,
+            "covered_rows": self.covered, "largest_list": max(sizes, default=0),
+        }
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        with np.load(self.path) as data:
+            self.centroids = data["centroids"]
+            offsets: np.ndarray = data["offsets"]
+            rows: np.ndarray = data["rows"]
+            self.covered = int(data["covered"])
+            self.trained_rows = int(data["trained_rows"])
+        self.lists = [rows[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        self.saved_rows = self.covered
+
+    def save(self) -> None:
+        if not self.trained:
+            return
+        offsets: np.ndarray = np.zeros(len(self.lists) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in self.lists], out=offsets[1:])
+        rows: np.ndarray = np.concatenate(self.lists) if self.lists else np.zeros(0, dtype=np.int64)
+
+        temp: Path = self.path.with_name(f".{self.path.stem}-{os.getpid()}.npz")
+        np.savez(
+            temp, centroids=self.centroids, offsets=offsets, rows=rows.astype(np.int64),
+            covered=self.covered, trained_rows=self.trained_rows
+        )
+        os.replace(temp, self.path)
+        self.saved_rows = self.covered
+
+    def reset(self) -> None:
+        self.centroids = None
+        self.lists = []
+        self.covered = self.trained_rows = self.saved_rows = 0
+        self.path.unlink(missing_ok=True)
+
+    def train(self, matrix: np.ndarray, seed: int = 0) -> None:
+        rows: int = matrix.shape[0]
+        clusters: int = min(self.nlist or default_list_count(rows), rows)
+        rng: np.random.Generator = np.random.default_rng(seed)
+        sample_size: int = min(rows, clusters * TRAIN_POINTS_PER_LIST)
+        sample: np.ndarray = np.asarray(matrix[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+
+        self.centroids = spherical_kmeans(sample, clusters, seed=seed)
+        self.lists = [np.zeros(0, dtype=np.int64) for _ in range(clusters)]
+        self.covered = 0
+        self.trained_rows = rows
+        self.extend(matrix)
+        self.save()
+
+    def extend(self, matrix: np.ndarray) -> None:
+        """
+        assigns the rows of matrix past the ones already covered
+        """
+        if not self.trained or matrix.shape[0] <= self.covered:
+            return
+        start: int = self.covered
+        labels: np.ndarray = assign(matrix[start:], self.centroids)
+        order: np.ndarray = np.argsort(labels, kind="stable")
+        bounds: np.ndarray = np.searchsorted(labels[order], np.arange(len(self.lists) + 1))
+        for label in np.flatnonzero(np.diff(bounds)):
+            new_rows: np.ndarray = order[bounds[label]:bounds[label + 1]] + start
+            self.lists[label] = np.concatenate([self.lists[label], new_rows])
+        self.covered = matrix.shape[0]
+
+    def update(self, matrix: np.ndarray) -> None:
+        """
+        called after rows were appended to matrix, trains once enough rows exist
+        """
+        rows: int = matrix.shape[0]
+        if not self.trained:
+            if rows >= max(MIN_TRAIN_ROWS, (self.nlist or 0) * TRAIN_POINTS_PER_LIST // 4):
+                self.train(matrix)
+            return
+        if rows >= self.trained_rows * RETRAIN_GROWTH:
+            self.train(matrix)
+            return
+
+        self.extend(matrix)
+        # reassigning unsaved rows on startup is cheap, so only persist every so often
+        if self.covered - self.saved_rows >= max(MIN_TRAIN_ROWS, self.covered // 10):
+            self.save()
+
+    def candidates(self, matrix: np.ndarray, excluded: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        sorted live rows of the probed lists and the rows not assigned yet
+        """
+        probes: int = self.probes
+        closest: np.ndarray = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        candidates: np.ndarray = np.concatenate([self.lists[label] for label in closest])
+        # rows past the covered ones were appended after the last assignment
+        candidates = np.sort(np.concatenate([candidates, np.arange(self.covered, matrix.shape[0])]))
+        # the lists may already hold rows appended after this matrix snapshot was taken
+        candidates = candidates[candidates < matrix.shape[0]]
+        return candidates[~excluded[candidates]]
+
+    def search(
+        self, matrix: np.ndarray, excluded: np.ndarray, query: np.ndarray, top_k: int
+        ) -> tuple[list[int], list[float]]:
+        candidates: np.ndarray = self.candidates(matrix, excluded, query)
+        if candidates.shape[0] == 0:
+            return [], []
+
+        scores: np.ndarray = np.asarray(matrix[candidates]) @ query
+        if scores.shape[0] > top_k:
+            keep: np.ndarray = np.argpartition(-scores, top_k)[:top_k]
+            candidates, scores = candidates[keep], scores[keep]
+        order: np.ndarray = np.argsort(-scores)
+        return candidates[order].tolist(), scores[order].tolist()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+from typing import Any, Sequence, TYPE_CHECKING
+import os, re, math
+from collections import Counter
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
+
+
+
+BM25_FILE: str = "bm25.npz"
+BM25_K1: float = 1.2
+BM25_B: float = 0.75
+MAX_TOKEN_LENGTH: int = 64
+MAX_TERM_FREQUENCY: int = np.iinfo(np.uint16).max
+# pending postings are merged into the compact arrays and saved once they reach this
+# many documents or a tenth of the index, whichever is larger
+SAVE_EVERY_DOCUMENTS: int = 4096
+
+# words, numbers and identifiers glued by - . / : _ such as "err-0x1f" or "pn/4471.b"
+_TOKEN: re.Pattern = re.compile(r"\w+(?:[-./:]\w+)*")
+_PART: re.Pattern = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    lowercased tokens, identifiers are kept whole and also split into their parts
+    so "ERR-42" matches both "err-42" and "42"
+    """
+    tokens: list[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            parts: list[str] = _PART.findall(token)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def _pack(strings: list[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack(packed: np.ndarray) -> list[str]:
+    return packed.tobytes().decode("utf-8").split("\n") if packed.shape[0] else []
+
+
+class BM25Index:
+    """
+    inverted index over node text scored with Okapi BM25. postings live in compact
+    CSR arrays (term offsets, uint32 document numbers, uint16 term frequencies) that
+    load with one np.load, documents added since the last save sit in small per term
+    lists until they are merged. deleted documents are skipped when scoring and
+    dropped from the arrays on the next save
+    """
+
+    __slots__ = (
+        "path", "k1", "b", "lock", "terms", "node_ids", "documents", "lengths", "deleted",
+        "offsets", "postings", "frequencies", "pending", "unsaved"
+    )
+
+    def __init__(self, folder: str | Path, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.path: Path = Path(folder) / BM25_FILE
+        self.k1: float = k1
+        self.b: float = b
+        self.lock: Lock = Lock()
+        self._reset()
+        self.load()
+
+    def _reset(self) -> None:
+        self.terms: dict[str, int] = dict()
+        self.node_ids: list[str] = []
+        self.documents: dict[str, int] = dict()
+        self.lengths: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.deleted: np.ndarray = np.zeros(0, dtype=bool)
+        self.offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.postings: np.ndarray = np.zeros(0, dtype=np.uint32)
+        self.frequencies: np.ndarray = np.zeros(0, dtype=np.uint16)
+        self.pending: dict[int, tuple[list[int], list[int]]] = dict()
+        self.unsaved: int = 0
+
+    @property
+    def document_count(self) -> int:
+        return len(self.node_ids) - int(self.deleted.sum())
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "documents": self.document_count, "terms": len(self.terms),
+                "postings": int(self.postings.shape[0]) + sum(len(docs) for docs, _ in self.pending.values()),
+                "unsaved_documents": self.unsaved,
+            }
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        with np.load(self.path) as data:
+            terms: list[str] = _unpack(data["terms"])
+            self.node_ids = _unpack(data["node_ids"])
+            self.lengths = data["lengths"]
+            self.offsets = data["offsets"]
+            self.postings = data["postings"]
+            self.frequencies = data["frequencies"]
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.documents = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.deleted = np.zeros(len(self.node_ids), dtype=bool)
+
+    def save(self) -> None:
+        with self.lock:
+            if self.unsaved == 0:
+                return
+            self._compact()
+            temp: Path = self.path.with_name(f".{self.path.stem}-{os.getpid()}.npz")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(
+                temp, terms=_pack(list(self.terms)), node_ids=_pack(self.node_ids), lengths=self.lengths,
+                offsets=self.offsets, postings=self.postings, frequencies=self.frequencies
+            )
+            os.replace(temp, self.path)
+            self.unsaved = 0
+
+    def clear(self) -> None:
+        with self.lock:
+            self._reset()
+            self.path.unlink(missing_ok=True)
+
+    def _compact(self) -> None:
+        """
+        merges the pending postings into the arrays and renumbers the documents
+        without the deleted ones, terms left without postings are dropped
+        """
+        counts: np.ndarray = np.diff(self.offsets)
+        term_count: int = len(self.terms)
+        counts = np.concatenate([counts, np.zeros(term_count - counts.shape[0], dtype=np.int64)])
+        pending_counts: np.ndarray = np.zeros(term_count, dtype=np.int64)
+        for term, (docs, _) in self.pending.items():
+            pending_counts[term] = len(docs)
+
+        term_ids: np.ndarray = np.concatenate([
+            np.repeat(np.arange(counts.shape[0]), counts),
+            np.repeat(np.arange(term_count), pending_counts),
+        ])
+        pending_terms: list[int] = sorted(self.pending)
+        postings: np.ndarray = np.concatenate(
+            [self.postings.astype(np.int64)] + [np.asarray(self.pending[term][0], dtype=np.int64) for term in pending_terms]
+        )
+        frequencies: np.ndarray = np.concatenate(
+            [self.frequencies] + [
+                np.minimum(self.pending[term][1], MAX_TERM_FREQUENCY).astype(np.uint16) for term in pending_terms
+            ]
+        )
+
+        live: np.ndarray = ~self.deleted
+        numbers: np.ndarray = np.cumsum(live) - 1
+        keep: np.ndarray = live[postings]
+        term_ids, postings, frequencies = term_ids[keep], numbers[postings[keep]], frequencies[keep]
+        # pending documents come after every stored one, a stable sort by term keeps
+        # the postings of each term ordered by document number
+        order: np.ndarray = np.argsort(term_ids, kind="stable")
+        term_ids, postings, frequencies = term_ids[order], postings[order], frequencies[order]
+
+        used: np.ndarray = np.bincount(term_ids, minlength=term_count)
+        remaining: np.ndarray = np.flatnonzero(used)
+        terms: list[str] = list(self.terms)
+        self.terms = {terms[term]: i for i, term in enumerate(remaining.tolist())}
+        self.offsets = np.zeros(remaining.shape[0] + 1, dtype=np.int64)
+        np.cumsum(used[remaining], out=self.offsets[1:])
+        self.postings = postings.astype(np.uint32)
+        self.frequencies = frequencies
+
+        self.node_ids = [node_id for node_id, alive in zip(self.node_ids, live.tolist()) if alive]
+        self.documents = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.lengths = self.lengths[live]
+        self.deleted = np.zeros(len(self.node_ids), dtype=bool)
+        self.pending = dict()
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """
+        indexes node text, a node id that is already indexed is replaced
+        """
+        if len(nodes) == 0:
+            return
+        with self.lock:
+            self._delete([node.node_id for node in nodes])
+            start: int = len(self.node_ids)
+            lengths: list[int] = []
+            for document, node in enumerate(nodes, start):
+                tokens: list[str] = tokenize(node.get_content(metadata_mode=MetadataMode.NONE))
+                lengths.append(len(tokens))
+                for token, count in Counter(tokens).items():
+                    term: int | None = self.terms.get(token)
+                    if term is None:
+                        term = self.terms[token] = len(self.terms)
+                    entry: tuple[list[int], list[int]] | None = self.pending.get(term)
+                    if entry is None:
+                        entry = self.pending[term] = ([], [])
+                    entry[0].append(document)
+                    entry[1].append(count)
+                self.node_ids.append(node.node_id)
+                self.documents[node.node_id] = document
+
+            self.lengths = np.concatenate([self.lengths, np.asarray(lengths, dtype=np.int32)])
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(nodes), dtype=bool)])
+            self.unsaved += len(nodes)
+            flush: bool = self.unsaved >= max(SAVE_EVERY_DOCUMENTS, len(self.node_ids) // 10)
+        if flush:
+            self.save()
+
+    def _delete(self, node_ids: Sequence[str]) -> int:
+        removed: int = 0
+        for node_id in node_ids:
+            document: int | None = self.documents.pop(node_id, None)
+            if document is not None:
+                self.deleted[document] = True
+                removed += 1
+        self.unsaved += removed
+        return removed
+
+    def delete(self, node_ids: Sequence[str]) -> int:
+        with self.lock:
+            return self._delete(node_ids)
+
+    def reconcile(self, node_ids: Sequence[str]) -> list[str]:
+        """
+        drops the documents whose node is not in node_ids and returns the node ids
+        that are not indexed, after a crash the index only holds what was last saved
+        """
+        with self.lock:
+            live: set[str] = set(node_ids)
+            self._delete([node_id for node_id in self.documents if node_id not in live])
+            return [node_id for node_id in node_ids if node_id not in self.documents]
+
+    def _term_postings(self, term: int) -> tuple[np.ndarray, np.ndarray]:
+        docs: np.ndarray = np.zeros(0, dtype=np.int64)
+        frequencies: np.ndarray = np.zeros(0, dtype=np.uint16)
+        if term + 1 < self.offsets.shape[0]:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs, frequencies = self.postings[start:end].astype(np.int64), self.frequencies[start:end]
+        if term in self.pending:
+            pending_docs, pending_frequencies = self.pending[term]
+            docs = np.concatenate([docs, np.asarray(pending_docs, dtype=np.int64)])
+            frequencies = np.concatenate([
+                frequencies, np.minimum(pending_frequencies, MAX_TERM_FREQUENCY).astype(np.uint16)
+            ])
+        return docs, frequencies
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """
+        node ids and scores of the top_k documents sharing a term with the query
+        """
+        query_terms: list[str] = list(dict.fromkeys(tokenize(query)))
+        with self.lock:
+            total: int = self.document_count
+            if total == 0:
+                return []
+            live: np.ndarray = ~self.deleted
+            average_length: float = max(float(self.lengths[live].mean()), 1.0)
+
+            matched: list[np.ndarray] = []
+            contributions: list[np.ndarray] = []
+            for token in query_terms:
+                term: int | None = self.terms.get(token)
+                if term is None:
+                    continue
+                docs, frequencies = self._term_postings(term)
+                docs_live: np.ndarray = live[docs]
+                docs, frequencies = docs[docs_live], frequencies[docs_live].astype(np.float64)
+                if docs.shape[0] == 0:
+                    continue
+                idf: float = math.log(1 + (total - docs.shape[0] + 0.5) / (docs.shape[0] + 0.5))
+                norm: np.ndarray = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+                matched.append(docs)
+                contributions.append(idf * frequencies * (self.k1 + 1) / (frequencies + norm))
+
+            if len(matched) == 0:
+                return []
+            documents, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            scores: np.ndarray = np.bincount(inverse, weights=np.concatenate(contributions))
+            if scores.shape[0] > top_k:
+                keep: np.ndarray = np.argpartition(-scores, top_k)[:top_k]
+                documents, scores = documents[keep], scores[keep]
+            order: np.ndarray = np.argsort(-scores, kind="stable")
+            return [(self.node_ids[document], float(scores[i])) for i, document in zip(order, documents[order])]
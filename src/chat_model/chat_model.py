@@ -1,27 +1,44 @@
 from __future__ import annotations
-import os, subprocess, asyncio
-from typing import Any, TYPE_CHECKING
-from concurrent.futures import ThreadPoolExecutor
+import os, asyncio
+from typing import Any, AsyncIterator, Iterator, Literal, TYPE_CHECKING
+from queue import Queue
+from threading import Thread
 
 from llama_index.llms.ollama import Ollama
 from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.core.agent.workflow import FunctionAgent
+from llama_index.core.agent.workflow import FunctionAgent, AgentStream, AgentOutput, ToolCall, ToolCallResult
+from llama_index.core.llms import ChatMessage
 from llama_index.core.memory import Memory, VectorMemory, SimpleComposableMemory
 from llama_index.core.workflow.handler import WorkflowHandler
 from llama_index.core import VectorStoreIndex
 from llama_index.core.tools import QueryEngineTool, FunctionTool
+from llama_index.core.query_engine import RetrieverQueryEngine
 from pydantic import BaseModel
 
-from ..paths import PORTABLE_OLLAMA, OLLAMA_HOME_FOLDER, MODELS_FOLDER
+from ..paths import OLLAMA_HOME_FOLDER, MODELS_FOLDER, VECTOR_STORE_FOLDER, EMBEDDING_CACHE_FILE
 from .. import variables
-from ..extractors.extraction_router import ExtractionRouter
+from ..extractors.extraction_router import ExtractionRouter, ExecutorMode
+from .ingestion import IngestionPipeline
+from .vector_store import MmapVectorStore, stored_dimensions
+from .embedding_cache import CachedEmbedding
+from .server import READY_TIMEOUT
+from .pool import OllamaPool, LoadBalancer, PooledEmbedding, instance_urls
+from .retrieval import CachedRetriever, HybridRetriever, CANDIDATE_FACTOR
+from .bm25 import BM25Index
+from .sync import DirectorySync, SyncManifest, SyncReport
+from .response_cache import (
+    ResponseCache, cache_scope, history_digest, index_version, RESPONSE_TTL, RESPONSE_ENTRY_LIMIT, SIMILARITY_THRESHOLD
+)
+from .scheduler import RequestScheduler, ScheduledEmbedding, ScheduledOllama
 
 if TYPE_CHECKING:
     from llama_index.core.indices.base import BaseIndex
     from llama_index.core.embeddings import BaseEmbedding
     from llama_index.core import Document
+    from pathlib import Path
     from llama_index.core.query_engine import BaseQueryEngine
-    from subprocess import Popen, STARTUPINFO
+    from llama_index.core.retrievers import BaseRetriever
+    from llama_index.core.vector_stores.types import BasePydanticVectorStore
     
 
 
@@ -34,22 +51,84 @@ class ModelParams(BaseModel):
     long_term_memory: bool
     long_term_tokens: int
     top_k_memory: int
+    vector_index: Literal["flat", "ivf"] = "flat"
+    ivf_lists: int | None = None
+    ivf_probes: int | None = None
+    vector_quantization: Literal["none", "int8", "binary"] = "none"
+    hybrid_search: bool = False
     
     
 
+class ChatEvent(BaseModel):
+    kind: Literal["token", "thinking", "tool_call", "tool_result", "done"]
+    text: str = ""
+    tool_name: str | None = None
+    tool_kwargs: dict[str, Any] | None = None
+
+
+def to_chat_event(event: Any) -> list[ChatEvent]:
+    if isinstance(event, AgentStream):
+        events: list[ChatEvent] = []
+        if event.thinking_delta:
+            events.append(ChatEvent(kind="thinking", text=event.thinking_delta))
+        if event.delta:
+            events.append(ChatEvent(kind="token", text=event.delta))
+        return events
+    if isinstance(event, ToolCallResult):
+        return [ChatEvent(
+            kind="tool_result", text=str(event.tool_output), 
+            tool_name=event.tool_name, tool_kwargs=event.tool_kwargs
+        )]
+    if isinstance(event, ToolCall):
+        return [ChatEvent(kind="tool_call", tool_name=event.tool_name, tool_kwargs=event.tool_kwargs)]
+    return []
+
+
+_STREAM_END: object = object()
+    
+
 RAG_PROMPT: str =  """
 Answers questions by retrieving relevant passages from the indexed document set currently in memory.
 Use it only when the question involves content that may exist in those documents.
 Skip this tool for open-ended, speculative, or conversational prompts.
 """
 
-EMBEDDING_DIMENSIONS: int = 384
+# embedded once at load time to learn the width of the embedding model's vectors
+DIMENSION_PROBE: str = "dimension probe"
+# nodes read from the store per query when the keyword index catches up on load
+KEYWORD_LOAD_BATCH: int = 512
+
 
+def load_keywords(folder: str | Path, store: MmapVectorStore) -> BM25Index:
+    """
+    keyword index of folder matched to the nodes of store, nodes added or deleted
+    since the index was last saved are indexed or dropped
+    """
+    keywords: BM25Index = BM25Index(folder)
+    missing: list[str] = keywords.reconcile(store.live_node_ids())
+    for start in range(0, len(missing), KEYWORD_LOAD_BATCH):
+        keywords.add(store.get_nodes(missing[start:start + KEYWORD_LOAD_BATCH]))
+    keywords.save()
+    return keywords
 
-def create_rag_tool(model: Ollama, embeddimg_model: BaseEmbedding, description: str, top_k: int = 4) -> tuple[QueryEngineTool, BaseIndex]:
-    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embeddimg_model)
+
+def create_rag_tool(
+    model: Ollama, embeddimg_model: BaseEmbedding, description: str, top_k: int = 4,
+    vector_store: BasePydanticVectorStore | None = None, keywords: BM25Index | None = None
+    ) -> tuple[QueryEngineTool, BaseIndex]:
+    index: VectorStoreIndex
+    if vector_store is None:
+        index = VectorStoreIndex([], embed_model=embeddimg_model)
+    else:
+        index = VectorStoreIndex.from_vector_store(vector_store, embed_model=embeddimg_model)
     
-    query_engine: BaseQueryEngine = index.as_query_engine(llm=model, similarity_top_k=top_k)
+    retriever: BaseRetriever = index.as_retriever(similarity_top_k=top_k)
+    if keywords is not None:
+        retriever = HybridRetriever(
+            index.as_retriever(similarity_top_k=top_k * CANDIDATE_FACTOR), keywords, index, top_k
+        )
+    retriever = CachedRetriever(retriever, index, embeddimg_model)
+    query_engine: BaseQueryEngine = RetrieverQueryEngine.from_args(retriever, llm=model)
     query_tool: QueryEngineTool = QueryEngineTool.from_defaults(
         query_engine=query_engine, name="RAGSearch", description=description
     )
@@ -76,7 +155,7 @@ def make_cutsom_memory(
         
     return SimpleComposableMemory(
         primary_memory=memory,
-        secondary_memory_sources=vector_memory if vector_memory is None else [vector_memory]
+        secondary_memory_sources=[] if vector_memory is None else [vector_memory]
     )
 
 
@@ -89,21 +168,33 @@ def prepend_path(path_to_add: str) -> dict:
 
 class ChatModel:
     
-    __slots__ = ("extraction_router", "agent", "system_prompt", "llm_name", "llm_params", "ollama_server", "error_flag", "memory", "model", "embedding", "vector_store", "tools")
+    __slots__ = ("extraction_router", "agent", "system_prompt", "llm_name", "llm_params", "ollama_server", "error_flag", "memory", "model", "embedding", "vector_store", "tools", "scheduler", "balancer", "response_cache", "keywords", "manifest", "store_folder")
     
-    def __init__(self, extractor: ExtractionRouter, tools: list[FunctionTool] = []) -> None:
+    def __init__(
+        self, extractor: ExtractionRouter, tools: list[FunctionTool] = [],
+        store_folder: str | Path = VECTOR_STORE_FOLDER, embedding_cache_file: str | Path = EMBEDDING_CACHE_FILE
+        ) -> None:
         self.extraction_router: ExtractionRouter = extractor
-        self.embedding: BaseEmbedding = OllamaEmbedding(variables.EMBEDDING_MODEL_NAME, base_url=variables.SERVER_URL)
+        # vector store, keyword index and sync manifest all live in store_folder
+        self.store_folder: str | Path = store_folder
+        self.scheduler: RequestScheduler = RequestScheduler()
+        self.balancer: LoadBalancer | None = None
+        self.response_cache: ResponseCache | None = None
+        self.embedding: BaseEmbedding = CachedEmbedding(
+            ScheduledEmbedding(self._make_embedding(), self.scheduler), embedding_cache_file
+        )
         self.error_flag: Exception | None = None
         self.agent: FunctionAgent  | None = None
         self.model: Ollama | None = None
         self.system_prompt: str | None = None
         self.llm_name: str | None = None
         self.llm_params: ModelParams | None = None
-        self.ollama_server: Popen | None = None
+        self.ollama_server: OllamaPool | None = None
         self.tools: list[FunctionTool] = []
         self.memory: Memory | None = None
         self.vector_store: BaseIndex | None = None
+        self.keywords: BM25Index | None = None
+        self.manifest: SyncManifest | None = None
         
         os.environ.setdefault('OLLAMA_HOST', str(variables.SERVER_URL))
         os.environ.setdefault('OLLAMA_MODELS', str(MODELS_FOLDER))
@@ -112,22 +203,80 @@ class ChatModel:
         if tools:
             for tool in tools: self.add_tool(tool)
         
+    def _make_embedding(self) -> BaseEmbedding:
+        urls: list[str] = instance_urls()
+        if len(urls) == 1:
+            return OllamaEmbedding(variables.EMBEDDING_MODEL_NAME, base_url=urls[0])
+        
+        pooled: PooledEmbedding = PooledEmbedding(
+            lambda url: OllamaEmbedding(variables.EMBEDDING_MODEL_NAME, base_url=url), urls
+        )
+        self.balancer = pooled.balancer
+        return pooled
+        
     def add_documents(self, paths: list[str]) -> list[str] | None:
         if len(paths) == 0:
             return
         
-        with ThreadPoolExecutor(4) as pool:
-            results: list[list[Document] | str] = pool.map(
-                self.extraction_router.extract, paths
-            )
+        if self.vector_store is None:
+            raise RuntimeError("load_model must be called before adding documents")
+        
+        pipeline: IngestionPipeline = IngestionPipeline(
+            self.extraction_router, self.embedding, self.vector_store, keywords=self.keywords
+        )
+        errors: list[str] = pipeline.run(paths)
         
-        errors: list[str] = [paths[i] for i, el in enumerate(results) if isinstance(el, str)]
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
         
         if len(errors) == 0:
             return
         
         return errors
     
+    def sync_directory(self, path: str | Path) -> SyncReport:
+        """
+        indexes new and edited files under path and drops the nodes of files that
+        were deleted since the last sync of that folder
+        """
+        if self.vector_store is None or self.manifest is None:
+            raise RuntimeError("load_model must be called before syncing a directory")
+        
+        report: SyncReport = DirectorySync(
+            self.extraction_router, self.embedding, self.vector_store, self.manifest, self.keywords
+        ).sync(path)
+        
+        if self.response_cache is not None and (report.added or report.updated or report.removed):
+            self.response_cache.invalidate()
+        return report
+    
+    def enable_response_cache(
+        self, ttl: float = RESPONSE_TTL, max_entries: int = RESPONSE_ENTRY_LIMIT,
+        threshold: float = SIMILARITY_THRESHOLD, semantic: bool = True
+        ) -> ResponseCache:
+        """
+        answers are reused for repeated prompts, semantic matching embeds every prompt
+        with the loaded embedding model. adding documents clears the cache
+        """
+        self.response_cache = ResponseCache(self.embedding if semantic else None, ttl, max_entries, threshold)
+        return self.response_cache
+    
+    def disable_response_cache(self) -> None:
+        self.response_cache = None
+        
+    async def _response_scope(self, memory: SimpleComposableMemory | None) -> str:
+        # the same prompt means something else later in a conversation, the history is part of the scope
+        history: list[ChatMessage] = await memory.aget_all() if memory is not None else []
+        return cache_scope(
+            system_prompt=self.system_prompt, model=self.llm_name,
+            params=self.llm_params.model_dump() if self.llm_params is not None else None,
+            temperature=getattr(self.model, "temperature", None), thinking=getattr(self.model, "thinking", None),
+            index_version=index_version(self.vector_store), history=history_digest(history)
+        )
+    
+    def set_executor_mode(self, mode: ExecutorMode | str) -> None:
+        self.extraction_router.set_executor_mode(mode)
+    
     def set_temperature(self, value: float) -> None:
         if self.agent is None: 
             return
@@ -154,42 +303,57 @@ class ChatModel:
     def add_tool(self, function: FunctionTool) -> None:
         self.tools.append(function)
             
-    def run_ollama_server(self, timeout: float = 20) -> None:
+    def run_ollama_server(self, timeout: float = READY_TIMEOUT) -> None:
+        if self.ollama_server is None:
+            self.ollama_server = OllamaPool(ready_timeout=timeout)
         
         try:
-            startup_info: STARTUPINFO = subprocess.STARTUPINFO()
-            startup_info.dwFlags = subprocess.STARTF_USESHOWWINDOW
-            startup_info.wShowWindow = subprocess.SW_HIDE
-            
-            self.ollama_server = subprocess.Popen(
-                [str(PORTABLE_OLLAMA), "serve"], shell=True,
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                startupinfo=startup_info
-            )
-            self.ollama_server.wait(timeout)
-            
-        except subprocess.TimeoutExpired as e:
-            self.error_flag = e
-            self.ollama_server.terminate()
-            self.ollama_server.wait()
-            
+            if not self.ollama_server.start():
+                urls: str = ", ".join(self.ollama_server.urls)
+                self.error_flag = TimeoutError(f"ollama servers at {urls} did not all become ready")
         except Exception as e:
             self.error_flag = e
+            
+        if self.balancer is not None:
+            self.balancer.check_health()
+            self.balancer.start()
+    
+    def close(self) -> None:
+        """
+        stops the embedding batcher threads and closes the embedding cache, the model
+        can not embed afterwards
+        """
+        close: Any = getattr(self.embedding, "close", None)
+        if callable(close):
+            close()
+    
+    def stop_ollama_server(self) -> None:
+        if self.balancer is not None:
+            self.balancer.stop()
+        if self.ollama_server is not None:
+            self.ollama_server.stop()
         
     def load_model(self, name: str) -> None:
         self.llm_name = name
         self.run_ollama_server()
         
-        self.model = Ollama(
-            model=self.llm_name, temperature=self.llm_params.temperature,
+        self.model = ScheduledOllama(
+            self.scheduler, model=self.llm_name, temperature=self.llm_params.temperature,
             context_window=self.llm_params.context_window, base_url=variables.SERVER_URL
         )
         
+        store: MmapVectorStore = MmapVectorStore(
+            self.store_folder, self.embedding_dimensions(), index_type=self.llm_params.vector_index,
+            nlist=self.llm_params.ivf_lists, nprobe=self.llm_params.ivf_probes,
+            quantization=self.llm_params.vector_quantization
+        )
+        if self.llm_params.hybrid_search:
+            self.keywords = load_keywords(self.store_folder, store)
         query_tool, self.vector_store = create_rag_tool(
-            self.model, self.embedding, RAG_PROMPT, 
-            self.llm_params.rag_top_k
+            self.model, self.embedding, RAG_PROMPT, self.llm_params.rag_top_k, store, self.keywords
         )
         
+        self.manifest = SyncManifest(self.store_folder)
         self.add_tool(query_tool)
         self._initialize_memory()
         self.agent = FunctionAgent(
@@ -197,15 +361,122 @@ class ChatModel:
             tools=self.tools, system_prompt=self.system_prompt
         )
     
+    def embedding_dimensions(self) -> int:
+        """
+        width of the embedding model's vectors. when the model cannot be reached the
+        width an existing store recorded is used
+        """
+        try:
+            return len(self.embedding.get_text_embedding(DIMENSION_PROBE))
+        except Exception:
+            stored: int | None = stored_dimensions(self.store_folder)
+            if stored is None:
+                raise
+            return stored
+    
     def _initialize_memory(self) -> None:
-        self.memory = make_cutsom_memory(
+        self.memory = self.new_memory()
+        
+    def new_memory(self) -> SimpleComposableMemory:
+        return make_cutsom_memory(
             memory_tokens=self.llm_params.history_tokens, use_vector_store=self.llm_params.long_term_memory,
             embedding_model=self.embedding, vector_tokens=self.llm_params.long_term_tokens, 
             top_limit=self.llm_params.top_k_memory
         )
         
-    async def aprompt(self, prompt_text: str) -> WorkflowHandler:
-        return await self.agent.run(prompt_text, memory=self.memory)
+    async def aprompt(self, prompt_text: str, memory: SimpleComposableMemory | None = None) -> AgentOutput:
+        memory = memory or self.memory
+        if self.response_cache is None:
+            return await self.agent.run(prompt_text, memory=memory)
+        
+        scope: str = await self._response_scope(memory)
+        generation: int = self.response_cache.generation
+        cached: str | None = await self.response_cache.aget(scope, prompt_text)
+        if cached is not None:
+            await self._remember(memory, prompt_text, cached)
+            return AgentOutput(
+                response=ChatMessage(role="assistant", content=cached), current_agent_name=self.agent.name
+            )
+        
+        result: AgentOutput = await self.agent.run(prompt_text, memory=memory)
+        await self.response_cache.aput(scope, prompt_text, str(result), generation)
+        return result
+    
+    @staticmethod
+    async def _remember(memory: SimpleComposableMemory, prompt_text: str, response: str) -> None:
+        # a cached answer skips the agent, keep the conversation history complete anyway
+        await memory.aput_messages([
+            ChatMessage(role="user", content=prompt_text), ChatMessage(role="assistant", content=response)
+        ])
     
     def prompt(self, prompt_text: str) -> str:
-        return str(asyncio.run(self.aprompt(prompt_text)))
\ No newline at end of file
+        return str(asyncio.run(self.aprompt(prompt_text)))
+    
+    async def astream(self, prompt_text: str, memory: SimpleComposableMemory | None = None) -> AsyncIterator[ChatEvent]:
+        """
+        yields token, thinking and tool events as the agent produces them and a final
+        done event with the full response. closing the iterator cancels the run
+        """
+        memory = memory or self.memory
+        scope: str | None = None
+        generation: int = 0
+        if self.response_cache is not None:
+            scope = await self._response_scope(memory)
+            generation = self.response_cache.generation
+            cached: str | None = await self.response_cache.aget(scope, prompt_text)
+            if cached is not None:
+                await self._remember(memory, prompt_text, cached)
+                yield ChatEvent(kind="token", text=cached)
+                yield ChatEvent(kind="done", text=cached)
+                return
+        
+        handler: WorkflowHandler = self.agent.run(prompt_text, memory=memory)
+        finished: bool = False
+        
+        try:
+            async for event in handler.stream_events():
+                for chat_event in to_chat_event(event):
+                    yield chat_event
+                    
+            result: Any = await handler
+            finished = True
+            if self.response_cache is not None:
+                await self.response_cache.aput(scope, prompt_text, str(result), generation)
+            yield ChatEvent(kind="done", text=str(result))
+        finally:
+            if not finished and not handler.done():
+                await handler.cancel_run()
+    
+    def stream(self, prompt_text: str) -> Iterator[ChatEvent]:
+        """
+        synchronous astream, the run happens on a private event loop thread and is
+        cancelled when the generator is closed early
+        """
+        events: Queue = Queue()
+        loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        
+        async def pump() -> None:
+            try:
+                async for event in self.astream(prompt_text):
+                    events.put(event)
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(_STREAM_END)
+        
+        task: asyncio.Task = loop.create_task(pump())
+        thread: Thread = Thread(target=loop.run_until_complete, args=(task,), daemon=True)
+        thread.start()
+        
+        try:
+            while (item := events.get()) is not _STREAM_END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not task.done():
+                loop.call_soon_threadsafe(task.cancel)
+            thread.join()
+            loop.close()
\ No newline at end of file
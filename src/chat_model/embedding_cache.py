@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+import sqlite3, asyncio, hashlib, itertools
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+if TYPE_CHECKING:
+    from llama_index.core.base.embeddings.base import Embedding
+
+
+
+CACHE_ENTRY_LIMIT: int = 500_000
+SQL_VARIABLE_LIMIT: int = 500
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (model, hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings(used);
+"""
+
+
+def text_hash(kind: str, text: str) -> bytes:
+    return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).digest()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    wraps another embedding model with a persistent sqlite cache of float32
+    vectors keyed by (model name, text hash). repeated texts inside a batch are
+    only sent once and the least recently used vectors are dropped past max_entries.
+    the async methods run the sqlite work on a worker thread
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _db: sqlite3.Connection = PrivateAttr()
+    _lock: Lock = PrivateAttr(default_factory=Lock)
+    _max_entries: int = PrivateAttr()
+    _clock: itertools.count = PrivateAttr()
+    # row count kept up to date by _store instead of counting the table every time
+    _count: int = PrivateAttr(default=0)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+    _deduplicated: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, path: str | Path, max_entries: int = CACHE_ENTRY_LIMIT, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=inner.model_name, embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager, **kwargs
+        )
+        self._inner = inner
+        self._max_entries = max_entries
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._clock = itertools.count(self._db.execute("SELECT COALESCE(MAX(used), 0) + 1 FROM embeddings").fetchone()[0])
+        self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        lookups: int = self._hits + self._misses
+        return {
+            "hits": self._hits, "misses": self._misses, "deduplicated": self._deduplicated,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """
+        closes the cache and the wrapped model when it can be closed
+        """
+        close: Any = getattr(self._inner, "close", None)
+        if callable(close):
+            close()
+        with self._lock:
+            self._db.close()
+
+    def reset_stats(self) -> None:
+        self._hits = self._misses = self._deduplicated = 0
+
+    def _lookup(self, keys: list[bytes]) -> dict[bytes, list[float]]:
+        found: dict[bytes, list[float]] = dict()
+        with self._lock:
+            for start in range(0, len(keys), SQL_VARIABLE_LIMIT):
+                chunk: list[bytes] = keys[start:start + SQL_VARIABLE_LIMIT]
+                rows: list[tuple[bytes, bytes]] = self._db.execute(
+                    "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN (%s)" % ",".join("?" * len(chunk)),
+                    [self.model_name, *chunk]
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if found:
+                used: int = next(self._clock)
+                self._db.executemany(
+                    "UPDATE embeddings SET used = ? WHERE model = ? AND hash = ?",
+                    [(used, self.model_name, key) for key in found]
+                )
+                self._db.commit()
+        return found
+
+    def _store(self, entries: dict[bytes, list[float]]) -> None:
+        with self._lock:
+            used: int = next(self._clock)
+            # a text embedded twice at once keeps the first vector, rowcount is the new rows only
+            self._count += self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, vector, used) VALUES (?, ?, ?, ?)",
+                [
+                    (self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes(), used)
+                    for key, vector in entries.items()
+                ]
+            ).rowcount
+            overflow: int = self._count - self._max_entries
+            if overflow > 0:
+                self._count -= self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY used LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self._db.commit()
+
+    def _split(self, kind: str, texts: list[str]) -> tuple[list[bytes], dict[bytes, list[float]], dict[bytes, str]]:
+        keys: list[bytes] = [text_hash(kind, text) for text in texts]
+        unique: dict[bytes, str] = dict(zip(keys, texts))
+        found: dict[bytes, list[float]] = self._lookup(list(unique))
+        missing: dict[bytes, str] = {key: text for key, text in unique.items() if key not in found}
+
+        # async lookups run on worker threads
+        with self._lock:
+            self._deduplicated += len(texts) - len(unique)
+            self._hits += len(found)
+            self._misses += len(missing)
+        return keys, found, missing
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, found, missing = self._split("text", texts)
+        if missing:
+            computed: list[Embedding] = self._inner.get_text_embedding_batch(list(missing.values()))
+            new: dict[bytes, list[float]] = dict(zip(missing, computed))
+            self._store(new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, found, missing = await asyncio.to_thread(self._split, "text", texts)
+        if missing:
+            computed: list[Embedding] = await self._inner.aget_text_embedding_batch(list(missing.values()))
+            new: dict[bytes, list[float]] = dict(zip(missing, computed))
+            await asyncio.to_thread(self._store, new)
+            found.update(new)
+        return [found[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = self._split("query", [query])
+        if missing:
+            found[keys[0]] = self._inner.get_query_embedding(query)
+            self._store({keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = await asyncio.to_thread(self._split, "query", [query])
+        if missing:
+            found[keys[0]] = await self._inner.aget_query_embedding(query)
+            await asyncio.to_thread(self._store, {keys[0]: found[keys[0]]})
+        return found[keys[0]]
@@ -0,0 +1,321 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+import uuid, traceback
+from queue import Queue, Full, Empty
+from threading import Thread, Event, Lock
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from llama_index.core.schema import MetadataMode, NodeRelationship
+
+from ..flags import ExtractionErrors
+from ..extractors.extraction_cache import file_digest
+from ..extractors.extraction_router import (
+    ExtractionRouter, SplitExtractor, ExecutorMode, exclude_source_metadata, node_to_document, run_extractor
+)
+
+if TYPE_CHECKING:
+    from llama_index.core import Document
+    from llama_index.core.schema import BaseNode
+    from llama_index.core.indices.base import BaseIndex
+    from llama_index.core.embeddings import BaseEmbedding
+    from .bm25 import BM25Index
+
+
+
+INGEST_WORKERS: int = 4
+EMBED_BATCH_SIZE: int = 32
+STAGE_QUEUE_SIZE: int = 64
+FLUSH_INTERVAL: float = 0.5
+
+# neighbour links point at nodes of the same file and are renamed with them
+_SIBLINGS: tuple[NodeRelationship, ...] = (NodeRelationship.PREVIOUS, NodeRelationship.NEXT)
+
+_DONE: object = object()
+_FAILED: object = object()
+
+
+def _put(queue: Queue, item: Any, stop: Event) -> bool:
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def scope_node_ids(path: str, nodes: list[BaseNode]) -> None:
+    """
+    derives every node id from the file path and its id, files never share a node
+    id even when their nodes were produced with the same ids
+    """
+    for node in nodes:
+        node.id_ = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{path}\0{node.id_}"))
+        for relationship in _SIBLINGS:
+            related: Any = node.relationships.get(relationship)
+            if related is not None and not isinstance(related, list):
+                related.node_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{path}\0{related.node_id}"))
+
+
+class FileDigests:
+    """
+    file_digest of every path computed once per run, partitions of a file that ask
+    while it is being hashed wait for that result
+    """
+
+    __slots__ = ("futures", "lock")
+
+    def __init__(self) -> None:
+        self.futures: dict[str, Future] = dict()
+        self.lock: Lock = Lock()
+
+    def get(self, path: str) -> str:
+        with self.lock:
+            future: Future | None = self.futures.get(path)
+            owner: bool = future is None
+            if owner:
+                future = self.futures[path] = Future()
+        if owner:
+            try:
+                future.set_result(file_digest(path))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+class IngestionPipeline:
+    """
+    extract -> split -> embed pipeline, every stage talks through a bounded queue
+    so a file's later pages are extracted while earlier chunks are being embedded.
+    inserted chunks are also added to the keyword index when one is given
+    """
+
+    __slots__ = ("router", "embedding", "index", "keywords", "workers", "batch_size", "queue_size", "flush_interval")
+
+    def __init__(
+        self, router: ExtractionRouter, embedding: BaseEmbedding, index: BaseIndex,
+        workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH_SIZE,
+        queue_size: int = STAGE_QUEUE_SIZE, flush_interval: float = FLUSH_INTERVAL,
+        keywords: BM25Index | None = None
+        ) -> None:
+        self.router: ExtractionRouter = router
+        self.embedding: BaseEmbedding = embedding
+        self.index: BaseIndex = index
+        self.keywords: BM25Index | None = keywords
+        self.workers: int = workers
+        self.batch_size: int = batch_size
+        self.queue_size: int = queue_size
+        self.flush_interval: float = flush_interval
+
+    def run(self, paths: list[str], inserted: dict[str, list[str]] | None = None) -> list[str]:
+        """
+        ingests every path and returns the ones that failed, in input order. when
+        given, inserted collects the ids of the nodes stored for every path
+        """
+        documents: Queue = Queue(self.queue_size)
+        nodes: Queue = Queue(self.queue_size)
+        stop: Event = Event()
+        failed: set[str] = set()
+        lock: Lock = Lock()
+
+        def fail(path: str) -> None:
+            with lock:
+                failed.add(path)
+
+        stages: list[Thread] = [
+            Thread(target=self._extract_stage, args=(paths, documents, stop, fail), daemon=True),
+            Thread(target=self._split_stage, args=(documents, nodes, stop, fail), daemon=True),
+        ]
+        for stage in stages: stage.start()
+
+        try:
+            self._embed_stage(nodes, {} if inserted is None else inserted, fail)
+        finally:
+            stop.set()
+            for stage in stages: stage.join()
+            if self.keywords is not None:
+                self.keywords.save()
+
+        return [path for path in paths if path in failed]
+
+    def _extract_stage(self, paths: list[str], documents: Queue, stop: Event, fail: Any) -> None:
+        workers: int = self.workers
+        if self.router.executor_mode != ExecutorMode.THREAD:
+            # threads only wait on the process pool, keep enough of them to fill it
+            workers = max(workers, self.router.workers)
+
+        digests: FileDigests = FileDigests()
+        try:
+            with ThreadPoolExecutor(workers) as pool:
+                futures: dict[Future, str] = {
+                    pool.submit(self._extract, path, part, documents, stop, digests): path 
+                    for path in paths for part in self._partitions(path)
+                }
+                for future in as_completed(futures):
+                    if not future.result(): fail(futures[future])
+        finally:
+            _put(documents, _DONE, stop)
+
+    def _partitions(self, path: str) -> list[tuple[int, int] | None]:
+        extractor: SplitExtractor | ExtractionErrors = self.router.resolve(path)
+        if isinstance(extractor, ExtractionErrors):
+            return [None]
+        try:
+            return extractor.partitions(path)
+        except Exception:
+            # reported when the whole file is extracted
+            return [None]
+
+    def _extract(
+        self, path: str, part: tuple[int, int] | None, documents: Queue, stop: Event, digests: FileDigests
+        ) -> bool:
+        try:
+            extractor: SplitExtractor | ExtractionErrors = self.router.resolve(path)
+            if isinstance(extractor, ExtractionErrors):
+                return False
+
+            key: str | None = None
+            if self.router.cache is not None:
+                key = self.router.cache_key(path, extractor, part, digests.get(path))
+            if key is not None and (cached := self.router.cache.get(key, path)) is not None:
+                # cached documents are already split
+                return self._forward(path, cached, documents, stop)
+
+            if self.router.uses_process(extractor):
+                result: list[Document] | ExtractionErrors = self.router.get_process_pool().submit(
+                    run_extractor, extractor, path, part
+                ).result()
+                if isinstance(result, ExtractionErrors):
+                    return False
+                if key is not None:
+                    self.router.cache.put(key, result)
+                return self._forward(path, result, documents, stop)
+        except Exception:
+            traceback.print_exc()
+            return False
+
+        ok: bool = False
+        try:
+            result = extractor.documents(path, part)
+            if isinstance(result, ExtractionErrors):
+                return False
+
+            for document in result:
+                if not _put(documents, (path, extractor, key, document), stop):
+                    return False
+            ok = True
+            return True
+        except Exception:
+            traceback.print_exc()
+            return False
+        finally:
+            if key is not None:
+                _put(documents, (path, None, key, _DONE if ok else _FAILED), stop)
+
+    def _forward(self, path: str, split: list[Document], documents: Queue, stop: Event) -> bool:
+        for document in split:
+            if not _put(documents, (path, None, None, document), stop):
+                return False
+        return True
+
+    def _split_stage(self, documents: Queue, nodes: Queue, stop: Event, fail: Any) -> None:
+        # split documents of jobs that are being cached, keyed by cache key. a job
+        # whose text outgrows the cache entry limit is not cached so streamed files
+        # are never held in memory whole
+        collected: dict[str, list[Document] | None] = dict()
+        collected_bytes: dict[str, int] = dict()
+        entry_limit: int = self.router.cache.max_entry_bytes if self.router.cache is not None else 0
+
+        try:
+            while not stop.is_set():
+                try:
+                    item: Any = documents.get(timeout=0.1)
+                except Empty:
+                    continue
+                if item is _DONE:
+                    return
+
+                path, extractor, key, document = item
+                if document is _DONE or document is _FAILED:
+                    split_documents: list[Document] | None = collected.pop(key, [])
+                    collected_bytes.pop(key, None)
+                    if document is _DONE and split_documents is not None:
+                        try:
+                            self.router.cache.put(key, split_documents)
+                        except OSError:
+                            traceback.print_exc()
+                    continue
+
+                if extractor is None:
+                    split: list[BaseNode] = [document]
+                else:
+                    try:
+                        split = extractor.split([document])
+                    except Exception:
+                        traceback.print_exc()
+                        fail(path)
+                        if key is not None: collected[key] = None
+                        continue
+
+                    if key is not None and collected.setdefault(key, []) is not None:
+                        size: int = collected_bytes.get(key, 0) + sum(len(node.get_content()) for node in split)
+                        collected_bytes[key] = size
+                        if size > entry_limit:
+                            collected[key] = None
+                        else:
+                            collected[key].extend(node_to_document(split))
+
+                # also covers cached documents, they are not split again
+                exclude_source_metadata(split)
+                scope_node_ids(path, split)
+                for node in split:
+                    if not _put(nodes, (path, node), stop):
+                        return
+        finally:
+            _put(nodes, _DONE, stop)
+
+    def _embed_stage(self, nodes: Queue, inserted: dict[str, list[str]], fail: Any) -> None:
+        batch: list[tuple[str, BaseNode]] = []
+
+        while True:
+            try:
+                item: Any = nodes.get(timeout=self.flush_interval)
+            except Empty:
+                # nothing new is arriving, don't hold back what is already split
+                self._insert(batch, inserted, fail)
+                batch = []
+                continue
+
+            if item is _DONE:
+                self._insert(batch, inserted, fail)
+                return
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._insert(batch, inserted, fail)
+                batch = []
+
+    def _insert(self, items: list[tuple[str, BaseNode]], inserted: dict[str, list[str]], fail: Any) -> None:
+        if len(items) == 0:
+            return
+
+        batch: list[BaseNode] = [node for _, node in items]
+        try:
+            embeddings: list[list[float]] = self.embedding.get_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+            )
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+
+            # keyword hits are looked up in the store, a hit that is not inserted yet is skipped
+            if self.keywords is not None:
+                self.keywords.add(batch)
+            self.index.insert_nodes(batch)
+        except Exception:
+            # only the files of this batch fail, the rest of the run goes on
+            traceback.print_exc()
+            for path in dict.fromkeys(path for path, _ in items):
+                fail(path)
+            return
+        for path, node in items:
+            inserted.setdefault(path, []).append(node.node_id)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+from typing import Any, Callable, Iterator, TYPE_CHECKING
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Thread, Lock, Event
+
+from pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+from .server import OllamaSupervisor, probe, READY_TIMEOUT
+from .. import variables
+
+if TYPE_CHECKING:
+    from llama_index.core.base.embeddings.base import Embedding
+
+
+
+HEALTH_INTERVAL: float = 5.0
+
+
+def instance_urls(
+    instances: int = variables.SERVER_INSTANCES, first_port: int = variables.SERVER_PORT,
+    host: str = variables.SERVER_HOST
+    ) -> list[str]:
+    return [f"http://{host}:{first_port + i}" for i in range(max(1, instances))]
+
+
+class OllamaPool:
+    """
+    runs one supervised `ollama serve` per port of a consecutive range. the portable
+    script picks the port from OLLAMA_PORT and every instance shares the same models folder
+    """
+
+    __slots__ = ("supervisors",)
+
+    def __init__(
+        self, instances: int = variables.SERVER_INSTANCES, first_port: int = variables.SERVER_PORT,
+        host: str = variables.SERVER_HOST, command: list[str] | None = None,
+        ready_timeout: float = READY_TIMEOUT, restart: bool = True
+        ) -> None:
+        self.supervisors: list[OllamaSupervisor] = [
+            OllamaSupervisor(
+                command, url=url, env={"OLLAMA_PORT": str(first_port + i)},
+                ready_timeout=ready_timeout, restart=restart
+            )
+            for i, url in enumerate(instance_urls(instances, first_port, host))
+        ]
+
+    @property
+    def url(self) -> str:
+        return self.supervisors[0].url
+
+    @property
+    def urls(self) -> list[str]:
+        return [supervisor.url for supervisor in self.supervisors]
+
+    @property
+    def metrics(self) -> list[dict[str, Any]]:
+        return [{"url": supervisor.url, **supervisor.metrics} for supervisor in self.supervisors]
+
+    def is_ready(self) -> bool:
+        return any(supervisor.is_ready() for supervisor in self.supervisors)
+
+    def start(self) -> bool:
+        """
+        starts every instance concurrently, True once all of them answer
+        """
+        with ThreadPoolExecutor(len(self.supervisors)) as pool:
+            return all(pool.map(lambda supervisor: supervisor.start(), self.supervisors))
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with ThreadPoolExecutor(len(self.supervisors)) as pool:
+            list(pool.map(lambda supervisor: supervisor.stop(timeout), self.supervisors))
+
+
+class LoadBalancer:
+    """
+    hands out the healthy instance with the fewest outstanding requests. an instance
+    that fails a request is taken out until a background health check sees it answer again
+    """
+
+    __slots__ = ("urls", "health_interval", "lock", "outstanding", "healthy", "served", "stopping", "monitor")
+
+    def __init__(self, urls: list[str], health_interval: float = HEALTH_INTERVAL) -> None:
+        if not urls:
+            raise ValueError("a load balancer needs at least one url")
+
+        self.urls: list[str] = list(urls)
+        self.health_interval: float = health_interval
+        self.lock: Lock = Lock()
+        self.outstanding: dict[str, int] = {url: 0 for url in self.urls}
+        self.healthy: dict[str, bool] = {url: True for url in self.urls}
+        self.served: dict[str, int] = {url: 0 for url in self.urls}
+        self.stopping: Event = Event()
+        self.monitor: Thread | None = None
+
+    @property
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            return {
+                url: {"healthy": self.healthy[url], "outstanding": self.outstanding[url], "served": self.served[url]}
+                for url in self.urls
+            }
+
+    def healthy_count(self) -> int:
+        with self.lock:
+            return sum(self.healthy.values())
+
+    def acquire(self) -> str:
+        with self.lock:
+            # with every instance marked down still try the least loaded one
+            candidates: list[str] = [url for url in self.urls if self.healthy[url]] or self.urls
+            url: str = min(candidates, key=lambda url: (self.outstanding[url], self.served[url]))
+            self.outstanding[url] += 1
+            return url
+
+    def release(self, url: str, failed: bool = False) -> None:
+        with self.lock:
+            self.outstanding[url] -= 1
+            self.served[url] += 1
+            if failed:
+                self.healthy[url] = False
+
+    @contextmanager
+    def lease(self) -> Iterator[str]:
+        url: str = self.acquire()
+        failed: bool = False
+        try:
+            yield url
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(url, failed)
+
+    def check_health(self) -> dict[str, bool]:
+        results: dict[str, bool] = {url: probe(url) for url in self.urls}
+        with self.lock:
+            self.healthy.update(results)
+        return results
+
+    def start(self) -> None:
+        if self.monitor is not None and self.monitor.is_alive():
+            return
+        self.stopping.clear()
+        self.monitor = Thread(target=self._watch, name="ollama-health", daemon=True)
+        self.monitor.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.monitor is not None:
+            self.monitor.join()
+            self.monitor = None
+
+    def _watch(self) -> None:
+        while not self.stopping.wait(self.health_interval):
+            self.check_health()
+
+
+class PooledEmbedding(BaseEmbedding):
+    """
+    spreads embedding batches over several ollama instances. a batch is split into
+    one slice per healthy instance and the slices run concurrently, a slice whose
+    instance fails is retried once on another instance
+    """
+
+    _inner: dict[str, BaseEmbedding] = PrivateAttr()
+    _balancer: LoadBalancer = PrivateAttr()
+    _executor: ThreadPoolExecutor = PrivateAttr()
+
+    def __init__(
+        self, factory: Callable[[str], BaseEmbedding], urls: list[str], balancer: LoadBalancer | None = None,
+        **kwargs: Any
+        ) -> None:
+        inner: dict[str, BaseEmbedding] = {url: factory(url) for url in urls}
+        first: BaseEmbedding = inner[urls[0]]
+        super().__init__(
+            model_name=first.model_name, embed_batch_size=first.embed_batch_size * len(urls),
+            callback_manager=first.callback_manager, **kwargs
+        )
+        self._inner = inner
+        self._balancer = balancer or LoadBalancer(urls)
+        self._executor = ThreadPoolExecutor(len(urls), thread_name_prefix="pooled-embedding")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PooledEmbedding"
+
+    @property
+    def balancer(self) -> LoadBalancer:
+        return self._balancer
+
+    def _call(self, function: Callable[[BaseEmbedding], Any], url: str | None = None) -> Any:
+        url = url or self._balancer.acquire()
+        try:
+            result: Any = function(self._inner[url])
+        except Exception:
+            self._balancer.release(url, failed=True)
+            if len(self._inner) == 1:
+                raise
+            with self._balancer.lease() as url:
+                return function(self._inner[url])
+        self._balancer.release(url)
+        return result
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        if not texts:
+            return []
+        slices: int = max(1, min(self._balancer.healthy_count(), len(texts)))
+        size: int = -(-len(texts) // slices)
+        chunks: list[list[str]] = [texts[start:start + size] for start in range(0, len(texts), size)]
+        if len(chunks) == 1:
+            return self._call(lambda inner: inner.get_text_embedding_batch(chunks[0]))
+
+        # lease every slice up front so the slices land on different instances
+        urls: list[str] = [self._balancer.acquire() for _ in chunks]
+        results: Iterator[list[Embedding]] = self._executor.map(
+            lambda chunk, url: self._call(lambda inner: inner.get_text_embedding_batch(chunk), url), chunks, urls
+        )
+        return [vector for result in results for vector in result]
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._call(lambda inner: inner.get_text_embedding(text))
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._call(lambda inner: inner.get_query_embedding(query))
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        url: str = self._balancer.acquire()
+        failed: bool = False
+        try:
+            return await self._inner[url].aget_query_embedding(query)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._balancer.release(url, failed)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+import math
+
+import numpy as np
+
+
+
+QUANTIZATIONS: tuple[str, ...] = ("none", "int8", "binary")
+CODE_FILES: dict[str, str] = {"int8": "vectors.i8", "binary": "vectors.b1"}
+# first pass candidates per requested result that are rescored in float32
+RESCORE_FACTORS: dict[str, int] = {"int8": 4, "binary": 32}
+# code rows scored per block, small enough for the float32 copy to stay in cache
+CODE_BLOCK_ROWS: int = 2048
+# int8 covers +-4 standard deviations of a unit vector component, larger ones are clipped
+INT8_RANGE_SIGMAS: float = 4.0
+
+
+def code_width(quantization: str, dimensions: int) -> int:
+    """
+    bytes per row of the code matrix
+    """
+    return dimensions if quantization == "int8" else -(-dimensions // 8)
+
+
+def int8_scale(dimensions: int) -> float:
+    return 127 / (INT8_RANGE_SIGMAS / math.sqrt(dimensions))
+
+
+def encode(quantization: str, vectors: np.ndarray) -> np.ndarray:
+    """
+    codes of normalized float32 vectors, int8 scalar codes or packed sign bits
+    """
+    if quantization == "int8":
+        scaled: np.ndarray = np.rint(vectors * int8_scale(vectors.shape[-1]))
+        return np.clip(scaled, -127, 127).astype(np.int8)
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def code_scores(quantization: str, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    first pass similarity of every code row to the float query, higher is closer.
+    binary rows are scored by the query components at their set bits, which ranks
+    like the dot product with the +-1 sign vector and beats hamming distance on the
+    binarized query
+    """
+    if quantization == "int8":
+        return codes.astype(np.float32) @ query
+    return np.unpackbits(codes, axis=-1, count=query.shape[0]) @ query
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+import time, json, hashlib
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from llama_index.core.llms import ChatMessage
+    from llama_index.core.embeddings import BaseEmbedding
+    from llama_index.core.indices.base import BaseIndex
+
+
+
+RESPONSE_TTL: float = 60 * 60.0
+RESPONSE_ENTRY_LIMIT: int = 1024
+SIMILARITY_THRESHOLD: float = 0.95
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split()).rstrip(" ?!.")
+
+
+def index_version(index: BaseIndex | None) -> int:
+    """
+    stores that count their writes (MmapVectorStore) expose a version, for the
+    in-memory store the node count stands in for it
+    """
+    version: int | None = getattr(getattr(index, "vector_store", None), "version", None)
+    if version is not None:
+        return version
+    return len(getattr(getattr(index, "index_struct", None), "nodes_dict", None) or ())
+
+
+def history_digest(messages: list[ChatMessage]) -> str:
+    """
+    hash of the conversation so far, an answer is only reused after the same turns
+    """
+    turns: list[tuple[str, str]] = [(str(message.role), str(message.content)) for message in messages]
+    return hashlib.sha256(json.dumps(turns).encode("utf-8")).hexdigest()
+
+
+def cache_scope(**parts: Any) -> str:
+    """
+    everything besides the prompt that changes the answer, hashed into one key
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+
+    __slots__ = ("scope", "prompt", "response", "vector", "created")
+
+    def __init__(self, scope: str, prompt: str, response: str, vector: np.ndarray | None) -> None:
+        self.scope: str = scope
+        self.prompt: str = prompt
+        self.response: str = response
+        self.vector: np.ndarray | None = vector
+        self.created: float = time.monotonic()
+
+
+class ResponseCache:
+    """
+    two tier answer cache. the exact tier matches the normalized prompt, the semantic
+    tier reuses an answer whose prompt embedding is within threshold cosine similarity.
+    both only match inside the same scope (system prompt, model, params, index version,
+    conversation history),
+    entries expire after ttl and the least recently used go first past max_entries
+    """
+
+    __slots__ = ("embedding", "ttl", "max_entries", "threshold", "lock", "entries", "generation", "stats")
+
+    def __init__(
+        self, embedding: BaseEmbedding | None = None, ttl: float = RESPONSE_TTL,
+        max_entries: int = RESPONSE_ENTRY_LIMIT, threshold: float = SIMILARITY_THRESHOLD
+        ) -> None:
+        self.embedding: BaseEmbedding | None = embedding
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.threshold: float = threshold
+        self.lock: Lock = Lock()
+        self.entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        # bumped by invalidate so answers computed before it are not stored after it
+        self.generation: int = 0
+        self.stats: dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        with self.lock:
+            lookups: int = sum(self.stats.values())
+            hits: int = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return {**self.stats, "entries": len(self.entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def _expire(self, now: float) -> None:
+        while self.entries:
+            entry: CacheEntry = next(iter(self.entries.values()))
+            if now - entry.created <= self.ttl:
+                break
+            self.entries.popitem(last=False)
+
+    def _exact(self, scope: str, prompt: str) -> str | None:
+        with self.lock:
+            now: float = time.monotonic()
+            entry: CacheEntry | None = self.entries.get((scope, prompt))
+            if entry is None or now - entry.created > self.ttl:
+                return None
+            self.entries.move_to_end((scope, prompt))
+            self.stats["exact_hits"] += 1
+            return entry.response
+
+    def _semantic(self, scope: str, vector: np.ndarray) -> str | None:
+        with self.lock:
+            now: float = time.monotonic()
+            candidates: list[CacheEntry] = [
+                entry for entry in self.entries.values()
+                if entry.scope == scope and entry.vector is not None and now - entry.created <= self.ttl
+            ]
+            if candidates:
+                scores: np.ndarray = np.stack([entry.vector for entry in candidates]) @ vector
+                best: int = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry: CacheEntry = candidates[best]
+                    self.entries.move_to_end((entry.scope, entry.prompt))
+                    self.stats["semantic_hits"] += 1
+                    return entry.response
+            self.stats["misses"] += 1
+            return None
+
+    def _miss(self) -> None:
+        with self.lock:
+            self.stats["misses"] += 1
+
+    def _store(self, scope: str, prompt: str, response: str, vector: np.ndarray | None, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[(scope, prompt)] = CacheEntry(scope, prompt, response, vector)
+            self.entries.move_to_end((scope, prompt))
+            self._expire(time.monotonic())
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    @staticmethod
+    def _unit(vector: list[float]) -> np.ndarray:
+        array: np.ndarray = np.asarray(vector, dtype=np.float32)
+        norm: float = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+    def get(self, scope: str, prompt: str) -> str | None:
+        prompt = normalize_prompt(prompt)
+        if (response := self._exact(scope, prompt)) is not None:
+            return response
+        if self.embedding is None:
+            self._miss()
+            return None
+        return self._semantic(scope, self._unit(self.embedding.get_query_embedding(prompt)))
+
+    async def aget(self, scope: str, prompt: str) -> str | None:
+        prompt = normalize_prompt(prompt)
+        if (response := self._exact(scope, prompt)) is not None:
+            return response
+        if self.embedding is None:
+            self._miss()
+            return None
+        return self._semantic(scope, self._unit(await self.embedding.aget_query_embedding(prompt)))
+
+    def put(self, scope: str, prompt: str, response: str, generation: int | None = None) -> None:
+        """
+        pass the generation read before computing the answer so an invalidate that
+        happened meanwhile drops it
+        """
+        generation = self.generation if generation is None else generation
+        prompt = normalize_prompt(prompt)
+        vector: np.ndarray | None = None
+        if self.embedding is not None:
+            vector = self._unit(self.embedding.get_query_embedding(prompt))
+        self._store(scope, prompt, response, vector, generation)
+
+    async def aput(self, scope: str, prompt: str, response: str, generation: int | None = None) -> None:
+        generation = self.generation if generation is None else generation
+        prompt = normalize_prompt(prompt)
+        vector: np.ndarray | None = None
+        if self.embedding is not None:
+            vector = self._unit(await self.embedding.aget_query_embedding(prompt))
+        self._store(scope, prompt, response, vector, generation)
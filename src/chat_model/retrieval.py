@@ -0,0 +1,196 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+from collections import OrderedDict
+from threading import Lock
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from .response_cache import index_version, normalize_prompt
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
+    from llama_index.core.vector_stores.types import BasePydanticVectorStore
+    from llama_index.core.embeddings import BaseEmbedding
+    from llama_index.core.indices.base import BaseIndex
+    from llama_index.core.base.embeddings.base import Embedding
+    from .bm25 import BM25Index
+
+
+
+RETRIEVAL_ENTRY_LIMIT: int = 512
+QUERY_EMBEDDING_LIMIT: int = 2048
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    memoizes query embeddings and top-k results of a vector retriever. results are
+    only valid for the index version they were computed at, query embeddings do not
+    depend on the index and survive inserts. both tiers are bounded LRU maps
+    """
+
+    def __init__(
+        self, retriever: BaseRetriever, index: BaseIndex, embedding: BaseEmbedding,
+        max_results: int = RETRIEVAL_ENTRY_LIMIT, max_embeddings: int = QUERY_EMBEDDING_LIMIT
+        ) -> None:
+        super().__init__(callback_manager=retriever.callback_manager)
+        self.retriever: BaseRetriever = retriever
+        self.index: BaseIndex = index
+        self.embedding: BaseEmbedding = embedding
+        self.max_results: int = max_results
+        self.max_embeddings: int = max_embeddings
+        self.lock: Lock = Lock()
+        self.version: int = index_version(index)
+        self.results: OrderedDict[str, list[NodeWithScore]] = OrderedDict()
+        self.embeddings: OrderedDict[str, Embedding] = OrderedDict()
+        self.stats: dict[str, int] = {"result_hits": 0, "result_misses": 0, "embedding_hits": 0, "embedding_misses": 0}
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        with self.lock:
+            return {**self.stats, "results": len(self.results), "embeddings": len(self.embeddings)}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.results.clear()
+            self.embeddings.clear()
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: str, value: Any, limit: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _cached_results(self, key: str) -> list[NodeWithScore] | None:
+        with self.lock:
+            version: int = index_version(self.index)
+            if version != self.version:
+                self.results.clear()
+                self.version = version
+
+            results: list[NodeWithScore] | None = self.results.get(key)
+            if results is None:
+                self.stats["result_misses"] += 1
+                return None
+            self.results.move_to_end(key)
+            self.stats["result_hits"] += 1
+            # postprocessors may rescore nodes, hand out fresh wrappers
+            return [NodeWithScore(node=result.node, score=result.score) for result in results]
+
+    def _store_results(self, key: str, version: int, results: list[NodeWithScore]) -> None:
+        with self.lock:
+            # an insert that landed while retrieving makes these results stale
+            if version == self.version == index_version(self.index):
+                self._remember(self.results, key, list(results), self.max_results)
+
+    def _cached_embedding(self, key: str) -> Embedding | None:
+        with self.lock:
+            embedding: Embedding | None = self.embeddings.get(key)
+            if embedding is None:
+                self.stats["embedding_misses"] += 1
+                return None
+            self.embeddings.move_to_end(key)
+            self.stats["embedding_hits"] += 1
+            return embedding
+
+    def _store_embedding(self, key: str, embedding: Embedding) -> None:
+        with self.lock:
+            self._remember(self.embeddings, key, embedding, self.max_embeddings)
+
+    def _bundle(self, query_bundle: QueryBundle, embedding: Embedding) -> QueryBundle:
+        return QueryBundle(
+            query_str=query_bundle.query_str, custom_embedding_strs=query_bundle.custom_embedding_strs,
+            embedding=embedding
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        key: str = normalize_prompt(query_bundle.query_str)
+        if (results := self._cached_results(key)) is not None:
+            return results
+        version: int = index_version(self.index)
+
+        embedding: Embedding | None = query_bundle.embedding or self._cached_embedding(key)
+        if embedding is None:
+            embedding = self.embedding.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+            self._store_embedding(key, embedding)
+
+        results = self.retriever.retrieve(self._bundle(query_bundle, embedding))
+        self._store_results(key, version, results)
+        return results
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        key: str = normalize_prompt(query_bundle.query_str)
+        if (results := self._cached_results(key)) is not None:
+            return results
+        version: int = index_version(self.index)
+
+        embedding: Embedding | None = query_bundle.embedding or self._cached_embedding(key)
+        if embedding is None:
+            embedding = await self.embedding.aget_agg_embedding_from_queries(query_bundle.embedding_strs)
+            self._store_embedding(key, embedding)
+
+        results = await self.retriever.aretrieve(self._bundle(query_bundle, embedding))
+        self._store_results(key, version, results)
+        return results
+
+
+RRF_K: int = 60
+# each side contributes this many times top_k candidates to the fusion
+CANDIDATE_FACTOR: int = 2
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    scores: dict[str, float] = dict()
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, 1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    fuses a vector retriever with BM25 keyword matches by reciprocal rank fusion so
+    exact identifiers the embedding misses still surface. keyword hits are loaded
+    from the index's vector store, or its docstore when the store keeps no text
+    """
+
+    def __init__(
+        self, retriever: BaseRetriever, keywords: BM25Index, index: BaseIndex, top_k: int, rrf_k: int = RRF_K
+        ) -> None:
+        super().__init__(callback_manager=retriever.callback_manager)
+        self.retriever: BaseRetriever = retriever
+        self.keywords: BM25Index = keywords
+        self.index: BaseIndex = index
+        self.top_k: int = top_k
+        self.rrf_k: int = rrf_k
+
+    def _fetch(self, node_ids: list[str]) -> dict[str, BaseNode]:
+        if len(node_ids) == 0:
+            return {}
+        store: BasePydanticVectorStore = self.index.vector_store
+        nodes: list[BaseNode]
+        if store.stores_text:
+            nodes = store.get_nodes(node_ids)
+        else:
+            nodes = self.index.docstore.get_nodes(node_ids, raise_error=False)
+        return {node.node_id: node for node in nodes if node is not None}
+
+    def _fuse(self, dense: list[NodeWithScore], query: str) -> list[NodeWithScore]:
+        sparse: list[str] = [node_id for node_id, _ in self.keywords.search(query, self.top_k * CANDIDATE_FACTOR)]
+        nodes: dict[str, BaseNode] = {result.node.node_id: result.node for result in dense}
+        # a keyword hit that was deleted from the store meanwhile is skipped
+        nodes.update(self._fetch([node_id for node_id in sparse if node_id not in nodes]))
+
+        fused: list[tuple[str, float]] = reciprocal_rank_fusion(
+            [[result.node.node_id for result in dense], sparse], self.rrf_k
+        )
+        return [
+            NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused if node_id in nodes
+        ][:self.top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._fuse(self.retriever.retrieve(query_bundle), query_bundle.query_str)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self._fuse(await self.retriever.aretrieve(query_bundle), query_bundle.query_str)
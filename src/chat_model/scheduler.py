@@ -0,0 +1,413 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence, TYPE_CHECKING
+import enum, time, asyncio
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager, asynccontextmanager
+from threading import Thread, Lock, Condition, Event
+
+from pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.llms.ollama import Ollama
+
+if TYPE_CHECKING:
+    from llama_index.core.base.embeddings.base import Embedding
+    from llama_index.core.base.llms.types import ChatMessage, ChatResponse
+
+
+
+TOTAL_LIMIT: int = 2
+MAX_BATCH_TEXTS: int = 64
+MAX_BATCH_DELAY: float = 0.005
+BATCH_WORKERS: int = 2
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+DEFAULT_LIMITS: dict[Priority, int] = {Priority.INTERACTIVE: 2, Priority.BACKGROUND: 1}
+
+
+class _Waiter:
+
+    __slots__ = ("priority", "enqueued", "granted", "event", "loop", "future")
+
+    def __init__(self, priority: Priority, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self.priority: Priority = priority
+        self.enqueued: float = time.monotonic()
+        self.granted: bool = False
+        self.event: Event | None = None if loop else Event()
+        self.loop: asyncio.AbstractEventLoop | None = loop
+        self.future: asyncio.Future | None = loop.create_future() if loop else None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RequestScheduler:
+    """
+    admission control in front of the ollama backend. every call takes a slot of
+    its priority class, a class never runs more than its own limit and all classes
+    together never more than total_limit. free slots always go to the most urgent
+    waiting class first so bulk ingest cannot starve interactive chat. works from
+    threads (acquire/slot) and event loops (aacquire/aslot) alike
+    """
+
+    __slots__ = ("limits", "total_limit", "lock", "waiting", "running", "stats")
+
+    def __init__(self, limits: dict[Priority, int] | None = None, total_limit: int = TOTAL_LIMIT) -> None:
+        self.limits: dict[Priority, int] = {**DEFAULT_LIMITS, **(limits or {})}
+        self.total_limit: int = total_limit
+        self.lock: Lock = Lock()
+        self.waiting: dict[Priority, deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self.running: dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.stats: dict[Priority, dict[str, float]] = {
+            priority: {"granted": 0, "max_queued": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in Priority
+        }
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        with self.lock:
+            classes: dict[str, dict[str, Any]] = dict()
+            for priority in Priority:
+                stats: dict[str, float] = self.stats[priority]
+                classes[priority.name.lower()] = {
+                    "limit": self.limits[priority], "running": self.running[priority],
+                    "queued": len(self.waiting[priority]), **stats,
+                    "mean_wait": stats["total_wait"] / stats["granted"] if stats["granted"] else 0.0,
+                }
+            return {"total_limit": self.total_limit, "running": sum(self.running.values()), "classes": classes}
+
+    def _dispatch(self) -> None:
+        total: int = sum(self.running.values())
+        for priority in Priority:
+            queue: deque[_Waiter] = self.waiting[priority]
+            while queue and total < self.total_limit and self.running[priority] < self.limits[priority]:
+                waiter: _Waiter = queue.popleft()
+                self._grant(waiter)
+                total += 1
+                waiter.wake()
+            if total >= self.total_limit:
+                return
+
+    def _grant(self, waiter: _Waiter) -> None:
+        waited: float = time.monotonic() - waiter.enqueued
+        stats: dict[str, float] = self.stats[waiter.priority]
+        stats["granted"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        self.running[waiter.priority] += 1
+        waiter.granted = True
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue: deque[_Waiter] = self.waiting[waiter.priority]
+        queue.append(waiter)
+        stats: dict[str, float] = self.stats[waiter.priority]
+        stats["max_queued"] = max(stats["max_queued"], len(queue))
+        self._dispatch()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self.lock:
+            if waiter.granted:
+                self._release(waiter.priority)
+            else:
+                self.waiting[waiter.priority].remove(waiter)
+
+    def _release(self, priority: Priority) -> None:
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: float | None = None) -> bool:
+        waiter: _Waiter = _Waiter(Priority(priority))
+        with self.lock:
+            self._enqueue(waiter)
+        if waiter.event.wait(timeout):
+            return True
+        # a grant racing the timeout is handed straight back
+        self._abandon(waiter)
+        return False
+
+    async def aacquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        waiter: _Waiter = _Waiter(Priority(priority), asyncio.get_running_loop())
+        with self.lock:
+            self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def release(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        with self.lock:
+            self._release(Priority(priority))
+
+    @contextmanager
+    def slot(self, priority: Priority = Priority.INTERACTIVE) -> Iterator[None]:
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[None]:
+        await self.aacquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def run(self, function: Callable[..., Any], *args: Any, priority: Priority = Priority.INTERACTIVE, **kwargs: Any) -> Any:
+        with self.slot(priority):
+            return function(*args, **kwargs)
+
+
+class _BatchRequest:
+
+    __slots__ = ("texts", "priority", "future")
+
+    def __init__(self, texts: list[str], priority: Priority) -> None:
+        self.texts: list[str] = texts
+        self.priority: Priority = priority
+        self.future: Future = Future()
+
+
+class EmbeddingBatcher:
+    """
+    coalesces concurrent embedding calls into batched backend requests. a batch is
+    sent once max_batch texts are pending or the oldest request waited max_delay,
+    the most urgent requests are batched first and every batch runs under a
+    scheduler slot of its most urgent request. the worker threads start with the
+    first request and close() stops them
+    """
+
+    __slots__ = ("embed_batch", "scheduler", "max_batch", "max_delay", "pending", "condition", "workers", "closed", "stats")
+
+    def __init__(
+        self, embed_batch: Callable[[list[str]], list[Embedding]], scheduler: RequestScheduler | None = None,
+        max_batch: int = MAX_BATCH_TEXTS, max_delay: float = MAX_BATCH_DELAY, workers: int = BATCH_WORKERS
+        ) -> None:
+        self.embed_batch: Callable[[list[str]], list[Embedding]] = embed_batch
+        self.scheduler: RequestScheduler | None = scheduler
+        self.max_batch: int = max_batch
+        self.max_delay: float = max_delay
+        self.pending: dict[Priority, deque[_BatchRequest]] = {priority: deque() for priority in Priority}
+        self.condition: Condition = Condition()
+        self.closed: bool = False
+        self.stats: dict[str, int] = {"requests": 0, "texts": 0, "batches": 0}
+        self.workers: list[Thread] = [
+            Thread(target=self._work, name=f"embedding-batcher-{i}", daemon=True) for i in range(workers)
+        ]
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        with self.condition:
+            return {
+                **self.stats, "queued": {priority.name.lower(): len(self.pending[priority]) for priority in Priority},
+                "mean_batch": self.stats["texts"] / self.stats["batches"] if self.stats["batches"] else 0.0,
+            }
+
+    def submit(self, texts: Sequence[str], priority: Priority = Priority.BACKGROUND) -> Future:
+        request: _BatchRequest = _BatchRequest(list(texts), Priority(priority))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("embedding batcher is closed")
+            if self.workers[0].ident is None:
+                for worker in self.workers:
+                    worker.start()
+            self.pending[request.priority].append(request)
+            self.stats["requests"] += 1
+            self.condition.notify()
+        return request.future
+
+    def embed(self, texts: Sequence[str], priority: Priority = Priority.BACKGROUND) -> list[Embedding]:
+        return self.submit(texts, priority).result()
+
+    async def aembed(self, texts: Sequence[str], priority: Priority = Priority.BACKGROUND) -> list[Embedding]:
+        return await asyncio.wrap_future(self.submit(texts, priority))
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.join()
+
+    def _pending_texts(self) -> int:
+        return sum(len(request.texts) for queue in self.pending.values() for request in queue)
+
+    def _take(self) -> list[_BatchRequest] | None:
+        with self.condition:
+            while not any(self.pending.values()):
+                if self.closed:
+                    return None
+                self.condition.wait()
+
+            deadline: float = time.monotonic() + self.max_delay
+            while not self.closed and self._pending_texts() < self.max_batch:
+                remaining: float = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch: list[_BatchRequest] = []
+            size: int = 0
+            for priority in Priority:
+                queue: deque[_BatchRequest] = self.pending[priority]
+                # a request larger than max_batch still goes out whole, on its own
+                while queue and (not batch or size + len(queue[0].texts) <= self.max_batch):
+                    request: _BatchRequest = queue.popleft()
+                    batch.append(request)
+                    size += len(request.texts)
+            if not batch:
+                return []
+            self.stats["batches"] += 1
+            self.stats["texts"] += size
+            return batch
+
+    def _work(self) -> None:
+        while (batch := self._take()) is not None:
+            if not batch:
+                continue
+            texts: list[str] = [text for request in batch for text in request.texts]
+            priority: Priority = min(request.priority for request in batch)
+            try:
+                if self.scheduler is None:
+                    vectors: list[Embedding] = self.embed_batch(texts)
+                else:
+                    vectors = self.scheduler.run(self.embed_batch, texts, priority=priority)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            start: int = 0
+            for request in batch:
+                request.future.set_result(vectors[start:start + len(request.texts)])
+                start += len(request.texts)
+
+
+class ScheduledEmbedding(BaseEmbedding):
+    """
+    routes document embeddings through an EmbeddingBatcher as background work,
+    query embeddings take an interactive scheduler slot
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _scheduler: RequestScheduler | None = PrivateAttr()
+    _batcher: EmbeddingBatcher = PrivateAttr()
+    _text_priority: Priority = PrivateAttr()
+    _owns_batcher: bool = PrivateAttr()
+
+    def __init__(
+        self, inner: BaseEmbedding, scheduler: RequestScheduler | None = None,
+        text_priority: Priority = Priority.BACKGROUND, batcher: EmbeddingBatcher | None = None, **kwargs: Any
+        ) -> None:
+        super().__init__(
+            model_name=inner.model_name, embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager, **kwargs
+        )
+        self._inner = inner
+        self._scheduler = scheduler
+        self._text_priority = text_priority
+        # a batcher that was passed in may be shared, its owner closes it
+        self._owns_batcher = batcher is None
+        self._batcher = batcher or EmbeddingBatcher(
+            inner.get_text_embedding_batch, scheduler, max_batch=max(inner.embed_batch_size, 1)
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def batcher(self) -> EmbeddingBatcher:
+        return self._batcher
+
+    def close(self) -> None:
+        if self._owns_batcher:
+            self._batcher.close()
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return self._batcher.embed(texts, self._text_priority)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return await self._batcher.aembed(texts, self._text_priority)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        # queries keep the inner model's query formatting so they skip the batcher
+        if self._scheduler is None:
+            return self._inner.get_query_embedding(query)
+        return self._scheduler.run(self._inner.get_query_embedding, query, priority=Priority.INTERACTIVE)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        if self._scheduler is None:
+            return await self._inner.aget_query_embedding(query)
+        async with self._scheduler.aslot(Priority.INTERACTIVE):
+            return await self._inner.aget_query_embedding(query)
+
+
+class ScheduledOllama(Ollama):
+    """
+    Ollama client whose chat calls each hold a scheduler slot, streamed calls keep
+    it until the stream is finished or closed
+    """
+
+    _scheduler: RequestScheduler = PrivateAttr()
+    _priority: Priority = PrivateAttr()
+
+    def __init__(self, scheduler: RequestScheduler, priority: Priority = Priority.INTERACTIVE, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._scheduler = scheduler
+        self._priority = priority
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledOllama_llm"
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        with self._scheduler.slot(self._priority):
+            return super().chat(messages, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        async with self._scheduler.aslot(self._priority):
+            return await super().achat(messages, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> Iterator[ChatResponse]:
+        def gen() -> Iterator[ChatResponse]:
+            with self._scheduler.slot(self._priority):
+                yield from super(ScheduledOllama, self).stream_chat(messages, **kwargs)
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> AsyncIterator[ChatResponse]:
+        async def gen() -> AsyncIterator[ChatResponse]:
+            async with self._scheduler.aslot(self._priority):
+                async for response in await super(ScheduledOllama, self).astream_chat(messages, **kwargs):
+                    yield response
+        return gen()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+from typing import Any, IO
+import os, sys, time, signal, subprocess
+import urllib.request, urllib.error
+from pathlib import Path
+from threading import Thread, Event, Lock
+
+from ..paths import PORTABLE_OLLAMA
+from .. import variables
+
+
+
+READY_TIMEOUT: float = 60.0
+PROBE_TIMEOUT: float = 1.0
+FIRST_POLL_INTERVAL: float = 0.05
+MAX_POLL_INTERVAL: float = 1.0
+MAX_RESTART_DELAY: float = 30.0
+
+
+def default_command() -> list[str]:
+    if sys.platform == "win32":
+        return [str(PORTABLE_OLLAMA), "serve"]
+    return ["bash", str(PORTABLE_OLLAMA), "serve"]
+
+
+def probe(url: str, timeout: float = PROBE_TIMEOUT) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return 200 <= response.status < 300
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+class OllamaSupervisor:
+    """
+    starts `ollama serve` through the portable script and keeps it alive.
+    readiness is decided by polling the HTTP endpoint with backoff, a server
+    that already answers is reused and a crashed server is started again
+    """
+
+    __slots__ = (
+        "command", "url", "env", "log_path", "ready_timeout", "restart", "process",
+        "lock", "stopping", "monitor", "stats"
+    )
+
+    def __init__(
+        self, command: list[str] | None = None, url: str | None = None, env: dict[str, str] | None = None,
+        log_path: str | Path | None = None, ready_timeout: float = READY_TIMEOUT, restart: bool = True
+        ) -> None:
+        self.command: list[str] = command or default_command()
+        self.url: str = url or variables.SERVER_URL
+        self.env: dict[str, str] | None = env
+        self.log_path: str | Path | None = log_path
+        self.ready_timeout: float = ready_timeout
+        self.restart: bool = restart
+        self.process: subprocess.Popen | None = None
+        self.lock: Lock = Lock()
+        self.stopping: Event = Event()
+        self.monitor: Thread | None = None
+        self.stats: dict[str, Any] = {
+            "starts": 0, "restarts": 0, "reused": False, "ready": False,
+            "last_startup_seconds": None, "total_startup_seconds": 0.0,
+        }
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        with self.lock:
+            return dict(self.stats)
+
+    def is_ready(self) -> bool:
+        return probe(self.url)
+
+    def start(self) -> bool:
+        """
+        returns once the server answers, False if it did not within ready_timeout
+        """
+        if self.is_ready():
+            with self.lock:
+                self.stats["reused"] = self.process is None
+                self.stats["ready"] = True
+            return True
+
+        self.stopping.clear()
+        ready: bool = self._launch()
+        if self.restart and (self.monitor is None or not self.monitor.is_alive()):
+            self.monitor = Thread(target=self._watch, daemon=True)
+            self.monitor.start()
+        return ready
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        deadline: float = time.monotonic() + (self.ready_timeout if timeout is None else timeout)
+        interval: float = FIRST_POLL_INTERVAL
+
+        while time.monotonic() < deadline:
+            if self.is_ready():
+                return True
+            process: subprocess.Popen | None = self.process
+            if process is not None and process.poll() is not None:
+                return False
+            if self.stopping.wait(min(interval, max(0.0, deadline - time.monotonic()))):
+                return False
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        return self.is_ready()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self.stopping.set()
+        with self.lock:
+            process: subprocess.Popen | None = self.process
+            self.process = None
+            self.stats["ready"] = False
+
+        if process is not None and process.poll() is None:
+            self._signal(process, signal.SIGTERM)
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._signal(process, signal.SIGKILL if hasattr(signal, "SIGKILL") else signal.SIGTERM)
+                process.wait()
+
+        if self.monitor is not None:
+            self.monitor.join(timeout)
+            self.monitor = None
+
+    def _launch(self) -> bool:
+        started: float = time.monotonic()
+        output: IO | int = subprocess.DEVNULL
+        if self.log_path is not None:
+            Path(self.log_path).parent.mkdir(parents=True, exist_ok=True)
+            output = open(self.log_path, "ab")
+
+        options: dict[str, Any] = {}
+        if sys.platform == "win32":
+            options["creationflags"] = subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # the portable script forks the real server, keep both in one group
+            options["start_new_session"] = True
+
+        env: dict[str, str] = {**os.environ, **(self.env or {})}
+        try:
+            process: subprocess.Popen = subprocess.Popen(
+                self.command, stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+                env=env, **options
+            )
+        finally:
+            if output is not subprocess.DEVNULL:
+                output.close()
+
+        with self.lock:
+            self.process = process
+            self.stats["starts"] += 1
+
+        ready: bool = self.wait_ready()
+        with self.lock:
+            self.stats["ready"] = ready
+            if ready:
+                elapsed: float = time.monotonic() - started
+                self.stats["last_startup_seconds"] = elapsed
+                self.stats["total_startup_seconds"] += elapsed
+        return ready
+
+    def _watch(self) -> None:
+        failures: int = 0
+        while not self.stopping.is_set():
+            process: subprocess.Popen | None = self.process
+            if process is None:
+                return
+            process.wait()
+            if self.stopping.is_set():
+                return
+
+            with self.lock:
+                self.stats["ready"] = False
+                self.stats["restarts"] += 1
+
+            if self.is_ready():
+                # someone else is serving on the port now
+                return
+
+            delay: float = min(0.5 * 2 ** failures, MAX_RESTART_DELAY)
+            if self.stopping.wait(delay if failures else 0):
+                return
+            failures = 0 if self._launch() else failures + 1
+
+    @staticmethod
+    def _signal(process: subprocess.Popen, sig: int) -> None:
+        try:
+            if sys.platform == "win32":
+                process.terminate()
+            else:
+                os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
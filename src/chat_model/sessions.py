@@ -0,0 +1,235 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Coroutine, Iterator, TYPE_CHECKING
+import time, uuid, asyncio
+from concurrent.futures import Future
+from queue import Queue
+from threading import Thread, Lock
+
+from .chat_model import ChatEvent, _STREAM_END
+
+if TYPE_CHECKING:
+    from llama_index.core.memory import SimpleComposableMemory
+    from .chat_model import ChatModel
+
+
+
+SESSION_IDLE_TIMEOUT: float = 30 * 60.0
+MAX_SESSIONS: int = 256
+
+
+class Session:
+
+    __slots__ = ("session_id", "memory", "lock", "active", "last_used")
+
+    def __init__(self, session_id: str, memory: SimpleComposableMemory) -> None:
+        self.session_id: str = session_id
+        self.memory: SimpleComposableMemory = memory
+        # one run at a time per session, the memory is not safe to share between runs
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.active: int = 0
+        self.last_used: float = time.monotonic()
+
+
+class SessionManager:
+    """
+    serves many chat sessions from one loaded ChatModel. the llm client, embedding,
+    RAG index and agent are shared and every session only owns its memory. all runs
+    happen on a single event loop thread so concurrent prompts interleave on one loop.
+    sessions idle for longer than idle_timeout are dropped, past max_sessions the least
+    recently used idle session is dropped first
+    """
+
+    __slots__ = ("model", "idle_timeout", "max_sessions", "sessions", "lock", "loop", "thread")
+
+    def __init__(
+        self, model: ChatModel, idle_timeout: float = SESSION_IDLE_TIMEOUT, max_sessions: int = MAX_SESSIONS
+        ) -> None:
+        if model.agent is None:
+            raise RuntimeError("load_model must be called before sharing the model")
+
+        self.model: ChatModel = model
+        self.idle_timeout: float = idle_timeout
+        self.max_sessions: int = max_sessions
+        self.sessions: dict[str, Session] = dict()
+        self.lock: Lock = Lock()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: Thread | None = None
+
+    @property
+    def session_count(self) -> int:
+        with self.lock:
+            return len(self.sessions)
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = Thread(target=self.loop.run_forever, name="session-loop", daemon=True)
+                self.thread.start()
+                self.loop.call_soon_threadsafe(self._schedule_reap)
+            return self.loop
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        cancels the running prompts, stops the loop and closes the shared model
+        """
+        with self.lock:
+            loop: asyncio.AbstractEventLoop | None = self.loop
+            thread: Thread | None = self.thread
+            self.loop = self.thread = None
+            self.sessions.clear()
+
+        if loop is None:
+            self.model.close()
+            return
+
+        async def cancel_all() -> None:
+            tasks: set[asyncio.Task] = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        self.model.close()
+
+    def open_session(self, session_id: str | None = None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        self._release(self._acquire(session_id))
+        return session_id
+
+    def close_session(self, session_id: str) -> bool:
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> list[str]:
+        with self.lock:
+            return self._evict()
+
+    def _evict(self, reserve: int = 0) -> list[str]:
+        now: float = time.monotonic()
+        evicted: list[str] = [
+            session_id for session_id, session in self.sessions.items()
+            if session.active == 0 and now - session.last_used > self.idle_timeout
+        ]
+
+        overflow: int = len(self.sessions) - len(evicted) + reserve - self.max_sessions
+        if overflow > 0:
+            idle: list[Session] = sorted(
+                (session for session in self.sessions.values() if session.active == 0 and session.session_id not in evicted),
+                key=lambda session: session.last_used
+            )
+            evicted.extend(session.session_id for session in idle[:overflow])
+
+        for session_id in evicted:
+            del self.sessions[session_id]
+        return evicted
+
+    def _schedule_reap(self) -> None:
+        self.evict_idle()
+        if self.loop is not None:
+            self.loop.call_later(max(1.0, self.idle_timeout / 4), self._schedule_reap)
+
+    def _acquire(self, session_id: str) -> Session:
+        with self.lock:
+            session: Session | None = self.sessions.get(session_id)
+            if session is None:
+                # leave room for the new session, busy sessions are never dropped
+                self._evict(reserve=1)
+                session = self.sessions[session_id] = Session(session_id, self.model.new_memory())
+            session.active += 1
+            return session
+
+    def _release(self, session: Session) -> None:
+        with self.lock:
+            session.active -= 1
+            session.last_used = time.monotonic()
+
+    async def _aprompt(self, session_id: str, prompt_text: str) -> str:
+        session: Session = self._acquire(session_id)
+        try:
+            async with session.lock:
+                return str(await self.model.aprompt(prompt_text, memory=session.memory))
+        finally:
+            self._release(session)
+
+    async def _astream(self, session_id: str, prompt_text: str) -> AsyncIterator[ChatEvent]:
+        session: Session = self._acquire(session_id)
+        try:
+            async with session.lock:
+                async for event in self.model.astream(prompt_text, memory=session.memory):
+                    yield event
+        finally:
+            self._release(session)
+
+    def _submit(self, coroutine: Coroutine[Any, Any, Any]) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def submit(self, session_id: str, prompt_text: str) -> Future:
+        """
+        schedules a prompt on the shared loop and returns a concurrent future for the response
+        """
+        return self._submit(self._aprompt(session_id, prompt_text))
+
+    def prompt(self, session_id: str, prompt_text: str) -> str:
+        return self.submit(session_id, prompt_text).result()
+
+    async def aprompt(self, session_id: str, prompt_text: str) -> str:
+        """
+        can be awaited from any event loop, the run itself always happens on the shared loop
+        """
+        loop: asyncio.AbstractEventLoop = self.start()
+        if asyncio.get_running_loop() is loop:
+            return await self._aprompt(session_id, prompt_text)
+        return await asyncio.wrap_future(self._submit(self._aprompt(session_id, prompt_text)))
+
+    async def astream(self, session_id: str, prompt_text: str) -> AsyncIterator[ChatEvent]:
+        loop: asyncio.AbstractEventLoop = self.start()
+        if asyncio.get_running_loop() is loop:
+            async for event in self._astream(session_id, prompt_text):
+                yield event
+            return
+
+        caller: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def pump() -> None:
+            try:
+                async for event in self._astream(session_id, prompt_text):
+                    caller.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                caller.call_soon_threadsafe(events.put_nowait, e)
+            finally:
+                caller.call_soon_threadsafe(events.put_nowait, _STREAM_END)
+
+        future: Future = self._submit(pump())
+        try:
+            while (item := await events.get()) is not _STREAM_END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stream(self, session_id: str, prompt_text: str) -> Iterator[ChatEvent]:
+        events: Queue = Queue()
+
+        async def pump() -> None:
+            try:
+                async for event in self._astream(session_id, prompt_text):
+                    events.put(event)
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(_STREAM_END)
+
+        future: Future = self._submit(pump())
+        try:
+            while (item := events.get()) is not _STREAM_END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
@@ -0,0 +1,247 @@
+from __future__ import annotations
+from typing import Iterator, TYPE_CHECKING
+import os, json, sqlite3
+from pathlib import Path
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+from ..flags import ExtractionErrors
+from ..extractors.extraction_cache import file_digest
+from .ingestion import IngestionPipeline
+
+if TYPE_CHECKING:
+    from llama_index.core.indices.base import BaseIndex
+    from llama_index.core.embeddings import BaseEmbedding
+    from ..extractors.extraction_router import ExtractionRouter
+    from .bm25 import BM25Index
+
+
+
+MANIFEST_FILE: str = "manifest.sqlite"
+HASH_WORKERS: int = 8
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    node_ids TEXT NOT NULL
+);
+"""
+
+
+class FileState:
+
+    __slots__ = ("path", "mtime_ns", "size", "digest", "node_ids")
+
+    def __init__(self, path: str, mtime_ns: int, size: int, digest: str = "", node_ids: list[str] | None = None) -> None:
+        self.path: str = path
+        self.mtime_ns: int = mtime_ns
+        self.size: int = size
+        self.digest: str = digest
+        self.node_ids: list[str] = node_ids or []
+
+
+class SyncReport(BaseModel):
+    added: list[str] = []
+    updated: list[str] = []
+    removed: list[str] = []
+    unchanged: int = 0
+    failed: list[str] = []
+
+
+class SyncManifest:
+    """
+    sqlite table of the files a directory sync indexed, with the stat and content
+    hash they had and the ids of the nodes they produced
+    """
+
+    __slots__ = ("path", "db", "lock")
+
+    def __init__(self, folder: str | Path) -> None:
+        self.path: Path = Path(folder) / MANIFEST_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db: sqlite3.Connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self.lock: Lock = Lock()
+
+    def entries(self, root: str) -> dict[str, FileState]:
+        """
+        every file recorded under root
+        """
+        prefix: str = root.rstrip(os.sep) + os.sep
+        with self.lock:
+            records: list[tuple[str, int, int, str, str]] = self.db.execute(
+                "SELECT path, mtime_ns, size, digest, node_ids FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)
+            ).fetchall()
+        return {
+            path: FileState(path, mtime_ns, size, digest, json.loads(node_ids))
+            for path, mtime_ns, size, digest, node_ids in records
+        }
+
+    def put(self, states: list[FileState]) -> None:
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, digest, node_ids) VALUES (?, ?, ?, ?, ?)",
+                [(state.path, state.mtime_ns, state.size, state.digest, json.dumps(state.node_ids)) for state in states]
+            )
+            self.db.commit()
+
+    def owned(self, node_ids: set[str], exclude: set[str]) -> set[str]:
+        """
+        the node ids among node_ids that files other than exclude still own
+        """
+        with self.lock:
+            records: list[tuple[str, str]] = self.db.execute("SELECT path, node_ids FROM files").fetchall()
+        owned: set[str] = set()
+        for path, ids in records:
+            if path not in exclude:
+                owned.update(node_ids.intersection(json.loads(ids)))
+        return owned
+
+    def remove(self, paths: list[str]) -> None:
+        with self.lock:
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self.db.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM files")
+            self.db.commit()
+
+
+def walk_files(root: str) -> Iterator[os.DirEntry]:
+    directories: list[str] = [root]
+    while directories:
+        try:
+            entries: Iterator[os.DirEntry] = os.scandir(directories.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+
+
+class DirectorySync:
+    """
+    keeps the index in step with a folder tree. files whose size and mtime match the
+    manifest are skipped without being read, the rest are hashed and only those with
+    new content are extracted and embedded. nodes of changed files are replaced
+    after the new ones are stored and nodes of deleted files are removed
+    """
+
+    __slots__ = ("router", "embedding", "index", "manifest", "keywords", "hash_workers")
+
+    def __init__(
+        self, router: ExtractionRouter, embedding: BaseEmbedding, index: BaseIndex, manifest: SyncManifest,
+        keywords: BM25Index | None = None, hash_workers: int = HASH_WORKERS
+        ) -> None:
+        self.router: ExtractionRouter = router
+        self.embedding: BaseEmbedding = embedding
+        self.index: BaseIndex = index
+        self.manifest: SyncManifest = manifest
+        self.keywords: BM25Index | None = keywords
+        self.hash_workers: int = hash_workers
+
+    def scan(self, root: str) -> dict[str, FileState]:
+        found: dict[str, FileState] = dict()
+        for entry in walk_files(root):
+            if isinstance(self.router.resolve(entry.path), ExtractionErrors):
+                continue
+            try:
+                stat: os.stat_result = entry.stat()
+            except OSError:
+                continue
+            found[entry.path] = FileState(entry.path, stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _hash(self, state: FileState) -> FileState | None:
+        try:
+            state.digest = file_digest(state.path)
+            return state
+        except OSError:
+            return None
+
+    def sync(self, root: str | Path) -> SyncReport:
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            raise NotADirectoryError(root)
+
+        report: SyncReport = SyncReport()
+        known: dict[str, FileState] = self.manifest.entries(root)
+        found: dict[str, FileState] = self.scan(root)
+
+        touched: list[FileState] = []
+        changed: list[FileState] = []
+        candidates: list[FileState] = []
+        for path, state in found.items():
+            old: FileState | None = known.get(path)
+            if old is not None and (old.mtime_ns, old.size) == (state.mtime_ns, state.size):
+                report.unchanged += 1
+            else:
+                candidates.append(state)
+
+        with ThreadPoolExecutor(self.hash_workers) as pool:
+            for state in pool.map(self._hash, candidates):
+                if state is None:
+                    continue
+                old = known.get(state.path)
+                if old is not None and old.digest == state.digest:
+                    # touched but not edited, only the stat is refreshed
+                    state.node_ids = old.node_ids
+                    touched.append(state)
+                    report.unchanged += 1
+                else:
+                    changed.append(state)
+
+        inserted: dict[str, list[str]] = dict()
+        failed: set[str] = set()
+        if changed:
+            pipeline: IngestionPipeline = IngestionPipeline(
+                self.router, self.embedding, self.index, keywords=self.keywords
+            )
+            failed = set(pipeline.run([state.path for state in changed], inserted))
+
+        stale: list[str] = []
+        stored: list[FileState] = list(touched)
+        for state in changed:
+            new_ids: list[str] = inserted.get(state.path, [])
+            if state.path in failed:
+                # keep the previous nodes, the stat mismatch retries the file next sync
+                stale.extend(new_ids)
+                report.failed.append(state.path)
+                continue
+            old = known.get(state.path)
+            if old is not None:
+                stale.extend(set(old.node_ids) - set(new_ids))
+            state.node_ids = new_ids
+            stored.append(state)
+            (report.added if old is None else report.updated).append(state.path)
+
+        report.removed = sorted(set(known) - set(found))
+        for path in report.removed:
+            stale.extend(known[path].node_ids)
+
+        # a node id that another file still owns is never deleted with this one
+        replaced: set[str] = {state.path for state in changed} | set(report.removed)
+        kept: set[str] = {node_id for state in stored for node_id in state.node_ids}
+        kept |= self.manifest.owned(set(stale), replaced)
+        self._delete([node_id for node_id in dict.fromkeys(stale) if node_id not in kept])
+        self.manifest.put(stored)
+        self.manifest.remove(report.removed)
+        return report
+
+    def _delete(self, node_ids: list[str]) -> None:
+        if len(node_ids) == 0:
+            return
+        self.index.delete_nodes(node_ids, delete_from_docstore=True)
+        if self.keywords is not None:
+            self.keywords.delete(node_ids)
+            self.keywords.save()
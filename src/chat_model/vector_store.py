@@ -0,0 +1,489 @@
+from __future__ import annotations
+from typing import Any, Sequence, TYPE_CHECKING
+import os, json, time, sqlite3
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict, metadata_dict_to_node
+
+from .ann import IVFIndex
+from .quantization import (
+    QUANTIZATIONS, CODE_FILES, RESCORE_FACTORS, CODE_BLOCK_ROWS, code_width, encode, code_scores
+)
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
+    from llama_index.core.vector_stores.types import MetadataFilters
+
+
+
+VECTORS_FILE: str = "vectors.f32"
+NODES_FILE: str = "nodes.sqlite"
+SCAN_BLOCK_ROWS: int = 65536
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS nodes (
+    row INTEGER PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    ref_doc_id TEXT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS nodes_node_id ON nodes(node_id);
+CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes(ref_doc_id);
+CREATE INDEX IF NOT EXISTS nodes_deleted ON nodes(deleted) WHERE deleted = 1;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def stored_dimensions(folder: str | Path) -> int | None:
+    """
+    vector width recorded by the store in folder, None when there is no store yet
+    """
+    path: Path = Path(folder) / NODES_FILE
+    if not path.exists():
+        return None
+    db: sqlite3.Connection = sqlite3.connect(str(path))
+    try:
+        row: tuple[str] | None = db.execute("SELECT value FROM meta WHERE key = 'dimensions'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        db.close()
+    return int(row[0]) if row is not None else None
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms: np.ndarray = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    append-only float32 matrix memory mapped from disk with a sqlite side table
+    for node text and metadata. vectors are stored normalized so a dot product
+    is the cosine similarity. index_type "ivf" adds an approximate IVF index over
+    the same matrix, the exact scan is used until it has enough rows to train.
+    quantization "int8" or "binary" keeps a second, 4x or 32x smaller code matrix
+    that the scan runs over, its best candidates are rescored from the float rows.
+    with both, the codes of the probed IVF lists are scanned instead of the codes of
+    every row.
+    the width is recorded on first open and a store is never reopened at another one
+    """
+
+    stores_text: bool = True
+    folder: str
+    dimensions: int
+    index_type: str = "flat"
+    nlist: int | None = None
+    nprobe: int | None = None
+    quantization: str = "none"
+
+    _lock: Lock = PrivateAttr(default_factory=Lock)
+    _db: sqlite3.Connection | None = PrivateAttr(default=None)
+    _matrix: np.ndarray | None = PrivateAttr(default=None)
+    _rows: int = PrivateAttr(default=0)
+    _deleted: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=bool))
+    _version: int = PrivateAttr(default=0)
+    _ann: IVFIndex | None = PrivateAttr(default=None)
+    _codes: np.ndarray | None = PrivateAttr(default=None)
+
+    def __init__(self, folder: str | Path, dimensions: int, **kwargs: Any) -> None:
+        super().__init__(folder=str(folder), dimensions=dimensions, **kwargs)
+        if self.index_type not in ("flat", "ivf"):
+            raise ValueError(f"unknown index type {self.index_type}")
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"unknown quantization {self.quantization}")
+        self._open()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> sqlite3.Connection:
+        return self._db
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def vectors_path(self) -> Path:
+        return Path(self.folder) / VECTORS_FILE
+
+    @property
+    def codes_path(self) -> Path | None:
+        if self.quantization == "none":
+            return None
+        return Path(self.folder) / CODE_FILES[self.quantization]
+
+    @property
+    def memory_footprint(self) -> dict[str, int]:
+        """
+        bytes of the matrix a scan reads, the float rows are only read for rescoring
+        when the store is quantized
+        """
+        footprint: dict[str, int] = {"vector_bytes": self._rows * self.dimensions * 4}
+        if self.quantization != "none":
+            footprint["code_bytes"] = self._rows * code_width(self.quantization, self.dimensions)
+        return footprint
+
+    @property
+    def ann(self) -> IVFIndex | None:
+        return self._ann
+
+    @property
+    def node_count(self) -> int:
+        return self._rows - int(self._deleted.sum())
+
+    def _open(self) -> None:
+        Path(self.folder).mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(Path(self.folder) / NODES_FILE), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+        committed: int = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM nodes").fetchone()[0]
+        self._check_dimensions(committed)
+        row_bytes: int = self.dimensions * 4
+        on_disk: int = os.path.getsize(self.vectors_path) // row_bytes if self.vectors_path.exists() else 0
+
+        # vectors are written before their rows are committed, anything past
+        # the last committed row is left over from an interrupted append
+        if on_disk > committed:
+            with open(self.vectors_path, "r+b") as file:
+                file.truncate(committed * row_bytes)
+        elif on_disk < committed:
+            self._db.execute("DELETE FROM nodes WHERE row >= ?", (on_disk,))
+            self._db.commit()
+            committed = on_disk
+
+        self._rows = committed
+        self._deleted = np.zeros(committed, dtype=bool)
+        deleted_rows: list[int] = [row for (row,) in self._db.execute("SELECT row FROM nodes WHERE deleted = 1")]
+        self._deleted[deleted_rows] = True
+        self._remap()
+        if self.quantization != "none":
+            self._sync_codes()
+            self._remap()
+
+        if self.index_type == "ivf":
+            self._ann = IVFIndex(self.folder, self.nlist, self.nprobe)
+            if self._ann.covered > self._rows:
+                self._ann.reset()
+            self._ann.update(self._matrix)
+
+    def _check_dimensions(self, committed: int) -> None:
+        # reading the matrix at another width would truncate it as an interrupted append
+        row: tuple[str] | None = self._db.execute("SELECT value FROM meta WHERE key = 'dimensions'").fetchone()
+        stored: int | None = int(row[0]) if row is not None else None
+        if stored is None and committed > 0 and self.vectors_path.exists():
+            # stores from before the width was recorded
+            stored = os.path.getsize(self.vectors_path) // (committed * 4) or None
+        if stored is not None and stored != self.dimensions:
+            self._db.close()
+            raise ValueError(
+                f"the store in {self.folder} holds {stored} wide vectors, not {self.dimensions}. "
+                "was the embedding model changed? delete the folder to index again"
+            )
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dimensions', ?)", (str(self.dimensions),))
+        self._db.commit()
+
+    def _sync_codes(self) -> None:
+        """
+        the code file follows the committed rows, missing codes (a new quantization
+        setting or an interrupted append) are encoded again from the float rows
+        """
+        width: int = code_width(self.quantization, self.dimensions)
+        on_disk: int = os.path.getsize(self.codes_path) // width if self.codes_path.exists() else 0
+        with open(self.codes_path, "ab") as file:
+            if on_disk > self._rows:
+                file.truncate(self._rows * width)
+            elif on_disk < self._rows:
+                file.truncate(on_disk * width)
+                for start in range(on_disk, self._rows, SCAN_BLOCK_ROWS):
+                    file.write(encode(self.quantization, np.asarray(self._matrix[start:start + SCAN_BLOCK_ROWS])).tobytes())
+
+    def _remap(self) -> None:
+        if self._rows == 0:
+            self._matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+            self._codes = None
+            return
+        self._matrix = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dimensions)
+        )
+        if self.codes_path is not None and self.codes_path.exists():
+            width: int = code_width(self.quantization, self.dimensions)
+            if os.path.getsize(self.codes_path) >= self._rows * width:
+                self._codes = np.memmap(
+                    self.codes_path, dtype=np.int8 if self.quantization == "int8" else np.uint8,
+                    mode="r", shape=(self._rows, width)
+                )
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> list[str]:
+        if len(nodes) == 0:
+            return []
+
+        vectors: np.ndarray = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"embedding width {vectors.shape[-1]} does not match the store width {self.dimensions}"
+            )
+        vectors = normalize(vectors)
+
+        records: list[tuple[Any, ...]] = []
+        with self._lock:
+            start: int = self._rows
+            for row, node in enumerate(nodes, start):
+                metadata: dict[str, Any] = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+                records.append((
+                    row, node.node_id, node.ref_doc_id,
+                    node.get_content(), json.dumps(metadata, ensure_ascii=False)
+                ))
+
+            with open(self.vectors_path, "ab") as file:
+                file.write(vectors.tobytes())
+            if self.codes_path is not None:
+                with open(self.codes_path, "ab") as file:
+                    file.write(encode(self.quantization, vectors).tobytes())
+
+            replaced: list[int] = self._mark_deleted(
+                "node_id IN (%s)" % ",".join("?" * len(nodes)), [node.node_id for node in nodes]
+            )
+            self._db.executemany(
+                "INSERT INTO nodes (row, node_id, ref_doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)", records
+            )
+            self._db.commit()
+
+            self._rows += len(nodes)
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(nodes), dtype=bool)])
+            self._deleted[replaced] = True
+            self._version += 1
+            self._remap()
+            if self._ann is not None:
+                self._ann.update(self._matrix)
+
+        return [node.node_id for node in nodes]
+
+    def _mark_deleted(self, where: str, params: Sequence[Any]) -> list[int]:
+        rows: list[int] = [
+            row for (row,) in self._db.execute(f"SELECT row FROM nodes WHERE deleted = 0 AND {where}", params)
+        ]
+        if len(rows) == 0:
+            return rows
+        self._db.execute(f"UPDATE nodes SET deleted = 1 WHERE deleted = 0 AND {where}", params)
+        return rows
+
+    def _delete_where(self, where: str, params: Sequence[Any]) -> None:
+        with self._lock:
+            rows: list[int] = self._mark_deleted(where, params)
+            self._db.commit()
+            self._deleted[rows] = True
+            self._version += 1
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._delete_where("ref_doc_id = ?", (ref_doc_id,))
+
+    def delete_nodes(
+        self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None, **delete_kwargs: Any
+        ) -> None:
+        if filters is not None:
+            raise NotImplementedError("metadata filters are not supported")
+        if not node_ids:
+            return
+        self._delete_where("node_id IN (%s)" % ",".join("?" * len(node_ids)), node_ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM nodes")
+            self._db.commit()
+            self._matrix = None
+            with open(self.vectors_path, "wb"):
+                pass
+            if self.codes_path is not None:
+                with open(self.codes_path, "wb"):
+                    pass
+            self._rows = 0
+            self._deleted = np.zeros(0, dtype=bool)
+            self._version += 1
+            self._remap()
+            if self._ann is not None:
+                self._ann.reset()
+
+    def get_nodes(
+        self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None
+        ) -> list[BaseNode]:
+        if filters is not None:
+            raise NotImplementedError("metadata filters are not supported")
+        if node_ids is None:
+            records: list[tuple[str, str]] = self._db.execute(
+                "SELECT text, metadata FROM nodes WHERE deleted = 0 ORDER BY row"
+            ).fetchall()
+            return [metadata_dict_to_node(json.loads(meta), text) for text, meta in records]
+
+        found: dict[str, BaseNode] = {
+            node.node_id: node for node in self._fetch_rows(self._live_rows(node_ids)).values()
+        }
+        return [found[node_id] for node_id in node_ids if node_id in found]
+
+    def live_node_ids(self) -> list[str]:
+        return [node_id for (node_id,) in self._db.execute("SELECT node_id FROM nodes WHERE deleted = 0 ORDER BY row")]
+
+    def _live_rows(self, node_ids: Sequence[str], column: str = "node_id") -> list[int]:
+        if len(node_ids) == 0:
+            return []
+        return [
+            row for (row,) in self._db.execute(
+                f"SELECT row FROM nodes WHERE deleted = 0 AND {column} IN (%s)" % ",".join("?" * len(node_ids)),
+                list(node_ids)
+            )
+        ]
+
+    def _fetch_rows(self, rows: Sequence[int]) -> dict[int, BaseNode]:
+        if len(rows) == 0:
+            return {}
+        records: list[tuple[int, str, str]] = self._db.execute(
+            "SELECT row, text, metadata FROM nodes WHERE row IN (%s)" % ",".join("?" * len(rows)),
+            [int(row) for row in rows]
+        ).fetchall()
+        return {row: metadata_dict_to_node(json.loads(meta), text) for row, text, meta in records}
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("metadata filters are not supported")
+
+        with self._lock:
+            matrix: np.ndarray = self._matrix
+            codes: np.ndarray | None = self._codes
+            excluded: np.ndarray = self._deleted.copy()
+            filtered: bool = bool(query.node_ids or query.doc_ids)
+            if filtered:
+                allowed: np.ndarray = np.zeros_like(excluded)
+                allowed[self._live_rows(query.node_ids or [])] = True
+                allowed[self._live_rows(query.doc_ids or [], "ref_doc_id")] = True
+                excluded |= ~allowed
+
+        rows, scores = self._select(matrix, codes, excluded, query.query_embedding, query.similarity_top_k, filtered)
+        nodes: dict[int, BaseNode] = self._fetch_rows(rows)
+
+        return VectorStoreQueryResult(
+            nodes=[nodes[row] for row in rows],
+            similarities=[float(score) for score in scores],
+            ids=[nodes[row].node_id for row in rows]
+        )
+
+    def _select(
+        self, matrix: np.ndarray, codes: np.ndarray | None, excluded: np.ndarray, embedding: list[float],
+        top_k: int, filtered: bool = False
+        ) -> tuple[list[int], list[float]]:
+        query: np.ndarray = normalize(np.asarray(embedding, dtype=np.float32))
+        if self._ann is not None and self._ann.trained and not filtered:
+            if codes is None:
+                return self._ann.search(matrix, excluded, query, top_k)
+            probed: np.ndarray = self._ann.candidates(matrix, excluded, query)
+            return self._search_codes(matrix, codes, excluded, query, top_k, probed)
+        if codes is not None:
+            return self._search_codes(matrix, codes, excluded, query, top_k)
+        return self._search(matrix, excluded, query, top_k)
+
+    def _search_codes(
+        self, matrix: np.ndarray, codes: np.ndarray, excluded: np.ndarray, query: np.ndarray, top_k: int,
+        rows: np.ndarray | None = None
+        ) -> tuple[list[int], list[float]]:
+        """
+        scans the codes of rows, every row when None, and rescores the best ones
+        from the float rows
+        """
+        candidates: int = top_k * RESCORE_FACTORS[self.quantization]
+        best_rows: np.ndarray = np.zeros(0, dtype=np.int64)
+        best_scores: np.ndarray = np.zeros(0, dtype=np.float32)
+
+        total: int = codes.shape[0] if rows is None else rows.shape[0]
+        for start in range(0, total, CODE_BLOCK_ROWS):
+            block: np.ndarray
+            if rows is None:
+                block = np.arange(start, min(start + CODE_BLOCK_ROWS, total))
+                scores: np.ndarray = code_scores(self.quantization, codes[start:start + CODE_BLOCK_ROWS], query)
+            else:
+                block = rows[start:start + CODE_BLOCK_ROWS]
+                scores = code_scores(self.quantization, np.asarray(codes[block]), query)
+            scores[excluded[block]] = -np.inf
+            best_rows = np.concatenate([best_rows, block])
+            best_scores = np.concatenate([best_scores, scores])
+            if best_scores.shape[0] > candidates:
+                keep: np.ndarray = np.argpartition(-best_scores, candidates)[:candidates]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        # only the candidate rows are read from the float matrix
+        rows = np.sort(best_rows[np.isfinite(best_scores)])
+        exact: np.ndarray = np.asarray(matrix[rows]) @ query
+        if exact.shape[0] > top_k:
+            keep = np.argpartition(-exact, top_k)[:top_k]
+            rows, exact = rows[keep], exact[keep]
+        order: np.ndarray = np.argsort(-exact)
+        return rows[order].tolist(), exact[order].tolist()
+
+    def evaluate_recall(
+        self, queries: np.ndarray | None = None, top_k: int = 10, samples: int = 100, seed: int = 0
+        ) -> dict[str, float]:
+        """
+        recall@top_k and mean ms/query of the configured search (IVF or quantized)
+        against the exact float32 scan. without queries, stored vectors are sampled
+        """
+        with self._lock:
+            matrix: np.ndarray = self._matrix
+            codes: np.ndarray | None = self._codes
+            excluded: np.ndarray = self._deleted.copy()
+        if queries is None:
+            live: np.ndarray = np.flatnonzero(~excluded)
+            if live.shape[0] == 0:
+                return {"recall": 1.0, "exact_ms": 0.0, "search_ms": 0.0}
+            picked: np.ndarray = np.random.default_rng(seed).choice(live, min(samples, live.shape[0]), replace=False)
+            queries = np.asarray(matrix[np.sort(picked)])
+
+        found: int = 0
+        exact_seconds: float = 0.0
+        search_seconds: float = 0.0
+        for query in queries:
+            start: float = time.perf_counter()
+            exact: list[int] = self._search(matrix, excluded, query, top_k)[0]
+            exact_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            rows: list[int] = self._select(matrix, codes, excluded, query, top_k)[0]
+            search_seconds += time.perf_counter() - start
+            found += len(set(exact) & set(rows))
+
+        expected: int = len(queries) * min(top_k, self.node_count)
+        return {
+            "recall": found / expected if expected else 1.0,
+            "exact_ms": exact_seconds * 1000 / len(queries), "search_ms": search_seconds * 1000 / len(queries),
+        }
+
+    def _search(
+        self, matrix: np.ndarray, excluded: np.ndarray, embedding: list[float], top_k: int
+        ) -> tuple[list[int], list[float]]:
+        query: np.ndarray = normalize(np.asarray(embedding, dtype=np.float32))
+        best_rows: np.ndarray = np.zeros(0, dtype=np.int64)
+        best_scores: np.ndarray = np.zeros(0, dtype=np.float32)
+
+        for start in range(0, matrix.shape[0], SCAN_BLOCK_ROWS):
+            scores: np.ndarray = matrix[start:start + SCAN_BLOCK_ROWS] @ query
+            scores[excluded[start:start + SCAN_BLOCK_ROWS]] = -np.inf
+            best_rows = np.concatenate([best_rows, np.arange(start, start + scores.shape[0])])
+            best_scores = np.concatenate([best_scores, scores])
+            if best_scores.shape[0] > top_k:
+                keep: np.ndarray = np.argpartition(-best_scores, top_k)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order: np.ndarray = np.argsort(-best_scores)
+        order = order[np.isfinite(best_scores[order])]
+        return best_rows[order].tolist(), best_scores[order].tolist()
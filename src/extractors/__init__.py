@@ -1,2 +1,3 @@
 from .extractors import *
 from .extraction_router import *
+from .extraction_cache import *
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+import os, json, hashlib, types, functools
+from pathlib import Path
+from threading import Lock, get_ident
+
+from llama_index.core import Document
+
+if TYPE_CHECKING:
+    from llama_index.core.node_parser import TextSplitter
+
+
+
+__all__ = ["ExtractionCache", "config_signature", "file_digest"]
+
+
+CACHE_SIZE_LIMIT: int = 512 * 1024 * 1024
+# larger extractions are not cached, the ingestion pipeline stops collecting them
+ENTRY_SIZE_LIMIT: int = 16 * 1024 * 1024
+HASH_BLOCK_SIZE: int = 1024 * 1024
+SIGNATURE_DEPTH: int = 3
+
+_PRIMITIVES: tuple[type, ...] = (str, int, float, bool, type(None))
+_CALLABLES: tuple[type, ...] = (
+    types.FunctionType, types.BuiltinFunctionType, types.MethodType, functools.partial
+)
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_signature(obj: Any, depth: int = SIGNATURE_DEPTH) -> Any:
+    """
+    stable description of an object's configuration, callables are reduced to
+    their names so the result does not change between processes
+    """
+    if isinstance(obj, _PRIMITIVES):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [config_signature(value, depth) for value in obj]
+    if isinstance(obj, _CALLABLES) or depth == 0:
+        return f"{getattr(obj, '__module__', None)}.{getattr(obj, '__qualname__', type(obj).__qualname__)}"
+
+    state: dict[str, Any] = dict(getattr(obj, "__dict__", {}))
+    state.update(getattr(obj, "__pydantic_private__", None) or {})
+
+    config: dict[str, Any] = {"type": f"{type(obj).__module__}.{type(obj).__qualname__}"}
+    for key, value in sorted(state.items()):
+        config[key] = config_signature(value, depth - 1)
+    return config
+
+
+def _relocate(document: dict[str, Any], file_path: str | None) -> dict[str, Any]:
+    """
+    a cached document as a new one of file_path, entries are shared by every file
+    with the same content so ids are left to be generated and path metadata rewritten
+    """
+    document.pop("id_", None)
+    metadata: dict[str, Any] = document.setdefault("metadata", {})
+    if file_path is None:
+        return document
+    source: str | None = metadata.get("file_path")
+    if source is not None:
+        metadata["file_path"] = file_path
+        if metadata.get("file_type") == source.split(".")[-1]:
+            metadata["file_type"] = file_path.split(".")[-1]
+    if "file_name" in metadata:
+        metadata["file_name"] = file_path.rsplit(".", 1)[0]
+    return document
+
+
+class ExtractionCache:
+    """
+    on disk cache of extracted documents keyed by file content, extractor and
+    splitter configuration, the least recently used entries are evicted once
+    the folder grows past max_bytes. entries over max_entry_bytes are not stored
+    """
+
+    __slots__ = ("folder", "max_bytes", "max_entry_bytes", "size", "lock")
+
+    def __init__(
+        self, folder: str | Path, max_bytes: int = CACHE_SIZE_LIMIT, max_entry_bytes: int = ENTRY_SIZE_LIMIT
+        ) -> None:
+        self.folder: Path = Path(folder)
+        self.max_bytes: int = max_bytes
+        self.max_entry_bytes: int = min(max_entry_bytes, max_bytes)
+        self.lock: Lock = Lock()
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.size: int = sum(entry.stat().st_size for entry in self.folder.glob("*.json"))
+
+    def key(
+        self, file_path: str, extractor_name: str, extractor: Any, splitter: TextSplitter | None,
+        digest: str | None = None
+        ) -> str:
+        """
+        digest is the file_digest of file_path when the caller already has it
+        """
+        signature: str = json.dumps(
+            [extractor_name, config_signature(extractor), config_signature(splitter)], sort_keys=True
+        )
+        return hashlib.sha256(f"{digest or file_digest(file_path)}:{signature}".encode()).hexdigest()
+
+    def get(self, key: str, file_path: str | None = None) -> list[Document] | None:
+        """
+        cached documents with fresh ids, their path metadata pointing at file_path
+        """
+        entry: Path = self.folder / f"{key}.json"
+        try:
+            with open(entry, "r", encoding="utf-8") as file:
+                data: list[dict[str, Any]] = json.load(file)
+            os.utime(entry)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return [Document.from_dict(_relocate(document, file_path)) for document in data]
+
+    def put(self, key: str, documents: list[Document]) -> None:
+        entry: Path = self.folder / f"{key}.json"
+        temp: Path = entry.with_suffix(f".{os.getpid()}.{get_ident()}.tmp")
+        with open(temp, "w", encoding="utf-8") as file:
+            json.dump([_relocate(document.to_dict(), None) for document in documents], file, ensure_ascii=False)
+        if temp.stat().st_size > self.max_entry_bytes:
+            temp.unlink()
+            return
+
+        with self.lock:
+            previous: int = entry.stat().st_size if entry.exists() else 0
+            os.replace(temp, entry)
+            self.size += entry.stat().st_size - previous
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        with self.lock:
+            for entry in self.folder.glob("*.json"):
+                entry.unlink(missing_ok=True)
+            self.size = 0
+
+    def _evict(self) -> None:
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.folder.glob("*.json"):
+            try:
+                stat: os.stat_result = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if self.size <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            self.size -= size
@@ -1,11 +1,15 @@
 from __future__ import annotations
-from typing import Callable, TYPE_CHECKING, TypeAlias, Any, Type
-import mimetypes, traceback
+from typing import Callable, Iterator, TYPE_CHECKING, TypeAlias, Any, Type
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import mimetypes, traceback, enum, os
+
+from threading import Lock
 
 import filetype
 from llama_index.core import Document
 
 from ..flags import EXTRACTION_ERROR_FLAG, ExtractionErrors
+from .extraction_cache import ExtractionCache
 
 if TYPE_CHECKING:
     from llama_index.core.node_parser import TextSplitter
@@ -13,11 +17,39 @@ if TYPE_CHECKING:
 
     
     
-__all__ = ["Extractor", "ExtractionRouter", "SplitExtractor"]
+__all__ = [
+    "Extractor", "ExtractionRouter", "SplitExtractor", "ExecutorMode", "default_workers", 
+    "SOURCE_METADATA", "exclude_source_metadata"
+]
 
 
 Extractor: TypeAlias = Callable[[str], list["Document"]]
 
+# where a chunk comes from, shown to the llm but left out of the embedded text so
+# the same text in another file or page gets the same vector
+SOURCE_METADATA: tuple[str, ...] = (
+    "file_name", "file_path", "file_type", "page_number", "page_count", "sheet_index",
+    "row_start", "row_end", "byte_start", "byte_end"
+)
+
+
+class ExecutorMode(str, enum.Enum):
+    THREAD = "thread"
+    PROCESS = "process"
+    AUTO = "auto"
+
+
+def default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def exclude_source_metadata(nodes: list[BaseNode]) -> None:
+    for node in nodes:
+        node.excluded_embed_metadata_keys = list(dict.fromkeys([*node.excluded_embed_metadata_keys, *SOURCE_METADATA]))
+
+
 def node_to_document(nodes: list[BaseNode]) -> list[Document]:
     return [
         Document(id_=node.id_, text=node.get_content(), metadata=dict(node.metadata)) 
@@ -28,30 +60,108 @@ def node_to_document(nodes: list[BaseNode]) -> list[Document]:
 
 class SplitExtractor:
     
-    __slots__ = ("extractor", "splitter")
+    __slots__ = ("extractor", "splitter", "name", "cpu_bound")
     
-    def __init__(self, extractor: Extractor, splitter: TextSplitter | None = None) -> None:
+    def __init__(
+        self, extractor: Extractor, splitter: TextSplitter | None = None, 
+        name: str = "", cpu_bound: bool = False
+        ) -> None:
         self.extractor: Extractor = extractor
         self.splitter: TextSplitter | None = splitter
+        self.name: str = name
+        self.cpu_bound: bool = cpu_bound
     
-    def run(self, path: str) -> list[Document] | list[BaseNode]:
-        if not self.splitter:
+    def partitions(self, path: str) -> list[tuple[int, int] | None]:
+        """
+        extractors exposing partitions/extract_range can be split into independent jobs
+        """
+        if not hasattr(self.extractor, "partitions"):
+            return [None]
+        return self.extractor.partitions(path) or [None]
+    
+    def documents(self, path: str, part: tuple[int, int] | None = None) -> Iterator[Document] | ExtractionErrors:
+        if part is None:
             return self.extractor(path)
-        return node_to_document(self.splitter.get_nodes_from_documents(self.extractor(path)))
+        return self.extractor.extract_range(path, *part)
+    
+    def run(self, path: str, part: tuple[int, int] | None = None) -> list[Document] | ExtractionErrors:
+        documents: Iterator[Document] | ExtractionErrors = self.documents(path, part)
+        if isinstance(documents, ExtractionErrors):
+            return documents
+        if not self.splitter:
+            return list(documents)
+        # split page by page so streaming extractors are consumed lazily
+        return [
+            split for document in documents 
+            for split in node_to_document(self.splitter.get_nodes_from_documents([document]))
+        ]
+    
+    def split(self, documents: list[Document]) -> list[BaseNode]:
+        if not self.splitter:
+            return documents
+        return self.splitter.get_nodes_from_documents(documents)
+
+
+def run_extractor(
+    extractor: SplitExtractor, path: str, part: tuple[int, int] | None = None
+    ) -> list[Document] | ExtractionErrors:
+    """
+    process pool entry point
+    """
+    try:
+        return extractor.run(path, part)
+    except Exception:
+        traceback.print_exc()
+        return ExtractionErrors.UNKNOWN_ERROR
 
 
 class ExtractionRouter:
     
-    __slots__ = ("extractors", "file_map")
+    __slots__ = ("extractors", "file_map", "cache", "executor_mode", "workers", "process_pool", "pool_lock")
     
-    def __init__(self) -> None:
+    def __init__(
+        self, cache: ExtractionCache | None = None, executor_mode: ExecutorMode | str = ExecutorMode.THREAD,
+        workers: int | None = None
+        ) -> None:
         self.extractors: dict[str, SplitExtractor] = dict()
         self.file_map: dict[str, str] = dict()
+        self.cache: ExtractionCache | None = cache
+        self.executor_mode: ExecutorMode = ExecutorMode(executor_mode)
+        self.workers: int = workers or default_workers()
+        self.process_pool: ProcessPoolExecutor | None = None
+        self.pool_lock: Lock = Lock()
         
-    def add_extractor(self, extractor_name: str, extractor: Extractor, splitter: TextSplitter | None = None) -> None:
+    def add_extractor(
+        self, extractor_name: str, extractor: Extractor, splitter: TextSplitter | None = None, 
+        cpu_bound: bool = False
+        ) -> None:
+        """
+        cpu_bound extractors run in worker processes when the executor mode is auto,
+        the extractor and splitter must then be picklable (module level functions)
+        """
         self.extractors[extractor_name] = SplitExtractor(
-            extractor=extractor, splitter=splitter
+            extractor=extractor, splitter=splitter, name=extractor_name, cpu_bound=cpu_bound
         )
+    
+    def set_executor_mode(self, mode: ExecutorMode | str) -> None:
+        self.executor_mode = ExecutorMode(mode)
+        
+    def uses_process(self, extractor: SplitExtractor) -> bool:
+        if self.executor_mode == ExecutorMode.AUTO:
+            return extractor.cpu_bound
+        return self.executor_mode == ExecutorMode.PROCESS
+    
+    def get_process_pool(self) -> ProcessPoolExecutor:
+        with self.pool_lock:
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor(self.workers)
+            return self.process_pool
+    
+    def shutdown(self) -> None:
+        with self.pool_lock:
+            if self.process_pool is not None:
+                self.process_pool.shutdown()
+                self.process_pool = None
         
     def add_file_mapping(self, extractor_name: str, mime_types: list[str]) -> None:
         if extractor_name not in self.extractors:
@@ -60,18 +170,56 @@ class ExtractionRouter:
         for mime_type in mime_types:
             self.file_map[mime_type] = extractor_name
             
+    def resolve(self, file_path: str) -> SplitExtractor | ExtractionErrors:
+        if "." not in file_path:
+            return ExtractionErrors.FILE_TYPE_NOT_RECOGNIZED
+        file_type: str = file_path.split(".")[-1]
+        if file_type not in self.file_map:
+            return ExtractionErrors.FILE_TYPE_NOT_RECOGNIZED
+        return self.extractors[self.file_map[file_type]]
+    
+    def cache_key(
+        self, file_path: str, extractor: SplitExtractor, part: tuple[int, int] | None = None,
+        digest: str | None = None
+        ) -> str | None:
+        if self.cache is None:
+            return None
+        key: str = self.cache.key(file_path, extractor.name, extractor.extractor, extractor.splitter, digest)
+        if part is not None:
+            key = f"{key}-{part[0]}-{part[1]}"
+        return key
+            
     def extract(self, file_path: str) -> list[Document] | str:
         try:
-            if "." not in file_path:
-                return ExtractionErrors.FILE_TYPE_NOT_RECOGNIZED
-            file_type: str = file_path.split(".")[-1]
-            print(self.extractors[self.file_map[file_type]])
-            if file_type not in self.file_map:
-                return ExtractionErrors.FILE_TYPE_NOT_RECOGNIZED
-            return self.extractors[self.file_map[file_type]].run(file_path)
+            extractor: SplitExtractor | ExtractionErrors = self.resolve(file_path)
+            if isinstance(extractor, ExtractionErrors):
+                return extractor
+            
+            key: str | None = self.cache_key(file_path, extractor)
+            if key is not None and (cached := self.cache.get(key, file_path)) is not None:
+                return cached
+            
+            result: list[Document] | ExtractionErrors
+            if self.uses_process(extractor):
+                result = self.get_process_pool().submit(run_extractor, extractor, file_path).result()
+            else:
+                result = extractor.run(file_path)
+                
+            if key is not None and isinstance(result, list):
+                self.cache.put(key, result)
+            return result
         except Exception as e:
             traceback.print_exc()
             return ExtractionErrors.UNKNOWN_ERROR
+    
+    def extract_many(self, file_paths: list[str]) -> Iterator[tuple[str, list[Document] | ExtractionErrors]]:
+        """
+        yields (path, result) pairs in completion order rather than input order
+        """
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures: dict[Future, str] = {pool.submit(self.extract, path): path for path in file_paths}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
                             
 
 
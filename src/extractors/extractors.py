@@ -1,4 +1,5 @@
-import os
+from typing import Any, BinaryIO, Iterable, Iterator
+import os, csv, io
 
 from .extraction_utils import bytes_to_megabytes, get_mimetype, set_pandoc_env
 from ..flags import ExtractionErrors, EXTRACTION_ERROR_FLAG
@@ -8,7 +9,9 @@ from llama_index.core import Document
 
 __all__ = [
     "excel_extractor", "plain_extractor", "word_extractor", "pdf_extractor", "presentation_extractor",
-    "epub_extractor", "ExtractionErrors", "EXTRACTION_ERROR_FLAG", "FILE_SIZE_LIMIT"
+    "epub_extractor", "ExtractionErrors", "EXTRACTION_ERROR_FLAG", "FILE_SIZE_LIMIT",
+    "PdfPageExtractor", "pdf_page_extractor", "TextStreamExtractor", "plain_stream_extractor",
+    "csv_stream_extractor", "SpreadsheetRowExtractor", "excel_row_extractor"
 ]
 
 set_pandoc_env()
@@ -50,14 +53,98 @@ def excel_extractor(file_path: str) -> list[Document] | str:
     return result
 
 
-def plain_extractor(file_path: str) -> list[Document] | str:
+def rows_to_text(rows: Iterable[Iterable[Any]]) -> str:
+    buffer: io.StringIO = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(["" if value is None else value for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+class SpreadsheetRowExtractor:
     """
-    supports all other text based files
+    reads sheets in row batches (openpyxl read only streaming for xlsx/xlsm) and
+    emits one compact csv Document per batch with the header row repeated, 
+    instead of one padded DataFrame.to_string() per sheet
+    """
+    
+    __slots__ = ("rows_per_document",)
+    
+    STREAMING_TYPES: tuple[str, ...] = (".xlsx", ".xlsm")
+    
+    def __init__(self, rows_per_document: int = 200) -> None:
+        self.rows_per_document: int = rows_per_document
+        
+    def __call__(self, file_path: str) -> Iterator[Document]:
+        sheets: Iterator[tuple[str, Iterator[tuple[Any, ...]]]]
+        if file_path.lower().endswith(self.STREAMING_TYPES):
+            sheets = self._openpyxl_sheets(file_path)
+        else:
+            sheets = self._pandas_sheets(file_path)
+            
+        for index, (name, rows) in enumerate(sheets):
+            yield from self._batches(file_path, index, name, rows)
+            
+    def _openpyxl_sheets(self, file_path: str) -> Iterator[tuple[str, Iterator[tuple[Any, ...]]]]:
+        import openpyxl
+        
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield sheet.title, sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+            
+    def _pandas_sheets(self, file_path: str) -> Iterator[tuple[str, Iterator[tuple[Any, ...]]]]:
+        import pandas as pd
+        
+        for name, data in pd.read_excel(file_path, sheet_name=None, header=None).items():
+            yield str(name), data.astype(object).where(data.notna(), None).itertuples(index=False, name=None)
+    
+    def _batches(
+        self, file_path: str, sheet_index: int, sheet_name: str, rows: Iterator[tuple[Any, ...]]
+        ) -> Iterator[Document]:
+        metadata: dict[str, str | int] = {
+            "file_name":file_path.rsplit(".", 1)[0], "file_path":file_path,
+            "file_type":get_mimetype(file_path), "sheet_index":sheet_index, "sheet_name":sheet_name
+        }
+        header: tuple[Any, ...] | None = None
+        batch: list[tuple[Any, ...]] = []
+        row_start: int = 0
+        
+        for number, row in enumerate(rows, 1):
+            if all(value is None or value == "" for value in row):
+                continue
+            if header is None:
+                header = row
+                continue
+            if not batch:
+                row_start = number
+            batch.append(row)
+            if len(batch) == self.rows_per_document:
+                yield Document(text=rows_to_text([header, *batch]), metadata={
+                    **metadata, "row_start": row_start, "row_end": number
+                })
+                batch = []
+                
+        if batch:
+            yield Document(text=rows_to_text([header, *batch]), metadata={
+                **metadata, "row_start": row_start, "row_end": number
+            })
+
+
+excel_row_extractor: SpreadsheetRowExtractor = SpreadsheetRowExtractor()
+
+
+def plain_extractor(file_path: str) -> list[Document] | Iterator[Document]:
+    """
+    supports all other text based files, files above FILE_SIZE_LIMIT are streamed
     """
     global FILE_SIZE_LIMIT
     
     if bytes_to_megabytes(os.path.getsize(file_path)) > FILE_SIZE_LIMIT:
-        return ExtractionErrors.FILE_SIZE_LIMIT
+        if file_path.lower().endswith(".csv"):
+            return csv_stream_extractor(file_path)
+        return plain_stream_extractor(file_path)
     
     text: str = ""
     with open(file_path, "r") as file:
@@ -71,6 +158,112 @@ def plain_extractor(file_path: str) -> list[Document] | str:
     ]
 
 
+def utf8_boundary(data: bytes) -> int:
+    """
+    length of data without a trailing, incomplete utf-8 sequence
+    """
+    for back in range(1, min(4, len(data)) + 1):
+        byte: int = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte & 0x80:
+            length: int = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if back < length:
+                return len(data) - back
+        break
+    return len(data)
+
+
+def next_line_start(file: BinaryIO, offset: int, block_size: int = 64 * 1024) -> int:
+    file.seek(offset)
+    while block := file.read(block_size):
+        index: int = block.find(b"\n")
+        if index != -1:
+            return offset + index + 1
+        offset += len(block)
+    return offset
+
+
+class TextStreamExtractor:
+    """
+    reads text in fixed size windows cut at line boundaries so memory stays flat
+    no matter how large the file is, every Document carries its byte offsets.
+    repeat_header prefixes every window with the first line (csv column names)
+    """
+    
+    __slots__ = ("window_bytes", "range_bytes", "repeat_header")
+    
+    def __init__(
+        self, window_bytes: int = 1024 * 1024, range_bytes: int = 64 * 1024 * 1024, 
+        repeat_header: bool = False
+        ) -> None:
+        self.window_bytes: int = window_bytes
+        self.range_bytes: int = range_bytes
+        self.repeat_header: bool = repeat_header
+        
+    def __call__(self, file_path: str) -> Iterator[Document]:
+        return self.extract_range(file_path, 0, None)
+    
+    def partitions(self, file_path: str) -> list[tuple[int, int]]:
+        size: int = os.path.getsize(file_path)
+        bounds: list[int] = [0]
+        
+        with open(file_path, "rb") as file:
+            for offset in range(self.range_bytes, size, self.range_bytes):
+                start: int = next_line_start(file, offset - 1)
+                if bounds[-1] < start < size:
+                    bounds.append(start)
+                    
+        bounds.append(size)
+        return list(zip(bounds, bounds[1:]))
+    
+    def extract_range(self, file_path: str, start: int, stop: int | None) -> Iterator[Document]:
+        """
+        start and stop must fall on line starts, as returned by partitions
+        """
+        metadata: dict[str, str | int] = {
+            "file_name":file_path.rsplit(".", 1)[0],
+            "file_path": file_path, "file_type":file_path.split(".")[-1]
+        }
+        
+        with open(file_path, "rb") as file:
+            header: bytes = b""
+            if self.repeat_header:
+                header_end: int = next_line_start(file, 0)
+                file.seek(0)
+                header = file.read(header_end)
+                
+            file.seek(start)
+            position: int = start
+            carry: bytes = b""
+            
+            while True:
+                size: int = self.window_bytes if stop is None else min(self.window_bytes, stop - position - len(carry))
+                block: bytes = file.read(max(size, 0))
+                data: bytes = carry + block
+                if not data:
+                    return
+                
+                cut: int = len(data)
+                if block and (stop is None or position + len(data) < stop):
+                    cut = data.rfind(b"\n") + 1 or utf8_boundary(data)
+                
+                text: bytes = data[:cut]
+                if header and position >= len(header):
+                    text = header + text
+                    
+                yield Document(text=text.decode("utf-8", errors="replace"), metadata={
+                    **metadata, "byte_start": position, "byte_end": position + cut
+                })
+                
+                position += cut
+                carry = data[cut:]
+                
+
+plain_stream_extractor: TextStreamExtractor = TextStreamExtractor()
+csv_stream_extractor: TextStreamExtractor = TextStreamExtractor(repeat_header=True)
+
+
 def word_extractor(file_path: str) -> list[Document] | str:
     """
     supports docx, doc and odf
@@ -101,13 +294,8 @@ def pdf_extractor(file_path: str) -> list[Document] | str:
     
     import fitz
     
-    doc: fitz.Document = fitz.open(file_path)
-    page: fitz.Page = None
-    
-    text: str = ""
-        
-    for page in map(lambda i: doc.load_page(i), range(len(doc))):
-        text += page.get_text() + "\n"
+    with fitz.open(file_path) as doc:
+        text: str = "".join(page.get_text() + "\n" for page in doc)
         
     return [
         Document(
@@ -119,6 +307,51 @@ def pdf_extractor(file_path: str) -> list[Document] | str:
     ]
         
     
+class PdfPageExtractor:
+    """
+    yields one Document per page instead of concatenating the whole file, large
+    files can be partitioned into page ranges and extracted by several workers
+    """
+    
+    __slots__ = ("pages_per_range",)
+    
+    def __init__(self, pages_per_range: int = 100) -> None:
+        self.pages_per_range: int = pages_per_range
+        
+    def __call__(self, file_path: str) -> Iterator[Document]:
+        return self.extract_range(file_path, 0, None)
+    
+    def partitions(self, file_path: str) -> list[tuple[int, int]]:
+        import fitz
+        
+        with fitz.open(file_path) as doc:
+            page_count: int = len(doc)
+            
+        return [
+            (start, min(start + self.pages_per_range, page_count)) 
+            for start in range(0, page_count, self.pages_per_range)
+        ]
+    
+    def extract_range(self, file_path: str, start: int, stop: int | None) -> Iterator[Document]:
+        import fitz
+        
+        metadata: dict[str, str | int] = {
+            "file_name":file_path.rsplit(".", 1)[0], "file_path":file_path,
+            "file_type":get_mimetype(file_path)
+        }
+        
+        with fitz.open(file_path) as doc:
+            metadata["page_count"] = len(doc)
+            for number in range(start, len(doc) if stop is None else min(stop, len(doc))):
+                yield Document(
+                    text=doc.load_page(number).get_text(), 
+                    metadata={**metadata, "page_number": number + 1}
+                )
+
+
+pdf_page_extractor: PdfPageExtractor = PdfPageExtractor()
+        
+    
 def presentation_extractor(file_path: str) -> list[Document] | str:
     
     global FILE_SIZE_LIMIT
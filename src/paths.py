@@ -1,20 +1,50 @@
-import platform
+import os, platform
 from pathlib import Path
 
 
 ROOT: Path = Path(__file__).parent.parent
 
+# every tool folder holds one folder per installed version and a pointer to the
+# active one, a symlink or on windows a text file with the version name
+CURRENT_LINK: str = "current"
+CURRENT_POINTER: str = "current.txt"
+
+
+def current_version(tool_folder: Path) -> str | None:
+    """
+    version the tool folder points at, None for installs from before versioning
+    """
+    link: Path = tool_folder / CURRENT_LINK
+    if link.is_symlink():
+        return os.path.basename(os.readlink(link))
+    pointer: Path = tool_folder / CURRENT_POINTER
+    if pointer.is_file():
+        return pointer.read_text(encoding="utf-8").strip() or None
+    return None
+
+
+def active_folder(tool_folder: Path) -> Path:
+    """
+    install folder of the active version. the symlink itself is returned so paths
+    built on it follow a later switch, installs from before versioning are the tool folder
+    """
+    if (tool_folder / CURRENT_LINK).is_symlink():
+        return tool_folder / CURRENT_LINK
+    version: str | None = current_version(tool_folder)
+    return tool_folder if version is None else tool_folder / version
+
+
 DATA_FOLDER: Path = ROOT / "data" 
 
 BINARIES_FOLDER: Path = DATA_FOLDER / "bin"
-PANDOC_EXE: Path = BINARIES_FOLDER / "pandoc" / "pandoc.exe"
+PANDOC_EXE: Path = active_folder(BINARIES_FOLDER / "pandoc") / "pandoc.exe"
 PORTABLE_OLLAMA: Path = BINARIES_FOLDER / "ollama" / "ollama_portable.bat"
-PORTABLE_OLLAMA_EXE: Path = BINARIES_FOLDER / "ollama"
+PORTABLE_OLLAMA_EXE: Path = active_folder(BINARIES_FOLDER / "ollama")
 
 
 if platform.system().lower() in ("linux", "darwin"):
     PORTABLE_OLLAMA = BINARIES_FOLDER / "ollama" / "ollama_portable.sh"
-    PANDOC_EXE = BINARIES_FOLDER / "pandoc" / "bin" / "pandoc"
+    PANDOC_EXE = active_folder(BINARIES_FOLDER / "pandoc") / "bin" / "pandoc"
     
 if platform.system().lower() == "linux":
     PORTABLE_OLLAMA_EXE = PORTABLE_OLLAMA_EXE / "bin"
@@ -23,5 +53,11 @@ if platform.system().lower() == "linux":
 MODELS_FOLDER: Path = DATA_FOLDER / "ollama_data" / "models"
 OLLAMA_HOME_FOLDER: Path = DATA_FOLDER / "ollama_data" / "ollama_home"
 
+VECTOR_STORE_FOLDER: Path = DATA_FOLDER / "vector_store"
+UPLOAD_FOLDER: Path = DATA_FOLDER / "uploads"
+CACHE_FOLDER: Path = DATA_FOLDER / "cache"
+EXTRACTION_CACHE_FOLDER: Path = CACHE_FOLDER / "extraction"
+EMBEDDING_CACHE_FILE: Path = CACHE_FOLDER / "embeddings.sqlite"
+
 
 
@@ -1,4 +1,8 @@
 
-SERVER_URL: str = "http://localhost:11500"
+SERVER_HOST: str = "localhost"
+SERVER_PORT: int = 11500
+# instances listen on consecutive ports starting at SERVER_PORT and share one models folder
+SERVER_INSTANCES: int = 1
+SERVER_URL: str = f"http://{SERVER_HOST}:{SERVER_PORT}"
 EMBEDDING_MODEL_NAME: str = "nomic-embed-text:latest"
 BASE_MODEL: str = "Qwen3-ABL-1.7b:latest"
@@ -1,38 +1,314 @@
-from typing import Any, Callable, Iterable
-import subprocess, os, json
+from __future__ import annotations
+from typing import Any, AsyncIterator, Callable, Iterable, Literal
+import re, sys, time, codecs, asyncio
 from queue import Queue
 from threading import Thread
 
+from pydantic import BaseModel
+
 from .paths import PORTABLE_OLLAMA
 
 
+
+MAX_CONCURRENT_PULLS: int = 2
+READ_SIZE: int = 4096
+TERMINATE_TIMEOUT: float = 5.0
+# weight of the newest sample in the smoothed download rate
+RATE_SMOOTHING: float = 0.3
+
+# ollama redraws its progress bars with cursor escapes and carriage returns
+_ANSI: re.Pattern = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_LINE_BREAK: re.Pattern = re.compile(r"[\r\n]+")
+_SIZE: str = r"(\d+(?:\.\d+)?)\s*([KMGT]?i?B)"
+_PROGRESS: re.Pattern = re.compile(rf"{_SIZE}\s*/\s*{_SIZE}")
+_RATE: re.Pattern = re.compile(rf"{_SIZE}/s")
+_ETA: re.Pattern = re.compile(r"(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?\s*$")
+_UNITS: dict[str, int] = {
+    "B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+    "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+}
+
+_IDLE: object = object()
+
+
 status_queue: Queue = Queue()
 
 
-def download_model(model_name: str) -> None:
-    
-    process = subprocess.Popen(
-        [PORTABLE_OLLAMA, "pull", model_name],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
+class PullEvent(BaseModel):
+    model: str
+    kind: Literal["queued", "status", "progress", "done", "failed", "cancelled"]
+    status: str = ""
+    completed: int | None = None
+    total: int | None = None
+    rate: float | None = None
+    eta: float | None = None
+    returncode: int | None = None
+
+
+def default_pull_command() -> list[str]:
+    if sys.platform == "win32":
+        return [str(PORTABLE_OLLAMA)]
+    return ["bash", str(PORTABLE_OLLAMA)]
+
+
+def _bytes(value: str, unit: str) -> int:
+    return int(float(value) * _UNITS[unit])
+
+
+def parse_progress(model: str, line: str) -> PullEvent | None:
+    """
+    event of one cleaned `ollama pull` line such as
+    "pulling 8934d96d3f08... 45% ▕██  ▏ 1.7 GB/3.8 GB  25 MB/s  1m23s"
+    """
+    line = line.strip()
+    if not line:
+        return None
+    progress: re.Match | None = _PROGRESS.search(line)
+    if progress is None:
+        return PullEvent(model=model, kind="status", status=line)
+
+    status: str = line.split("...", 1)[0].strip() if "..." in line else line[:progress.start()].strip()
+    event: PullEvent = PullEvent(
+        model=model, kind="progress", status=status,
+        completed=_bytes(*progress.group(1, 2)), total=_bytes(*progress.group(3, 4))
     )
-    
-    process.wait()
+    rate: re.Match | None = _RATE.search(line, progress.end())
+    if rate is not None:
+        event.rate = float(_bytes(*rate.group(1, 2)))
+        eta: re.Match | None = _ETA.search(line, rate.end())
+        if eta is not None and any(eta.groups()):
+            hours, minutes, seconds = (int(part or 0) for part in eta.groups())
+            event.eta = float(hours * 3600 + minutes * 60 + seconds)
+    return event
+
+
+class ModelPullManager:
+    """
+    runs `ollama pull` for several models at once, at most max_concurrent at a time.
+    the progress bars ollama prints are parsed into PullEvents that every events()
+    iterator receives. pulling a model that is already being pulled joins the
+    running pull and cancel() stops the process. must be used from one event loop
+    """
+
+    __slots__ = ("command", "env", "max_concurrent", "semaphore", "pulls", "running", "latest", "subscribers")
+
+    def __init__(
+        self, command: list[str] | None = None, max_concurrent: int = MAX_CONCURRENT_PULLS,
+        env: dict[str, str] | None = None
+        ) -> None:
+        self.command: list[str] = command or default_pull_command()
+        self.env: dict[str, str] | None = env
+        self.max_concurrent: int = max_concurrent
+        self.semaphore: asyncio.Semaphore | None = None
+        self.pulls: dict[str, asyncio.Task] = dict()
+        # models whose final event is not published yet
+        self.running: set[str] = set()
+        self.latest: dict[str, PullEvent] = dict()
+        self.subscribers: list[asyncio.Queue] = []
+
+    @property
+    def active(self) -> list[str]:
+        return sorted(self.running)
+
+    def pull(self, model: str) -> asyncio.Task:
+        """
+        starts pulling the model unless it already is, the task returns the final event
+        """
+        task: asyncio.Task | None = self.pulls.get(model)
+        if task is not None and not task.done():
+            return task
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        task = asyncio.get_running_loop().create_task(self._run(model), name=f"pull-{model}")
+        self.pulls[model] = task
+        self.running.add(model)
+        return task
+
+    async def pull_all(self, models: Iterable[str]) -> dict[str, PullEvent]:
+        """
+        pulls every model and returns the final event of each
+        """
+        tasks: dict[str, asyncio.Task] = {model: self.pull(model) for model in dict.fromkeys(models)}
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return {model: self.latest[model] for model in tasks}
+
+    def cancel(self, model: str) -> bool:
+        task: asyncio.Task | None = self.pulls.get(model)
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    def status(self, model: str) -> PullEvent | None:
+        return self.latest.get(model)
 
+    async def events(self, until_idle: bool = True) -> AsyncIterator[PullEvent]:
+        """
+        status updates of every pull as they happen. with until_idle the iteration
+        ends once no pull is running
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self.subscribers.append(queue)
+        try:
+            if until_idle and not self.running:
+                return
+            while True:
+                item: PullEvent | object = await queue.get()
+                if item is _IDLE:
+                    if until_idle and not self.running:
+                        return
+                    continue
+                yield item
+        finally:
+            self.subscribers.remove(queue)
+
+    def _publish(self, event: PullEvent) -> None:
+        self.latest[event.model] = event
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def _finish(self, event: PullEvent) -> PullEvent:
+        self.running.discard(event.model)
+        self._publish(event)
+        for queue in self.subscribers:
+            queue.put_nowait(_IDLE)
+        return event
+
+    async def _run(self, model: str) -> PullEvent:
+        self._publish(PullEvent(model=model, kind="queued"))
+        process: asyncio.subprocess.Process | None = None
+        try:
+            async with self.semaphore:
+                process = await self._spawn(model)
+                last: PullEvent | None = await self._read(model, process)
+                returncode: int = await process.wait()
+        except asyncio.CancelledError:
+            if process is not None and process.returncode is None:
+                await self._terminate(process)
+            self._finish(PullEvent(model=model, kind="cancelled"))
+            raise
+        except OSError as e:
+            return self._finish(PullEvent(model=model, kind="failed", status=str(e)))
+
+        if returncode != 0:
+            # the last line ollama printed is its error message
+            status: str = last.status if last is not None else ""
+            return self._finish(PullEvent(model=model, kind="failed", status=status, returncode=returncode))
+        return self._finish(PullEvent(model=model, kind="done", status="success", returncode=returncode))
+
+    async def _spawn(self, model: str) -> asyncio.subprocess.Process:
+        spawn: asyncio.Future = asyncio.ensure_future(asyncio.create_subprocess_exec(
+            *self.command, "pull", model, env=self.env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        ))
+        try:
+            return await asyncio.shield(spawn)
+        except asyncio.CancelledError:
+            # a process started while the pull was cancelled would be left running
+            try:
+                await self._terminate(await spawn)
+            except OSError:
+                pass
+            raise
+
+    async def _read(self, model: str, process: asyncio.subprocess.Process) -> PullEvent | None:
+        decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending: str = ""
+        last: PullEvent | None = None
+        last_line: str = ""
+        sample: tuple[str, int, float] | None = None
+
+        while True:
+            chunk: bytes = await process.stdout.read(READ_SIZE)
+            pending += _ANSI.sub("", decoder.decode(chunk, final=not chunk))
+            lines: list[str] = _LINE_BREAK.split(pending)
+            # the last piece may be a line that is still being written
+            pending = lines.pop() if chunk else ""
+            if not chunk:
+                lines.append(pending)
+
+            for line in lines:
+                # every redraw repeats the bar, unchanged ones are dropped
+                line = line.strip()
+                if line == last_line:
+                    continue
+                event: PullEvent | None = parse_progress(model, line)
+                if event is None:
+                    continue
+                last_line = line
+                if event.kind == "progress":
+                    sample = self._estimate(event, sample, last)
+                last = event
+                self._publish(event)
+            if not chunk:
+                return last
+
+    def _estimate(
+        self, event: PullEvent, sample: tuple[str, int, float] | None, last: PullEvent | None
+        ) -> tuple[str, int, float]:
+        """
+        fills in rate and eta when the line had none from the bytes done since the
+        previous line of the same layer
+        """
+        now: float = time.monotonic()
+        if event.rate is None and sample is not None and sample[0] == event.status:
+            elapsed: float = now - sample[2]
+            if elapsed > 0 and event.completed >= sample[1]:
+                rate: float = (event.completed - sample[1]) / elapsed
+                previous: float | None = last.rate if last is not None and last.status == event.status else None
+                event.rate = rate if previous is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * previous
+        if event.eta is None and event.rate:
+            event.eta = max(event.total - event.completed, 0) / event.rate
+        return (event.status, event.completed, now)
+
+    async def _terminate(self, process: asyncio.subprocess.Process) -> None:
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), TERMINATE_TIMEOUT)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def pull_models(
+    models: Iterable[str], command: list[str] | None = None, max_concurrent: int = MAX_CONCURRENT_PULLS,
+    report: Callable[[PullEvent], None] | None = None
+    ) -> dict[str, PullEvent]:
+    """
+    pulls the models concurrently, report is called with every event, returns the
+    final event of each model
+    """
+    manager: ModelPullManager = ModelPullManager(command, max_concurrent)
+    tasks: dict[str, asyncio.Task] = {model: manager.pull(model) for model in dict.fromkeys(models)}
+    if report is not None:
+        async for event in manager.events():
+            report(event)
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return {model: manager.latest[model] for model in tasks}
+
+
+def download_model(model_name: str) -> None:
+    """
+    blocking pull that reports its return code on status_queue
+    """
+    async def pull() -> PullEvent:
+        return await ModelPullManager().pull(model_name)
+
+    event: PullEvent = asyncio.run(pull())
     status_queue.put({
         "download_model": model_name,
-        "return": process.returncode,
+        "return": event.returncode if event.returncode is not None else 1,
     })
-    
-    
-    
-    
+
+
+
+
 def run_worker(
-    target: Callable[..., None], args: Iterable[Any] | None = None, 
+    target: Callable[..., None], args: Iterable[Any] | None = None,
     kwargs: dict[str, Any] | None = None, daemon: bool = True
     ) -> None:
     t: Thread = Thread(target=target, args=args, kwargs=kwargs, daemon=daemon)
     t.start()
-    
-    
\ No newline at end of file
+
+
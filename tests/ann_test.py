@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import numpy as np
+from pathlib import Path
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from src.chat_model.ann import IVFIndex, IVF_FILE, MIN_NPROBE, default_probe_count
+from src.chat_model.vector_store import MmapVectorStore, normalize
+
+
+DIMENSIONS: int = 32
+
+
+def clustered(rows: int, seed: int = 0, spread: float = 0.3) -> np.ndarray:
+    rng: np.random.Generator = np.random.default_rng(seed)
+    centers: np.ndarray = rng.normal(size=(64, DIMENSIONS))
+    points: np.ndarray = centers[rng.integers(0, 64, rows)] + spread * rng.normal(size=(rows, DIMENSIONS))
+    return normalize(points.astype(np.float32))
+
+
+def make_nodes(vectors: np.ndarray, offset: int = 0) -> list[TextNode]:
+    return [
+        TextNode(id_=f"node-{offset + i}", text=f"text {offset + i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def recall(index: IVFIndex, matrix: np.ndarray, queries: np.ndarray) -> float:
+    excluded: np.ndarray = np.zeros(matrix.shape[0], dtype=bool)
+    recalls: list[float] = []
+    for query in queries:
+        exact: set[int] = set(np.argsort(-(matrix @ query))[:10].tolist())
+        rows, scores = index.search(matrix, excluded, query, 10)
+        assert scores == sorted(scores, reverse=True)
+        recalls.append(len(exact & set(rows)) / 10)
+    return float(np.mean(recalls))
+
+
+def test_ivf_recall_against_exact(tmp_path: Path) -> None:
+    matrix: np.ndarray = clustered(20_000)
+    index: IVFIndex = IVFIndex(tmp_path, nlist=64, nprobe=8)
+    index.train(matrix)
+
+    assert recall(index, matrix, clustered(50, seed=1)) >= 0.9
+
+
+def test_default_probes_keep_recall_on_loose_clusters(tmp_path: Path) -> None:
+    # overlapping clusters, a fixed 8 of the sqrt(rows) lists only finds about 3/4
+    matrix: np.ndarray = clustered(20_000, spread=1.2)
+    index: IVFIndex = IVFIndex(tmp_path)
+    index.train(matrix)
+
+    assert index.probes == default_probe_count(len(index.lists)) > MIN_NPROBE
+    assert recall(index, matrix, clustered(50, seed=1, spread=1.2)) >= 0.9
+
+
+def test_store_uses_ivf_incrementally(tmp_path: Path) -> None:
+    vectors: np.ndarray = clustered(6_000)
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, index_type="ivf", nlist=32, nprobe=32)
+    for start in range(0, 5_000, 1_000):
+        store.add(make_nodes(vectors[start:start + 1_000], start))
+
+    assert store.ann.trained
+    assert (tmp_path / IVF_FILE).exists()
+    store.add(make_nodes(vectors[5_000:], 5_000))
+    store.delete_nodes(["node-5500"])
+
+    reopened: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, index_type="ivf", nlist=32, nprobe=32)
+    assert reopened.ann.covered == 6_000
+
+    # probing every list makes the search exact
+    for row in (10, 5_400, 5_999):
+        result = reopened.query(VectorStoreQuery(query_embedding=vectors[row].tolist(), similarity_top_k=1))
+        assert result.ids == [f"node-{row}"]
+    result = reopened.query(VectorStoreQuery(query_embedding=vectors[5_500].tolist(), similarity_top_k=1))
+    assert result.ids != ["node-5500"]
+
+
+def test_small_store_falls_back_to_exact_scan(tmp_path: Path) -> None:
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, index_type="ivf")
+    store.add(make_nodes(clustered(100)))
+    assert not store.ann.trained
+
+    store.clear()
+    assert not (tmp_path / IVF_FILE).exists()
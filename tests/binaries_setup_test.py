@@ -0,0 +1,294 @@
+from __future__ import annotations
+import io, os, json, hashlib, tarfile, threading, zipfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+import binaries_setup
+from binaries_setup import download_file, download_all, cache_path, load_release_assets, safe_extract_archive
+from src.paths import active_folder, current_version
+
+
+PAYLOAD: bytes = bytes(range(256)) * 4096
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    release server stand-in: serves files with Range support and can cut the first
+    response of a file short to simulate a dropped connection
+    """
+
+    files: dict[str, bytes] = {}
+    drop_after: dict[str, int] = {}
+    requests: list[tuple[str, str | None]] = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.requests.append((self.path, self.headers.get("Range")))
+        if self.path.endswith("/releases/latest"):
+            body: bytes = json.dumps({"assets": [
+                {"name": "tool-linux.tar.gz", "browser_download_url": "http://x/tool-linux.tar.gz",
+                 "size": 3, "digest": "sha256:" + "ab" * 32},
+                {"name": "tool.txt", "browser_download_url": "http://x/tool.txt"},
+                {"name": "tool-windows.zip", "browser_download_url": "http://x/tool-windows.zip"},
+            ]}).encode()
+            self._send(200, body, {})
+            return
+
+        data: bytes | None = self.files.get(self.path)
+        if data is None:
+            self._send(404, b"", {})
+            return
+
+        start: int = 0
+        if (header := self.headers.get("Range")) is not None:
+            start = int(header.removeprefix("bytes=").split("-")[0])
+            if start >= len(data):
+                self._send(416, b"", {})
+                return
+        body = data[start:]
+        headers: dict[str, str] = {}
+        if start:
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if (cut := self.drop_after.pop(self.path, None)) is not None:
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.connection.close()
+            return
+        self.wfile.write(body)
+
+    def _send(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    StandIn.files = {"/a.tar.gz": PAYLOAD, "/b.zip": PAYLOAD[::-1]}
+    StandIn.drop_after = {}
+    StandIn.requests = []
+    monkeypatch.setattr(binaries_setup, "RETRY_BACKOFF", 0.0)
+    httpd: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread: threading.Thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_dropped_download_resumes_with_range(server: str, tmp_path: Path) -> None:
+    # the read that hits the drop is lost, the chunks before it are kept
+    StandIn.drop_after["/a.tar.gz"] = 600_000
+    path: Path = download_file(f"{server}/a.tar.gz", sha256(PAYLOAD), tmp_path)
+
+    assert path.read_bytes() == PAYLOAD
+    assert StandIn.requests == [("/a.tar.gz", None), ("/a.tar.gz", f"bytes={binaries_setup.START_CHUNK_SIZE}-")]
+    assert not path.with_name(path.name + ".part").exists()
+
+
+def test_partial_file_survives_restarts(server: str, tmp_path: Path) -> None:
+    url: str = f"{server}/a.tar.gz"
+    part: Path = cache_path(url, tmp_path).with_name("a.tar.gz.part")
+    part.parent.mkdir(parents=True)
+    part.write_bytes(PAYLOAD[:5000])
+
+    assert download_file(url, sha256(PAYLOAD), tmp_path).read_bytes() == PAYLOAD
+    assert StandIn.requests == [("/a.tar.gz", "bytes=5000-")]
+
+
+def test_checksum_mismatch_discards_download(server: str, tmp_path: Path) -> None:
+    url: str = f"{server}/a.tar.gz"
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        download_file(url, sha256(b"something else"), tmp_path)
+
+    assert not cache_path(url, tmp_path).exists()
+    assert not cache_path(url, tmp_path).with_name("a.tar.gz.part").exists()
+
+
+def test_cached_artifacts_skip_the_network(server: str, tmp_path: Path) -> None:
+    assets: list[dict] = [
+        {"url": f"{server}/a.tar.gz", "sha256": sha256(PAYLOAD)},
+        {"url": f"{server}/b.zip", "sha256": sha256(PAYLOAD[::-1])},
+    ]
+    first: list[Path] = download_all(assets, tmp_path)
+    assert [path.read_bytes() for path in first] == [PAYLOAD, PAYLOAD[::-1]]
+    assert len(StandIn.requests) == 2
+
+    assert download_all(assets, tmp_path) == first
+    assert len(StandIn.requests) == 2
+
+
+def test_release_assets_carry_digests(server: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(binaries_setup, "ARCHIVE_TYPES", (".tar.gz", ".zip"))
+    assets: list[dict] = load_release_assets("owner", "tool", api=server)
+
+    assert [asset["name"] for asset in assets] == ["tool-linux.tar.gz", "tool-windows.zip"]
+    assert assets[0]["sha256"] == "ab" * 32 and assets[1]["sha256"] is None
+
+
+def make_tar(path: Path, members: list[tuple[str, bytes | None]], links: dict[str, tuple[str, bytes]] | None = None) -> Path:
+    """
+    members with None content are folders, links maps a name to (target, tarfile link type)
+    """
+    with tarfile.open(path, "w:gz") as archive:
+        for name, content in members:
+            info: tarfile.TarInfo = tarfile.TarInfo(name)
+            if content is None:
+                info.type, info.mode = tarfile.DIRTYPE, 0o755
+                archive.addfile(info)
+            else:
+                info.size, info.mode = len(content), 0o755
+                archive.addfile(info, io.BytesIO(content))
+        for name, (target, kind) in (links or {}).items():
+            info = tarfile.TarInfo(name)
+            info.type, info.linkname = kind, target
+            archive.addfile(info)
+    return path
+
+
+def test_zip_wrapper_is_stripped_in_parallel(tmp_path: Path) -> None:
+    archive: Path = tmp_path / "tool.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("tool-1.0/", "")
+        for i in range(20):
+            z.writestr(f"tool-1.0/lib/part{i}.bin", PAYLOAD[i:])
+        executable: zipfile.ZipInfo = zipfile.ZipInfo("tool-1.0/bin/tool")
+        executable.external_attr = 0o755 << 16
+        z.writestr(executable, b"#!/bin/sh\n")
+
+    safe_extract_archive(str(archive), str(tmp_path / "out"))
+
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == ["bin", "lib"]
+    assert (tmp_path / "out" / "lib" / "part7.bin").read_bytes() == PAYLOAD[7:]
+    assert os.access(tmp_path / "out" / "bin" / "tool", os.X_OK)
+
+
+def test_tar_wrapper_is_stripped_with_links(tmp_path: Path) -> None:
+    archive: Path = make_tar(
+        tmp_path / "tool.tar.gz",
+        [("pandoc-3.1/", None), ("pandoc-3.1/bin/pandoc", b"binary")],
+        {"pandoc-3.1/bin/pandoc-lua": ("pandoc", tarfile.SYMTYPE),
+         "pandoc-3.1/bin/pandoc-server": ("pandoc-3.1/bin/pandoc", tarfile.LNKTYPE)}
+    )
+    safe_extract_archive(str(archive), str(tmp_path / "out"))
+
+    out: Path = tmp_path / "out"
+    assert (out / "bin" / "pandoc").read_bytes() == b"binary"
+    assert os.readlink(out / "bin" / "pandoc-lua") == "pandoc"
+    assert (out / "bin" / "pandoc-server").read_bytes() == b"binary"
+    assert not (tmp_path / "out" / "__extract_tmp__").exists()
+
+
+def test_tar_without_wrapper_keeps_layout(tmp_path: Path) -> None:
+    # the first member looks like a wrapper until lib/ shows up
+    archive: Path = make_tar(tmp_path / "ollama.tgz", [
+        ("./bin/", None), ("./bin/ollama", b"ollama"), ("./bin/bin/inner", b"inner"),
+        ("./lib/ollama/libggml.so", b"lib"),
+    ])
+    safe_extract_archive(str(archive), str(tmp_path / "out"))
+
+    out: Path = tmp_path / "out"
+    assert sorted(path.name for path in out.iterdir()) == ["bin", "lib"]
+    assert (out / "bin" / "ollama").read_bytes() == b"ollama"
+    assert (out / "bin" / "bin" / "inner").read_bytes() == b"inner"
+    assert (out / "lib" / "ollama" / "libggml.so").read_bytes() == b"lib"
+
+
+@pytest.mark.parametrize("name", ["../evil.txt", "/etc/evil.txt", "tool/../../evil.txt", "C:/evil.txt"])
+def test_path_traversal_is_rejected(tmp_path: Path, name: str) -> None:
+    archive: Path = tmp_path / "bad.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr(name, b"evil")
+    with pytest.raises(ValueError, match="Unsafe"):
+        safe_extract_archive(str(archive), str(tmp_path / "out"))
+
+    tar: Path = make_tar(tmp_path / "bad.tar.gz", [(name, b"evil")])
+    with pytest.raises(ValueError, match="Unsafe"):
+        safe_extract_archive(str(tar), str(tmp_path / "out"))
+    assert not (tmp_path / "evil.txt").exists()
+
+
+def test_links_out_of_the_destination_are_rejected(tmp_path: Path) -> None:
+    archive: Path = make_tar(
+        tmp_path / "bad.tar.gz", [("tool/bin", None)], {"tool/bin/escape": ("../../../outside", tarfile.SYMTYPE)}
+    )
+    with pytest.raises(ValueError, match="Unsafe link"):
+        safe_extract_archive(str(archive), str(tmp_path / "out"))
+
+
+def install(tmp_path: Path, tool_dir: Path, version: str, keep: int = binaries_setup.KEEP_VERSIONS) -> Path:
+    archive: Path = make_tar(tmp_path / f"tool-{version}.tar.gz", [(f"tool-{version}/bin/tool", version.encode())])
+    return binaries_setup.install_version(archive, tool_dir, version, keep)
+
+
+def test_versions_install_side_by_side_and_roll_back(tmp_path: Path) -> None:
+    tool_dir: Path = tmp_path / "bin" / "tool"
+    install(tmp_path, tool_dir, "v1")
+    executable: Path = active_folder(tool_dir) / "bin" / "tool"
+    assert executable.read_bytes() == b"v1"
+
+    install(tmp_path, tool_dir, "v2")
+    # a path resolved before the switch follows it
+    assert executable.read_bytes() == b"v2"
+    assert binaries_setup.installed_versions(tool_dir) == ["v1", "v2"]
+
+    assert binaries_setup.rollback_version(tool_dir) == "v1"
+    assert current_version(tool_dir) == "v1"
+    assert executable.read_bytes() == b"v1"
+    with pytest.raises(ValueError, match="No earlier"):
+        binaries_setup.rollback_version(tool_dir)
+    with pytest.raises(FileNotFoundError):
+        binaries_setup.rollback_version(tool_dir, "v9")
+
+
+def test_failed_install_keeps_the_active_version(tmp_path: Path) -> None:
+    tool_dir: Path = tmp_path / "tool"
+    install(tmp_path, tool_dir, "v1")
+    broken: Path = make_tar(tmp_path / "broken.tar.gz", [("../evil", b"evil")])
+
+    with pytest.raises(ValueError):
+        binaries_setup.install_version(broken, tool_dir, "v2")
+    assert current_version(tool_dir) == "v1"
+    assert sorted(path.name for path in tool_dir.iterdir()) == ["current", "v1"]
+
+
+def test_old_versions_are_pruned_but_never_the_active_one(tmp_path: Path) -> None:
+    tool_dir: Path = tmp_path / "tool"
+    for version in ("v1", "v2", "v3"):
+        install(tmp_path, tool_dir, version)
+    assert binaries_setup.installed_versions(tool_dir) == ["v2", "v3"]
+
+    binaries_setup.rollback_version(tool_dir, "v2")
+    assert binaries_setup.prune_versions(tool_dir, keep=1) == ["v3"]
+    assert binaries_setup.installed_versions(tool_dir) == ["v2"]
+    assert not any(path.name.startswith(".pruned") for path in tool_dir.iterdir())
+
+
+def test_flat_install_is_adopted_as_a_version(tmp_path: Path) -> None:
+    tool_dir: Path = tmp_path / "ollama"
+    (tool_dir / "bin").mkdir(parents=True)
+    (tool_dir / "bin" / "tool").write_bytes(b"old")
+    (tool_dir / "ollama_portable.sh").write_text("launcher")
+    assert active_folder(tool_dir) == tool_dir
+
+    install(tmp_path, tool_dir, "v2")
+    assert (tool_dir / "ollama_portable.sh").exists()
+    assert binaries_setup.installed_versions(tool_dir) == [binaries_setup.LEGACY_VERSION, "v2"]
+    binaries_setup.rollback_version(tool_dir)
+    assert (active_folder(tool_dir) / "bin" / "tool").read_bytes() == b"old"
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from pathlib import Path
+from llama_index.core import VectorStoreIndex, MockEmbedding
+from llama_index.core.schema import TextNode
+from llama_index.core.llms import MockLLM
+
+from src.chat_model.bm25 import BM25Index, BM25_FILE, tokenize
+from src.chat_model.chat_model import create_rag_tool, load_keywords
+from src.chat_model.retrieval import CachedRetriever, HybridRetriever, reciprocal_rank_fusion
+from src.chat_model.vector_store import MmapVectorStore
+
+
+DIMENSIONS: int = 8
+
+
+def make_nodes(texts: list[str]) -> list[TextNode]:
+    return [TextNode(id_=f"node-{i}", text=text, embedding=[1.0] * DIMENSIONS) for i, text in enumerate(texts)]
+
+
+TEXTS: list[str] = [
+    "the pump failed with error code ERR-4471 after restart",
+    "part number PN/8812.B ships in boxes of ten",
+    "quarterly revenue grew in every region",
+    "the pump was restarted twice during the night",
+]
+
+
+def test_tokenize_keeps_identifiers_and_parts() -> None:
+    assert tokenize("Error ERR-4471 on PN/8812.B") == [
+        "error", "err-4471", "err", "4471", "on", "pn/8812.b", "pn", "8812", "b"
+    ]
+
+
+def test_search_ranks_exact_identifiers(tmp_path: Path) -> None:
+    index: BM25Index = BM25Index(tmp_path)
+    index.add(make_nodes(TEXTS))
+
+    assert index.search("what does err-4471 mean", 2)[0][0] == "node-0"
+    assert index.search("PN/8812.B", 1)[0][0] == "node-1"
+    assert [node_id for node_id, _ in index.search("pump restart", 4)] == ["node-0", "node-3"]
+    assert index.search("unrelated words", 4) == []
+
+
+def test_persistence_and_deletes(tmp_path: Path) -> None:
+    index: BM25Index = BM25Index(tmp_path)
+    index.add(make_nodes(TEXTS))
+    index.save()
+    assert (tmp_path / BM25_FILE).exists()
+
+    index.delete(["node-0"])
+    index.add([TextNode(id_="node-9", text="ERR-4471 was fixed by the firmware update")])
+    assert index.search("err-4471", 4)[0][0] == "node-9"
+    index.save()
+
+    reopened: BM25Index = BM25Index(tmp_path)
+    assert reopened.metrics["documents"] == 4
+    assert [node_id for node_id, _ in reopened.search("err-4471", 4)] == ["node-9"]
+    assert reopened.search("pump", 4)[0][0] == "node-3"
+
+    reopened.clear()
+    assert not (tmp_path / BM25_FILE).exists()
+
+
+def test_reciprocal_rank_fusion() -> None:
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=1)
+    assert [node_id for node_id, _ in fused] == ["c", "a", "b", "d"]
+
+
+def test_rag_tool_fuses_keyword_hits(tmp_path: Path) -> None:
+    embedding: MockEmbedding = MockEmbedding(embed_dim=DIMENSIONS)
+    keywords: BM25Index = BM25Index(tmp_path)
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    tool, index = create_rag_tool(MockLLM(), embedding, "docs", 1, store, keywords)
+
+    nodes: list[TextNode] = make_nodes(TEXTS)
+    keywords.add(nodes)
+    index.insert_nodes(nodes)
+
+    retriever = tool.query_engine.retriever
+    assert isinstance(retriever, CachedRetriever) and isinstance(retriever.retriever, HybridRetriever)
+    # every vector is the same, only the keyword side can tell the chunks apart
+    results = retriever.retrieve("PN/8812.B")
+    assert [result.node.node_id for result in results] == ["node-1"]
+
+
+def test_hybrid_retriever_reads_docstore_of_in_memory_index(tmp_path: Path) -> None:
+    embedding: MockEmbedding = MockEmbedding(embed_dim=DIMENSIONS)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    nodes: list[TextNode] = make_nodes(TEXTS)
+    keywords: BM25Index = BM25Index(tmp_path)
+    keywords.add(nodes)
+    index.insert_nodes(nodes)
+
+    retriever: HybridRetriever = HybridRetriever(index.as_retriever(similarity_top_k=1), keywords, index, 2)
+    assert "node-0" in [result.node.node_id for result in retriever.retrieve("ERR-4471")]
+
+
+def test_load_keywords_catches_up_with_the_store(tmp_path: Path) -> None:
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    nodes: list[TextNode] = make_nodes(TEXTS)
+    store.add(nodes[:3])
+    keywords: BM25Index = BM25Index(tmp_path)
+    keywords.add(nodes[:3])
+    keywords.save()
+
+    # the process died after these changes reached the store but before the keyword index was saved
+    store.delete_nodes(["node-0"])
+    store.add(nodes[3:])
+
+    loaded: BM25Index = load_keywords(tmp_path, store)
+    assert sorted(loaded.documents) == ["node-1", "node-2", "node-3"]
+    assert loaded.search("err-4471", 4) == []
+    assert [node_id for node_id, _ in loaded.search("pump", 4)] == ["node-3"]
+    assert BM25Index(tmp_path).metrics["documents"] == 3
@@ -7,11 +7,15 @@ warnings.filterwarnings("ignore")
 
 import pytest
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core import MockEmbedding
 from llama_index.core.node_parser import LangchainNodeParser
 
-from src.chat_model import ChatModel, ModelParams
+from llama_index.core.agent.workflow import AgentStream, ToolCall
+
+from src.chat_model import ChatModel, ModelParams, ChatEvent
 from src.extractors import *
 from src import variables
+from tests.fakes import FakeAgent, make_model
 
 if TYPE_CHECKING:
     from llama_index.core import Document
@@ -22,7 +26,7 @@ def strip_all_ws(s: str) -> str:
 
 
 
-def test_chat_model(printer) -> None:
+def test_chat_model(printer, tmp_path) -> None:
     splitter: LangchainNodeParser = LangchainNodeParser(
         RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=100)
     )
@@ -31,7 +35,7 @@ def test_chat_model(printer) -> None:
     router.add_extractor("text", plain_extractor, splitter)
     router.add_file_mapping("text", ["txt", "csv", "text"])
 
-    model: ChatModel = ChatModel(router)  
+    model: ChatModel = ChatModel(router, store_folder=tmp_path / "store", embedding_cache_file=tmp_path / "embeddings.sqlite")
     params: ModelParams = ModelParams(
         temperature=0.7, context_window=32000, rag_top_k=4, 
         history_tokens=5120, long_term_memory=True, long_term_tokens=5120, 
@@ -45,3 +49,54 @@ def test_chat_model(printer) -> None:
     printer(result)
     
     
+    
+    
+def stream_events(prompt_text: str) -> list:
+    return [
+        AgentStream(delta="", response="", current_agent_name="agent", thinking_delta="hmm"),
+        ToolCall(tool_name="RAGSearch", tool_kwargs={"input": "q"}, tool_id="1"),
+        AgentStream(delta="Hel", response="Hel", current_agent_name="agent"),
+        AgentStream(delta="lo", response="Hello", current_agent_name="agent"),
+    ]
+
+
+def test_stream(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    model: ChatModel = make_model(monkeypatch, tmp_path, FakeAgent(lambda prompt_text, memory: "Hello", stream_events))
+    
+    events: list[ChatEvent] = list(model.stream("hi"))
+    
+    assert [event.kind for event in events] == ["thinking", "tool_call", "token", "token", "done"]
+    assert "".join(event.text for event in events if event.kind == "token") == "Hello"
+    assert events[1].tool_name == "RAGSearch"
+    assert events[-1].text == "Hello"
+    
+    
+def test_stream_cancel(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    agent: FakeAgent = FakeAgent(lambda prompt_text, memory: "Hello", stream_events, delay=0.2)
+    model: ChatModel = make_model(monkeypatch, tmp_path, agent)
+    
+    stream = model.stream("hi")
+    assert next(stream).kind == "thinking"
+    stream.close()
+    
+    assert agent.handlers[0].cancelled
+
+
+def test_load_model_sizes_the_store_from_the_embedding(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setattr(ChatModel, "run_ollama_server", lambda self: None)
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("text", plain_extractor, LangchainNodeParser(RecursiveCharacterTextSplitter(chunk_size=64, chunk_overlap=0)))
+    router.add_file_mapping("text", ["txt"])
+    file = tmp_path / "notes.txt"
+    file.write_text("the refund policy is thirty days")
+
+    model: ChatModel = make_model(monkeypatch, tmp_path, router=router)
+    model.embedding = MockEmbedding(embed_dim=768)
+    model.load_model(variables.BASE_MODEL)
+    assert model.vector_store.vector_store.dimensions == 768
+    assert model.add_documents([str(file)]) is None
+
+    other: ChatModel = make_model(monkeypatch, tmp_path, router=router)
+    other.embedding = MockEmbedding(embed_dim=384)
+    with pytest.raises(ValueError, match="holds 768 wide vectors"):
+        other.load_model(variables.BASE_MODEL)
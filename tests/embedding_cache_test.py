@@ -0,0 +1,138 @@
+from __future__ import annotations
+import asyncio, threading
+
+import pytest
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core import VectorStoreIndex
+from llama_index.core.node_parser import LangchainNodeParser
+
+from src.chat_model.embedding_cache import CachedEmbedding
+from src.chat_model.ingestion import IngestionPipeline
+from src.extractors import ExtractionRouter, plain_extractor
+from tests.fakes import CountingEmbedding
+
+
+class LengthEmbedding(CountingEmbedding):
+    """
+    text vectors hold the text length and query vectors ones, so results show where they came from
+    """
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        super()._get_text_embeddings(texts)
+        return [[float(len(text))] * self.embed_dim for text in texts]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        super()._get_query_embedding(query)
+        return [1.0] * self.embed_dim
+
+
+def test_batch_is_deduplicated(tmp_path: Path) -> None:
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite")
+
+    result: list[list[float]] = embedding.get_text_embedding_batch(["header", "body", "header", "footer", "header"])
+
+    assert inner._texts == ["header", "body", "footer"]
+    assert result[0] == result[2] == result[4] == [6.0] * 4
+    assert embedding.stats["deduplicated"] == 2
+    assert embedding.stats["misses"] == 3
+
+
+def test_cache_persists_between_instances(tmp_path: Path) -> None:
+    CachedEmbedding(LengthEmbedding(embed_dim=4), tmp_path / "embeddings.sqlite").get_text_embedding_batch(["a", "bb"])
+
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite")
+    result: list[list[float]] = embedding.get_text_embedding_batch(["bb", "ccc"])
+
+    assert inner._texts == ["ccc"]
+    assert result == [[2.0] * 4, [3.0] * 4]
+    assert embedding.stats["hit_rate"] == 0.5
+
+
+def test_query_and_text_are_cached_apart(tmp_path: Path) -> None:
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite")
+
+    assert embedding.get_text_embedding("abc") == [3.0] * 4
+    assert embedding.get_query_embedding("abc") == [1.0] * 4
+    assert embedding.get_query_embedding("abc") == [1.0] * 4
+    assert inner._texts == ["abc"] and inner._queries == ["abc"]
+
+
+def test_least_recently_used_are_evicted(tmp_path: Path) -> None:
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite", max_entries=2)
+
+    embedding.get_text_embedding("a")
+    embedding.get_text_embedding("b")
+    embedding.get_text_embedding("a")
+    embedding.get_text_embedding("c")
+    inner._texts.clear()
+
+    embedding.get_text_embedding_batch(["a", "c", "b"])
+    assert inner._texts == ["b"]
+
+
+def test_entry_count_survives_reopening(tmp_path: Path) -> None:
+    CachedEmbedding(LengthEmbedding(embed_dim=4), tmp_path / "embeddings.sqlite").get_text_embedding_batch(["a", "b"])
+
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite", max_entries=3)
+    embedding.get_text_embedding("b")
+    embedding.get_text_embedding_batch(["c", "d"])
+    inner._texts.clear()
+
+    embedding.get_text_embedding_batch(["b", "c", "d", "a"])
+    assert inner._texts == ["a"]
+    assert embedding._count == embedding._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 3
+
+
+def test_async_lookups_leave_the_event_loop(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    threads: list[threading.Thread] = []
+    lookup = CachedEmbedding._lookup
+
+    def recording_lookup(self: CachedEmbedding, keys: list[bytes]) -> dict:
+        threads.append(threading.current_thread())
+        return lookup(self, keys)
+
+    monkeypatch.setattr(CachedEmbedding, "_lookup", recording_lookup)
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite")
+
+    async def run() -> list[list[float]]:
+        await embedding.aget_query_embedding("abc")
+        return await embedding.aget_text_embedding_batch(["ab", "ab", "abc"])
+
+    assert asyncio.run(run()) == [[2.0] * 4, [2.0] * 4, [3.0] * 4]
+    assert asyncio.run(run()) == [[2.0] * 4, [2.0] * 4, [3.0] * 4]
+    assert inner._texts == ["ab", "abc"] and inner._queries == ["abc"]
+    assert len(threads) == 4 and threading.main_thread() not in threads
+
+
+def test_text_shared_by_files_is_embedded_once(tmp_path: Path) -> None:
+    footer: str = "Contoso Ltd, all rights reserved"
+    files: list[str] = []
+    for name in ("report", "invoice"):
+        file: Path = tmp_path / f"{name}.txt"
+        file.write_text(f"the {name} body text of this file\n\n{footer}")
+        files.append(str(file))
+
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=40, chunk_overlap=0)
+    )
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("text", plain_extractor, splitter)
+    router.add_file_mapping("text", ["txt"])
+    inner: LengthEmbedding = LengthEmbedding(embed_dim=4)
+    embedding: CachedEmbedding = CachedEmbedding(inner, tmp_path / "embeddings.sqlite")
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+
+    assert IngestionPipeline(router, embedding, index).run(files) == []
+
+    assert inner._texts.count(footer) == 1
+    assert len(index.index_struct.nodes_dict) == 4
+    stored = [index.docstore.get_node(node_id) for node_id in index.index_struct.nodes_dict.values()]
+    assert {node.metadata["file_path"] for node in stored if node.get_content() == footer} == set(files)
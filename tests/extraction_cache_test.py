@@ -0,0 +1,160 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import os
+
+import pytest
+from pathlib import Path
+
+from src.extractors import *
+from src.chat_model.ingestion import IngestionPipeline
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core.node_parser import LangchainNodeParser
+from llama_index.core import Document, VectorStoreIndex, MockEmbedding
+
+
+TEST_FILE_FOLDER: Path = Path(__file__).parent / "docs"
+
+
+class CountingExtractor:
+    
+    calls: int = 0
+
+    def __call__(self, file_path: str) -> list[Document]:
+        CountingExtractor.calls += 1
+        return plain_extractor(file_path)
+
+
+def make_router(cache: ExtractionCache, extractor: CountingExtractor, chunk_size: int = 32) -> ExtractionRouter:
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    )
+    router: ExtractionRouter = ExtractionRouter(cache)
+    router.add_extractor("text", extractor, splitter)
+    router.add_file_mapping("text", ["txt", "csv", "text"])
+    return router
+
+
+def test_cache_hit_skips_extractor(tmp_path: Path) -> None:
+    CountingExtractor.calls = 0
+    extractor: CountingExtractor = CountingExtractor()
+    router: ExtractionRouter = make_router(ExtractionCache(tmp_path / "cache"), extractor)
+    path: str = str(TEST_FILE_FOLDER / "age.csv")
+
+    first: list[Document] = router.extract(path)
+    second: list[Document] = router.extract(path)
+
+    assert extractor.calls == 1
+    assert [doc.text for doc in first] == [doc.text for doc in second]
+    assert [doc.metadata for doc in first] == [doc.metadata for doc in second]
+
+
+def test_cache_invalidates_on_key_change(tmp_path: Path) -> None:
+    cache: ExtractionCache = ExtractionCache(tmp_path / "cache")
+    CountingExtractor.calls = 0
+    extractor: CountingExtractor = CountingExtractor()
+    file: Path = tmp_path / "notes.txt"
+    file.write_text("first version of the file")
+
+    make_router(cache, extractor).extract(str(file))
+    make_router(cache, extractor, chunk_size=64).extract(str(file))
+    assert extractor.calls == 2
+
+    file.write_text("second version of the file")
+    result: list[Document] = make_router(cache, extractor).extract(str(file))
+    assert extractor.calls == 3
+    assert result[0].text.startswith("second")
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache: ExtractionCache = ExtractionCache(tmp_path / "cache")
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, [Document(text="x" * 500)])
+        os.utime(cache.folder / f"{key}.json", (i, i))
+    cache.max_bytes = cache.size + 100
+
+    assert cache.get("a") is not None
+    cache.put("d", [Document(text="x" * 500)])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("d") is not None
+    assert cache.size <= cache.max_bytes
+
+
+def test_pipeline_uses_cache(tmp_path: Path) -> None:
+    CountingExtractor.calls = 0
+    extractor: CountingExtractor = CountingExtractor()
+    router: ExtractionRouter = make_router(ExtractionCache(tmp_path / "cache"), extractor)
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    path: str = str(TEST_FILE_FOLDER / "age.csv")
+
+    first: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    IngestionPipeline(router, embedding, first).run([path])
+    second: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    IngestionPipeline(router, embedding, second).run([path])
+
+    assert extractor.calls == 1
+    assert len(second.index_struct.nodes_dict) == len(first.index_struct.nodes_dict) > 0
+
+
+def test_cache_hits_become_nodes_of_the_requesting_file(tmp_path: Path) -> None:
+    CountingExtractor.calls = 0
+    router: ExtractionRouter = make_router(ExtractionCache(tmp_path / "cache"), CountingExtractor())
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    text: str = "\n".join(f"line {i} of a file that was copied" for i in range(20))
+    paths: list[str] = []
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text(text)
+        paths.append(str(tmp_path / name))
+
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    for path in paths:
+        IngestionPipeline(router, embedding, index).run([path])
+
+    assert CountingExtractor.calls == 1
+    nodes = index.docstore.get_nodes(list(index.index_struct.nodes_dict.values()))
+    by_path: dict[str, int] = {path: sum(node.metadata["file_path"] == path for node in nodes) for path in paths}
+    assert by_path[paths[0]] == by_path[paths[1]] > 0
+    assert len(nodes) == 2 * by_path[paths[0]]
+    assert router.extract(paths[1])[0].metadata["file_path"] == paths[1]
+
+
+def test_partitions_share_one_file_digest(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.chat_model import ingestion
+
+    digests: list[str] = []
+    def counting_digest(file_path: str) -> str:
+        digests.append(file_path)
+        return file_digest(file_path)
+    monkeypatch.setattr(ingestion, "file_digest", counting_digest)
+
+    path: Path = tmp_path / "rows.csv"
+    path.write_text("\n".join(f"{i},row number {i}" for i in range(1000)))
+    router: ExtractionRouter = make_router(ExtractionCache(tmp_path / "cache"), CountingExtractor())
+    router.add_extractor("stream", TextStreamExtractor(window_bytes=256, range_bytes=1024), router.extractors["text"].splitter)
+    router.add_file_mapping("stream", ["csv"])
+    assert len(router.extractors["stream"].partitions(str(path))) > 10
+
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    errors: list[str] = IngestionPipeline(router, embedding, VectorStoreIndex([], embed_model=embedding)).run([str(path)])
+    assert errors == [] and digests == [str(path)]
+
+
+def test_streamed_files_over_the_entry_limit_are_not_collected(tmp_path: Path) -> None:
+    cache: ExtractionCache = ExtractionCache(tmp_path / "cache", max_entry_bytes=4096)
+    router: ExtractionRouter = make_router(cache, CountingExtractor())
+    router.add_extractor("stream", TextStreamExtractor(window_bytes=256), router.extractors["text"].splitter)
+    router.add_file_mapping("stream", ["csv"])
+    large: Path = tmp_path / "large.csv"
+    large.write_text("\n".join(f"{i},row number {i}" for i in range(2000)))
+    small: Path = tmp_path / "small.csv"
+    small.write_text("1,one row")
+
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    assert IngestionPipeline(router, embedding, index).run([str(large), str(small)]) == []
+
+    assert len(list((tmp_path / "cache").glob("*.json"))) == 1
+    assert len(index.index_struct.nodes_dict) > 100
+    cache.put("direct", [Document(text="x" * 8192)])
+    assert cache.get("direct") is None
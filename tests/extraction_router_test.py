@@ -3,8 +3,52 @@ from typing import TYPE_CHECKING
 import re
 
 import pytest
+from pathlib import Path
 
 from src.extractors import *
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core.node_parser import LangchainNodeParser
 
 if TYPE_CHECKING:
-    from llama_index.core import Document
\ No newline at end of file
+    from llama_index.core import Document
+
+
+TEST_FILE_FOLDER: Path = Path(__file__).parent / "docs"
+
+
+def make_router(mode: str) -> ExtractionRouter:
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=256, chunk_overlap=0)
+    )
+    router: ExtractionRouter = ExtractionRouter(executor_mode=mode, workers=2)
+    router.add_extractor("text", plain_extractor, splitter)
+    router.add_extractor("pdf", pdf_extractor, splitter, cpu_bound=True)
+    router.add_file_mapping("text", ["txt", "csv", "text"])
+    router.add_file_mapping("pdf", ["pdf"])
+    return router
+
+
+@pytest.mark.parametrize("mode", ["thread", "process", "auto"])
+def test_extract_many(mode: str) -> None:
+    router: ExtractionRouter = make_router(mode)
+    paths: list[str] = [
+        str(TEST_FILE_FOLDER / "test.pdf"), str(TEST_FILE_FOLDER / "age.csv"), str(TEST_FILE_FOLDER / "missing")
+    ]
+    
+    try:
+        results: dict[str, list[Document] | ExtractionErrors] = dict(router.extract_many(paths))
+    finally:
+        router.shutdown()
+    
+    assert set(results) == set(paths)
+    assert results[paths[2]] == ExtractionErrors.FILE_TYPE_NOT_RECOGNIZED
+    assert len(results[paths[0]]) > 1
+    assert "Lorem ipsum" in results[paths[0]][0].text
+    assert "Under 18" in results[paths[1]][0].text
+
+
+def test_auto_mode_uses_processes_for_cpu_bound() -> None:
+    router: ExtractionRouter = make_router("auto")
+    
+    assert router.uses_process(router.extractors["pdf"])
+    assert not router.uses_process(router.extractors["text"])
@@ -161,4 +161,123 @@ Prefer Not to Answer,Prefer Not to Answer
     
     assert EXTRACTION_ERROR_FLAG == ExtractionErrors.SUCCESS
     assert strip_all_ws(target) == strip_all_ws(test_data)
-    
\ No newline at end of file
+        
+    
+    
+def make_pdf(path: Path, pages: int) -> None:
+    import fitz
+    
+    with fitz.open() as doc:
+        for i in range(pages):
+            doc.new_page().insert_text((72, 72), f"page text {i + 1}")
+        doc.save(str(path))
+    
+    
+def test_pdf_page_extractor(tmp_path: Path) -> None:
+    path: Path = tmp_path / "pages.pdf"
+    make_pdf(path, 5)
+    
+    data: list[Document] = list(pdf_page_extractor(str(path)))
+    
+    assert [doc.metadata["page_number"] for doc in data] == [1, 2, 3, 4, 5]
+    assert [doc.text.strip() for doc in data] == [f"page text {i}" for i in range(1, 6)]
+    
+    
+def test_pdf_page_partitions(tmp_path: Path) -> None:
+    path: Path = tmp_path / "pages.pdf"
+    make_pdf(path, 5)
+    extractor: PdfPageExtractor = PdfPageExtractor(pages_per_range=2)
+    
+    partitions: list[tuple[int, int]] = extractor.partitions(str(path))
+    data: list[Document] = [doc for part in partitions for doc in extractor.extract_range(str(path), *part)]
+    
+    assert partitions == [(0, 2), (2, 4), (4, 5)]
+    assert [doc.metadata["page_number"] for doc in data] == [1, 2, 3, 4, 5]
+    
+    
+def test_pdf_page_router(tmp_path: Path) -> None:
+    path: Path = tmp_path / "pages.pdf"
+    make_pdf(path, 3)
+    
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("pdf", PdfPageExtractor(pages_per_range=1), LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=2048, chunk_overlap=100)
+    ))
+    router.add_file_mapping("pdf", ["pdf"])
+    
+    data: list[Document] = router.extract(str(path))
+    
+    assert [doc.metadata["page_number"] for doc in data] == [1, 2, 3]
+    
+    
+def test_text_stream_extractor(tmp_path: Path) -> None:
+    path: Path = tmp_path / "log.txt"
+    content: str = "".join(f"línea {i} ✓ {'x' * (i % 7)}\n" for i in range(500))
+    path.write_bytes(content.encode("utf-8"))
+    extractor: TextStreamExtractor = TextStreamExtractor(window_bytes=256, range_bytes=1000)
+    
+    data: list[Document] = list(extractor(str(path)))
+    
+    assert len(data) > 1
+    assert "".join(doc.text for doc in data) == content
+    assert all(doc.text.endswith("\n") for doc in data)
+    assert data[0].metadata["byte_start"] == 0
+    assert all(a.metadata["byte_end"] == b.metadata["byte_start"] for a, b in zip(data, data[1:]))
+    assert data[-1].metadata["byte_end"] == path.stat().st_size
+    
+    partitions: list[tuple[int, int]] = extractor.partitions(str(path))
+    parts: list[Document] = [doc for part in partitions for doc in extractor.extract_range(str(path), *part)]
+    
+    assert len(partitions) > 1
+    assert "".join(doc.text for doc in parts) == content
+    
+    
+def test_text_stream_long_line(tmp_path: Path) -> None:
+    path: Path = tmp_path / "line.txt"
+    content: str = "é" * 1000
+    path.write_bytes(content.encode("utf-8"))
+    
+    data: list[Document] = list(TextStreamExtractor(window_bytes=101)(str(path)))
+    
+    assert len(data) > 1
+    assert "".join(doc.text for doc in data) == content
+    
+    
+def test_csv_stream_repeats_header() -> None:
+    data: list[Document] = list(TextStreamExtractor(window_bytes=64, repeat_header=True)(str(TEST_FILE_FOLDER / "age.csv")))
+    
+    assert len(data) > 1
+    assert all(doc.text.startswith("Age,Age 2") for doc in data)
+    
+    
+def test_plain_extractor_streams_large_files(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.extractors import extractors
+    
+    monkeypatch.setattr(extractors, "FILE_SIZE_LIMIT", -1)
+    data: list[Document] = list(plain_extractor(str(TEST_FILE_FOLDER / "age.csv")))
+    
+    assert data[0].metadata["byte_start"] == 0
+    assert "Under 18" in data[0].text
+    
+    
+def test_excel_row_extractor() -> None:
+    data: list[Document] = list(SpreadsheetRowExtractor(rows_per_document=3)(str(TEST_FILE_FOLDER / "age.xlsx")))
+    
+    assert [doc.metadata["sheet_name"] for doc in data] == ["age"] * 3 + ["Sheet1"] * 3
+    assert [(doc.metadata["row_start"], doc.metadata["row_end"]) for doc in data[:3]] == [(2, 4), (5, 7), (8, 9)]
+    assert data[0].text == "Age\nUnder 18\n18-24\n25-34\n"
+    assert data[5].text == "Age 2\n65 or Above\nPrefer Not to Answer\n"
+    
+    
+def test_excel_row_extractor_pandas_fallback(tmp_path: Path) -> None:
+    import pandas as pd
+    
+    path: Path = tmp_path / "table.ods"
+    try:
+        pd.DataFrame({"part": ["A-1", "B-2", "C-3"], "count": [1, 2, None]}).to_excel(path, index=False)
+    except (ImportError, ValueError):
+        pytest.skip("no ods writer available")
+    
+    data: list[Document] = list(SpreadsheetRowExtractor(rows_per_document=2)(str(path)))
+    
+    assert [doc.text for doc in data] == ["part,count\nA-1,1\nB-2,2\n", "part,count\nC-3,\n"]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import Any, Callable
+import asyncio
+
+import pytest
+from llama_index.core import VectorStoreIndex, MockEmbedding
+from llama_index.core.llms import ChatMessage
+
+from src.chat_model import ChatModel, ModelParams
+from src.chat_model import chat_model as chat_model_module
+from src.extractors import ExtractionRouter
+
+
+TEST_PARAMS: ModelParams = ModelParams(
+    temperature=0.7, context_window=4096, rag_top_k=4, history_tokens=1024,
+    long_term_memory=False, long_term_tokens=1024, top_k_memory=4
+)
+
+
+class CountingEmbedding(MockEmbedding):
+    """
+    mock embedding recording the size of every text batch, the texts and the queries it embeds
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._batches: list[int] = []
+        self._texts: list[str] = []
+        self._queries: list[str] = []
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        self._batches.append(len(texts))
+        self._texts.extend(texts)
+        return super()._get_text_embeddings(texts)
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        self._queries.append(query)
+        return super()._get_query_embedding(query)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._get_text_embeddings(texts)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+
+class FakeMemory:
+
+    def __init__(self) -> None:
+        self.messages: list[ChatMessage] = []
+
+    async def aput_messages(self, messages: list[ChatMessage]) -> None:
+        self.messages.extend(messages)
+
+    async def aget_all(self) -> list[ChatMessage]:
+        return list(self.messages)
+
+
+class FakeHandler:
+    """
+    workflow handler that streams events delay seconds apart and, once awaited,
+    answers with result and records the turn in memory like an agent run does
+    """
+
+    def __init__(
+        self, events: list, result: str | Callable[[], str], delay: float = 0.0,
+        prompt_text: str | None = None, memory: Any = None
+        ) -> None:
+        self.events = events
+        self.result = result
+        self.delay = delay
+        self.prompt_text = prompt_text
+        self.memory = memory
+        self.cancelled: bool = False
+        self.finished: bool = False
+
+    async def stream_events(self):
+        for event in self.events:
+            await asyncio.sleep(self.delay)
+            yield event
+
+    def __await__(self):
+        async def result() -> str:
+            await asyncio.sleep(self.delay)
+            answer: str = self.result() if callable(self.result) else self.result
+            if self.memory is not None and self.prompt_text is not None:
+                await self.memory.aput_messages([
+                    ChatMessage(role="user", content=self.prompt_text), ChatMessage(role="assistant", content=answer)
+                ])
+            self.finished = True
+            return answer
+        return result().__await__()
+
+    def done(self) -> bool:
+        return self.finished
+
+    async def cancel_run(self) -> None:
+        self.cancelled = True
+
+
+class FakeAgent:
+    """
+    agent whose runs stream events(prompt) and answer reply(prompt, memory),
+    by default nothing and the prompt itself
+    """
+
+    name: str = "Agent"
+
+    def __init__(
+        self, reply: Callable[[str, Any], str] | None = None, events: Callable[[str], list] | None = None,
+        delay: float = 0.0
+        ) -> None:
+        self.reply = reply or (lambda prompt_text, memory: prompt_text)
+        self.events = events or (lambda prompt_text: [])
+        self.delay = delay
+        self.runs: int = 0
+        self.memories: set[int] = set()
+        self.handlers: list[FakeHandler] = []
+
+    def run(self, prompt_text: str, memory=None) -> FakeHandler:
+        self.runs += 1
+        self.memories.add(id(memory))
+        handler: FakeHandler = FakeHandler(
+            self.events(prompt_text), lambda: self.reply(prompt_text, memory), self.delay, prompt_text, memory
+        )
+        self.handlers.append(handler)
+        return handler
+
+
+def make_model(
+    monkeypatch: pytest.MonkeyPatch, tmp_path, agent: FakeAgent | None = None,
+    router: ExtractionRouter | None = None
+    ) -> ChatModel:
+    """
+    chat model with test parameters, fake memories and a mock embedding over an
+    empty in-memory index, no ollama server is needed
+    """
+    monkeypatch.setattr(chat_model_module, "make_cutsom_memory", lambda **kwargs: FakeMemory())
+    model: ChatModel = ChatModel(
+        router or ExtractionRouter(), store_folder=tmp_path / "store", embedding_cache_file=tmp_path / "embeddings.sqlite"
+    )
+    model.load_parameters(TEST_PARAMS)
+    model.agent = agent or FakeAgent()
+    model.memory = model.new_memory()
+    model.embedding = MockEmbedding(embed_dim=8)
+    model.vector_store = VectorStoreIndex([], embed_model=model.embedding)
+    return model
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import pytest
+from pathlib import Path
+
+from src.extractors import *
+from src.chat_model.ingestion import IngestionPipeline
+from src.chat_model.bm25 import BM25Index, BM25_FILE
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core.node_parser import LangchainNodeParser
+from llama_index.core import VectorStoreIndex, MockEmbedding
+
+from tests.fakes import CountingEmbedding
+
+if TYPE_CHECKING:
+    from llama_index.core.embeddings import BaseEmbedding
+
+
+TEST_FILE_FOLDER: Path = Path(__file__).parent / "docs"
+
+
+class FailingEmbedding(MockEmbedding):
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if any("poison" in text for text in texts):
+            raise RuntimeError("embedding server went away")
+        return super()._get_text_embeddings(texts)
+
+
+def make_router() -> ExtractionRouter:
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=64, chunk_overlap=0)
+    )
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("text", plain_extractor, splitter)
+    router.add_file_mapping("text", ["txt", "csv", "text"])
+    return router
+
+
+def test_pipeline_inserts_batches(tmp_path: Path) -> None:
+    file: Path = tmp_path / "lines.txt"
+    file.write_text("\n".join(f"line number {i} of the test file" for i in range(200)))
+
+    embedding: CountingEmbedding = CountingEmbedding(embed_dim=8)
+    embedding.embed_batch_size = 1000
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    pipeline: IngestionPipeline = IngestionPipeline(make_router(), embedding, index, batch_size=16)
+
+    errors: list[str] = pipeline.run([str(file), str(TEST_FILE_FOLDER / "age.csv")])
+
+    assert errors == []
+    assert len(index.index_struct.nodes_dict) == sum(embedding._batches)
+    assert max(embedding._batches) <= 16
+    assert len(embedding._batches) > 1
+
+
+def test_pipeline_feeds_keyword_index(tmp_path: Path) -> None:
+    file: Path = tmp_path / "codes.txt"
+    file.write_text("\n".join(f"error code E-{i:04d} means the sensor {i} is offline" for i in range(50)))
+
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    keywords: BM25Index = BM25Index(tmp_path)
+    IngestionPipeline(make_router(), embedding, index, keywords=keywords).run([str(file)])
+
+    assert keywords.metrics["documents"] == len(index.index_struct.nodes_dict)
+    assert (tmp_path / BM25_FILE).exists()
+    node_id, _ = keywords.search("E-0042", 1)[0]
+    assert "E-0042" in index.docstore.get_node(node_id).get_content()
+
+
+def test_pipeline_reports_failures(tmp_path: Path) -> None:
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    pipeline: IngestionPipeline = IngestionPipeline(make_router(), embedding, index)
+
+    missing: str = str(tmp_path / "missing.txt")
+    errors: list[str] = pipeline.run([
+        missing, str(TEST_FILE_FOLDER / "test.pdf"), str(TEST_FILE_FOLDER / "age.csv")
+    ])
+
+    assert errors == [missing, str(TEST_FILE_FOLDER / "test.pdf")]
+    assert len(index.index_struct.nodes_dict) > 0
+
+
+def test_pipeline_embedding_errors_fail_only_their_files(tmp_path: Path) -> None:
+    good: Path = tmp_path / "good.txt"
+    good.write_text("\n".join(f"line number {i} of the good file" for i in range(20)))
+    bad: Path = tmp_path / "bad.txt"
+    bad.write_text("a poison line that the embedding rejects")
+
+    embedding: FailingEmbedding = FailingEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    inserted: dict[str, list[str]] = dict()
+    pipeline: IngestionPipeline = IngestionPipeline(make_router(), embedding, index, batch_size=1)
+
+    errors: list[str] = pipeline.run([str(bad), str(good)], inserted)
+
+    assert errors == [str(bad)]
+    assert str(bad) not in inserted
+    assert len(inserted[str(good)]) == len(index.index_struct.nodes_dict) > 1
+
+
+def test_pipeline_process_mode() -> None:
+    router: ExtractionRouter = make_router()
+    router.add_extractor("pdf", pdf_extractor, router.extractors["text"].splitter, cpu_bound=True)
+    router.add_file_mapping("pdf", ["pdf"])
+    router.set_executor_mode("auto")
+
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    try:
+        errors: list[str] = IngestionPipeline(router, embedding, index).run([
+            str(TEST_FILE_FOLDER / "test.pdf"), str(TEST_FILE_FOLDER / "age.csv")
+        ])
+    finally:
+        router.shutdown()
+
+    assert errors == []
+    texts: list[str] = [node.get_content() for node in index.docstore.docs.values()]
+    assert any("Lorem ipsum" in text for text in texts)
+    assert any("Under 18" in text for text in texts)
+
+
+def test_pipeline_partitions_large_pdf(tmp_path: Path) -> None:
+    import fitz
+
+    path: Path = tmp_path / "manual.pdf"
+    with fitz.open() as doc:
+        for i in range(9):
+            doc.new_page().insert_text((72, 72), f"manual page {i + 1}")
+        doc.save(str(path))
+
+    router: ExtractionRouter = make_router()
+    router.add_extractor("pdf", PdfPageExtractor(pages_per_range=2), router.extractors["text"].splitter)
+    router.add_file_mapping("pdf", ["pdf"])
+
+    embedding: MockEmbedding = MockEmbedding(embed_dim=8)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    errors: list[str] = IngestionPipeline(router, embedding, index).run([str(path)])
+
+    assert errors == []
+    pages: list[int] = sorted(node.metadata["page_number"] for node in index.docstore.docs.values())
+    assert pages == list(range(1, 10))
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import json, asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from llama_index.core.agent.workflow import AgentStream
+
+from main import create_app, build_router
+from src.chat_model import ChatModel, SessionManager
+from tests.fakes import FakeAgent, make_model
+
+
+def words(prompt_text: str) -> list[AgentStream]:
+    return [AgentStream(delta=word, response="", current_agent_name="agent") for word in prompt_text.split()]
+
+
+def make_app(monkeypatch: pytest.MonkeyPatch, tmp_path, delay: float = 0.0, **kwargs):
+    agent: FakeAgent = FakeAgent(lambda prompt_text, memory: prompt_text.upper(), words, delay)
+    model: ChatModel = make_model(monkeypatch, tmp_path, agent, build_router())
+    return create_app(SessionManager(model), upload_folder=tmp_path / "uploads", **kwargs)
+
+
+def test_chat(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    with TestClient(make_app(monkeypatch, tmp_path)) as client:
+        response = client.post("/chat", json={"message": "hello there"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["response"] == "HELLO THERE"
+
+        again = client.post("/chat", json={"message": "hi", "session_id": body["session_id"]})
+        assert again.json()["session_id"] == body["session_id"]
+
+
+def test_chat_stream(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    with TestClient(make_app(monkeypatch, tmp_path)) as client:
+        with client.stream("POST", "/chat/stream", json={"message": "one two"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            frames: list[str] = [frame for frame in response.read().decode().split("\n\n") if frame]
+
+    kinds: list[str] = [frame.split("\n")[0].removeprefix("event: ") for frame in frames]
+    assert kinds == ["token", "token", "done"]
+    assert json.loads(frames[-1].split("\n")[1].removeprefix("data: "))["text"] == "ONE TWO"
+
+
+def test_busy_server_returns_429(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    app = make_app(monkeypatch, tmp_path, delay=0.3, max_concurrent=1, max_queued=1)
+
+    async def burst() -> list[int]:
+        transport: httpx.ASGITransport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(
+                client.post("/chat", json={"message": f"m{i}", "session_id": f"s{i}"}) for i in range(4)
+            ))
+        return sorted(response.status_code for response in responses)
+
+    try:
+        assert asyncio.run(burst()) == [200, 200, 429, 429]
+        assert app.state.gate.metrics["rejected"] == 2
+    finally:
+        app.state.sessions.shutdown()
+
+
+def test_stream_slot_is_released_when_the_client_is_gone(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    app = make_app(monkeypatch, tmp_path, max_concurrent=1, max_queued=0)
+    scope: dict = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/chat/stream", "raw_path": b"/chat/stream",
+        "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+
+    async def disconnect_before_the_body() -> None:
+        messages: list[dict] = [{"type": "http.request", "body": b'{"message": "one two"}', "more_body": False}]
+
+        async def receive() -> dict:
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            # the client hung up while the response was being started
+            raise OSError("connection reset")
+
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await app(scope, receive, send)
+            assert app.state.gate.metrics["running"] == 0
+
+    try:
+        asyncio.run(disconnect_before_the_body())
+    finally:
+        app.state.sessions.shutdown()
+
+
+def test_upload_document(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    app = make_app(monkeypatch, tmp_path)
+    with TestClient(app) as client:
+        response = client.post("/documents", params={"filename": "notes.txt"}, content=b"some notes\n" * 50)
+        assert response.status_code == 200
+        assert response.json() == {"filename": "notes.txt", "ingested": True}
+        assert len(app.state.sessions.model.vector_store.index_struct.nodes_dict) > 0
+
+        rejected = client.post("/documents", params={"filename": "image.bmp"}, content=b"data")
+        assert rejected.status_code == 415
+
+
+def test_health_reports_unavailable_backend(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setattr("main.probe", lambda url: False)
+    with TestClient(make_app(monkeypatch, tmp_path)) as client:
+        response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["ollama"] is False
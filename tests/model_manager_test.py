@@ -0,0 +1,163 @@
+from __future__ import annotations
+import sys, json
+
+import pytest
+from pathlib import Path
+
+from model_manager import normalize, parse_list, plan_models, read_manifest, run_batch
+
+
+# ollama stand-in keeping its models in a json file and logging every call
+FAKE_OLLAMA: str = r"""
+import os, sys, json, time
+
+state_path = os.environ["OLLAMA_STATE"]
+command, *args = sys.argv[1:]
+with open(state_path + ".log", "a") as log:
+    log.write(" ".join([command, *args]) + "\n")
+
+def load():
+    with open(state_path) as file:
+        return json.load(file)
+
+models = load()
+
+if command == "list":
+    if os.environ.get("OLLAMA_DOWN"):
+        print("Error: could not connect to ollama app, is it running?")
+        sys.exit(1)
+    print("NAME                 ID              SIZE      MODIFIED")
+    for name in models:
+        print(f"{name}    0a109f422b47    274 MB    2 days ago")
+    sys.exit(0)
+if command == "pull":
+    print("pulling manifest", end="\r", flush=True)
+    time.sleep(0.3)
+    if args[0].startswith("missing"):
+        print("Error: pull model manifest: file does not exist")
+        sys.exit(1)
+    print("success")
+# pulls run in parallel, the state is changed under a lock file
+while True:
+    try:
+        lock = os.open(state_path + ".lock", os.O_CREAT | os.O_EXCL)
+        break
+    except FileExistsError:
+        time.sleep(0.01)
+models = load()
+if command == "pull":
+    models.append(args[0] if ":" in args[0] else args[0] + ":latest")
+elif command == "cp":
+    source = args[0] if ":" in args[0] else args[0] + ":latest"
+    if source not in models:
+        sys.exit(1)
+    models.append(args[1] if ":" in args[1] else args[1] + ":latest")
+elif command == "rm":
+    models.remove(args[0] if ":" in args[0] else args[0] + ":latest")
+
+with open(state_path, "w") as file:
+    json.dump(models, file)
+os.close(lock)
+os.remove(state_path + ".lock")
+"""
+
+MANIFEST: str = """
+[Models]
+
+embedding-name = ""
+embedding-pull = "nomic-embed-text"
+
+llm-name = "Qwen3-ABL-1.7b"
+llm-pull = "huihui_ai/qwen3-abliterated:1.7b-v2-q4_K_M"
+
+coder-name = "coder"
+coder-pull = "qwen2.5-coder:1.5b"
+"""
+
+
+@pytest.fixture
+def ollama(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> tuple[list[str], Path]:
+    script: Path = tmp_path / "ollama.py"
+    script.write_text(FAKE_OLLAMA)
+    state: Path = tmp_path / "state.json"
+    state.write_text(json.dumps(["coder:latest"]))
+    monkeypatch.setenv("OLLAMA_STATE", str(state))
+    (tmp_path / "models.toml").write_text(MANIFEST)
+    return [sys.executable, str(script)], state
+
+
+def calls(state: Path) -> list[str]:
+    log: Path = Path(f"{state}.log")
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_manifest_and_list_parsing(tmp_path: Path) -> None:
+    (tmp_path / "models.toml").write_text(MANIFEST)
+    assert read_manifest(tmp_path / "models.toml") == [
+        ("nomic-embed-text", None), ("huihui_ai/qwen3-abliterated:1.7b-v2-q4_K_M", "Qwen3-ABL-1.7b"),
+        ("qwen2.5-coder:1.5b", "coder"),
+    ]
+    assert normalize("Qwen3-ABL-1.7b") == "qwen3-abl-1.7b:latest"
+    assert normalize("huihui_ai/qwen3:1.7b") == "huihui_ai/qwen3:1.7b"
+    assert parse_list(
+        "NAME                       ID              SIZE      MODIFIED\n"
+        "nomic-embed-text:latest    0a109f422b47    274 MB    2 days ago\n"
+    ) == {"nomic-embed-text:latest"}
+
+
+def test_plans_only_cover_missing_models() -> None:
+    models: list[tuple[str, str | None]] = [("a", None), ("b:1", "alias-b"), ("b:1", "other-b"), ("c", "c")]
+    plans = plan_models(models, {"a:latest", "other-b:latest"})
+    assert [(plan.pull, plan.aliases, plan.needs_pull, plan.remove_pull) for plan in plans] == [
+        ("b:1", ["alias-b"], True, True), ("c", [], True, False),
+    ]
+    assert plan_models(models, {"a:latest", "alias-b:latest", "other-b:latest", "c:latest"}) == []
+
+
+def test_batch_pulls_in_parallel_and_is_idempotent(tmp_path: Path, ollama: tuple[list[str], Path]) -> None:
+    command, state = ollama
+
+    assert run_batch(command, tmp_path / "models.toml", max_concurrent=2) == 0
+
+    assert sorted(json.loads(state.read_text())) == ["Qwen3-ABL-1.7b:latest", "coder:latest", "nomic-embed-text:latest"]
+    log: list[str] = calls(state)
+    assert sorted(line for line in log if line.startswith("pull")) == [
+        "pull huihui_ai/qwen3-abliterated:1.7b-v2-q4_K_M", "pull nomic-embed-text"
+    ]
+    # both pulls start before either finishes
+    assert [line.split()[0] for line in log[1:3]] == ["pull", "pull"]
+    assert log[-2:] == [
+        "cp huihui_ai/qwen3-abliterated:1.7b-v2-q4_K_M Qwen3-ABL-1.7b", "rm huihui_ai/qwen3-abliterated:1.7b-v2-q4_K_M"
+    ]
+
+    Path(f"{state}.log").unlink()
+    assert run_batch(command, tmp_path / "models.toml") == 0
+    assert calls(state) == ["list"]
+
+
+def test_failed_pulls_are_reported(tmp_path: Path, ollama: tuple[list[str], Path], capsys: pytest.CaptureFixture) -> None:
+    command, state = ollama
+    (tmp_path / "models.toml").write_text('[Models]\nbad-pull = "missing-model"\nbad-name = "bad"\n')
+
+    assert run_batch(command, tmp_path / "models.toml") == 1
+    assert "missing-model failed: Error: pull model manifest: file does not exist" in capsys.readouterr().out
+    assert not any(line.startswith("cp") for line in calls(state))
+
+
+def test_failed_listing_stops_the_batch(
+    tmp_path: Path, ollama: tuple[list[str], Path], monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+    ) -> None:
+    command, state = ollama
+    monkeypatch.setenv("OLLAMA_DOWN", "1")
+
+    assert run_batch(command, tmp_path / "models.toml") == 1
+    assert "is the ollama server running?" in capsys.readouterr().out
+    assert calls(state) == ["list"]
+    assert run_batch([str(tmp_path / "missing-ollama")], tmp_path / "models.toml") == 1
+
+
+def test_dry_run_changes_nothing(tmp_path: Path, ollama: tuple[list[str], Path]) -> None:
+    command, state = ollama
+    assert run_batch(command, tmp_path / "models.toml", dry_run=True) == 0
+    assert calls(state) == ["list"]
+    assert json.loads(state.read_text()) == ["coder:latest"]
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import sys, socket
+
+import pytest
+from pathlib import Path
+from llama_index.core import MockEmbedding
+
+from src.chat_model.pool import OllamaPool, LoadBalancer, PooledEmbedding, instance_urls
+from src.chat_model.server import probe
+
+
+FAKE_SERVER: str = """
+import os
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"Ollama is running")
+
+    def log_message(self, *args):
+        pass
+
+HTTPServer(("127.0.0.1", int(os.environ["OLLAMA_PORT"])), Handler).serve_forever()
+"""
+
+
+class RecordingEmbedding(MockEmbedding):
+
+    def __init__(self, url: str, calls: list, fail: bool = False, **kwargs) -> None:
+        super().__init__(embed_dim=4, **kwargs)
+        self._url = url
+        self._calls = calls
+        self._fail = fail
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if self._fail:
+            raise ConnectionError(self._url)
+        self._calls.append((self._url, len(texts)))
+        return [[float(len(text))] * 4 for text in texts]
+
+
+def free_ports(count: int) -> int:
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            first: int = sock.getsockname()[1]
+        if first + count < 65535 and not any(probe(url, 0.2) for url in instance_urls(count, first, "127.0.0.1")):
+            return first
+
+
+def test_balancer_prefers_least_outstanding() -> None:
+    balancer: LoadBalancer = LoadBalancer(["a", "b", "c"])
+
+    first, second, third = balancer.acquire(), balancer.acquire(), balancer.acquire()
+    assert {first, second, third} == {"a", "b", "c"}
+
+    balancer.release("b")
+    assert balancer.acquire() == "b"
+
+    balancer.release("a", failed=True)
+    balancer.release("c")
+    assert balancer.acquire() == "c"
+    assert balancer.metrics["a"]["healthy"] is False
+
+
+def test_pooled_embedding_splits_batches() -> None:
+    calls: list = []
+    urls: list[str] = ["http://one", "http://two", "http://three"]
+    embedding: PooledEmbedding = PooledEmbedding(lambda url: RecordingEmbedding(url, calls), urls)
+
+    texts: list[str] = ["x" * i for i in range(1, 31)]
+    vectors = embedding.get_text_embedding_batch(texts)
+
+    assert vectors == [[float(i)] * 4 for i in range(1, 31)]
+    assert {url for url, _ in calls} == set(urls)
+    assert sum(size for _, size in calls) == 30
+
+
+def test_pooled_embedding_retries_failed_instance() -> None:
+    calls: list = []
+    embedding: PooledEmbedding = PooledEmbedding(
+        lambda url: RecordingEmbedding(url, calls, fail=url == "http://bad"), ["http://bad", "http://good"]
+    )
+
+    assert len(embedding.get_text_embedding_batch(["a", "b", "c", "d"])) == 4
+    assert embedding.balancer.metrics["http://bad"]["healthy"] is False
+    assert all(url == "http://good" for url, _ in calls)
+
+
+def test_pool_starts_instances_on_port_range(tmp_path: Path) -> None:
+    script: Path = tmp_path / "fake_ollama.py"
+    script.write_text(FAKE_SERVER)
+    first: int = free_ports(3)
+
+    pool: OllamaPool = OllamaPool(3, first, "127.0.0.1", command=[sys.executable, str(script)], ready_timeout=10)
+    try:
+        assert pool.start()
+        assert pool.urls == instance_urls(3, first, "127.0.0.1")
+        assert all(probe(url) for url in pool.urls)
+
+        balancer: LoadBalancer = LoadBalancer(pool.urls)
+        assert all(balancer.check_health().values())
+    finally:
+        pool.stop()
+
+    assert not pool.is_ready()
+    assert not any(balancer.check_health().values())
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from pathlib import Path
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from src.chat_model import vector_store as vector_store_module
+from src.chat_model.quantization import CODE_FILES, encode, code_width, code_scores
+from src.chat_model.vector_store import MmapVectorStore, normalize
+
+
+DIMENSIONS: int = 64
+
+
+def clustered(rows: int, seed: int = 0) -> np.ndarray:
+    rng: np.random.Generator = np.random.default_rng(seed)
+    centers: np.ndarray = rng.normal(size=(32, DIMENSIONS))
+    points: np.ndarray = centers[rng.integers(0, 32, rows)] + 0.5 * rng.normal(size=(rows, DIMENSIONS))
+    return normalize(points.astype(np.float32))
+
+
+def make_nodes(vectors: np.ndarray, offset: int = 0) -> list[TextNode]:
+    return [
+        TextNode(id_=f"node-{offset + i}", text=f"text {offset + i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_codes_are_compact() -> None:
+    vectors: np.ndarray = clustered(10)
+    assert encode("int8", vectors).shape == (10, DIMENSIONS)
+    assert encode("binary", vectors).shape == (10, DIMENSIONS // 8)
+    assert code_width("binary", 65) == 9
+
+
+@pytest.mark.parametrize("quantization, min_recall", [("int8", 0.98), ("binary", 0.9)])
+def test_quantized_search_recall(tmp_path: Path, quantization: str, min_recall: float) -> None:
+    vectors: np.ndarray = clustered(5_050)
+    vectors, queries = vectors[:5_000], vectors[5_000:]
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, quantization=quantization)
+    store.add(make_nodes(vectors))
+
+    assert (tmp_path / CODE_FILES[quantization]).stat().st_size == store.memory_footprint["code_bytes"]
+    assert store.evaluate_recall(queries, top_k=10)["recall"] >= min_recall
+
+    # similarities are the exact float32 ones after rescoring
+    result = store.query(VectorStoreQuery(query_embedding=vectors[7].tolist(), similarity_top_k=3))
+    assert result.ids[0] == "node-7"
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_codes_follow_the_float_rows(tmp_path: Path) -> None:
+    vectors: np.ndarray = clustered(300)
+    MmapVectorStore(tmp_path, DIMENSIONS).add(make_nodes(vectors[:200]))
+
+    # switching an existing store to int8 encodes the rows it already has
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, quantization="int8")
+    store.add(make_nodes(vectors[200:], 200))
+    store.delete_nodes(["node-250"])
+    assert (tmp_path / CODE_FILES["int8"]).stat().st_size == 300 * DIMENSIONS
+
+    reopened: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, quantization="int8")
+    assert reopened.evaluate_recall(top_k=5)["recall"] == 1.0
+    result = reopened.query(VectorStoreQuery(query_embedding=vectors[250].tolist(), similarity_top_k=1))
+    assert result.ids != ["node-250"]
+
+    reopened.clear()
+    assert (tmp_path / CODE_FILES["int8"]).stat().st_size == 0
+
+
+def test_ivf_scans_the_codes_of_the_probed_lists(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    vectors: np.ndarray = clustered(5_050)
+    vectors, queries = vectors[:5_000], vectors[5_000:]
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS, index_type="ivf", nlist=16, nprobe=4, quantization="int8")
+    store.add(make_nodes(vectors))
+    assert store.ann.trained
+
+    scored: list[int] = []
+    def counting_scores(quantization: str, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scored.append(codes.shape[0])
+        return code_scores(quantization, codes, query)
+    monkeypatch.setattr(vector_store_module, "code_scores", counting_scores)
+
+    result = store.query(VectorStoreQuery(query_embedding=vectors[7].tolist(), similarity_top_k=3))
+    assert result.ids[0] == "node-7"
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-5)
+    assert 0 < sum(scored) < len(vectors)
+    assert store.evaluate_recall(queries, top_k=10)["recall"] >= 0.9
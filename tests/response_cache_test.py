@@ -0,0 +1,96 @@
+from __future__ import annotations
+import time, asyncio, hashlib
+
+import pytest
+from llama_index.core.embeddings import BaseEmbedding
+
+from src.chat_model import ChatModel
+from src.chat_model.response_cache import ResponseCache, normalize_prompt
+from tests.fakes import FakeAgent, FakeMemory, make_model
+
+
+class BagOfWordsEmbedding(BaseEmbedding):
+
+    def _vector(self, text: str) -> list[float]:
+        vector: list[float] = [0.0] * 64
+        for word in text.lower().split():
+            vector[hashlib.md5(word.encode()).digest()[0] % 64] += 1.0
+        return vector
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._vector(text)
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._vector(query)
+
+
+def test_exact_and_semantic_tiers() -> None:
+    cache: ResponseCache = ResponseCache(BagOfWordsEmbedding(), threshold=0.85)
+    cache.put("scope", "What is the refund policy?", "30 days")
+
+    assert normalize_prompt("  what IS the refund   policy ") == "what is the refund policy"
+    assert cache.get("scope", "what is the refund policy") == "30 days"
+    assert cache.get("scope", "what is the refund policy please") == "30 days"
+    assert cache.get("scope", "how do I reset my password") is None
+    assert cache.get("other scope", "What is the refund policy?") is None
+    assert cache.metrics["exact_hits"] == 1 and cache.metrics["semantic_hits"] == 1
+
+
+def test_ttl_and_lru_eviction() -> None:
+    cache: ResponseCache = ResponseCache(ttl=0.1, max_entries=2)
+    cache.put("s", "a", "1")
+    cache.put("s", "b", "2")
+    assert cache.get("s", "a") == "1"
+    cache.put("s", "c", "3")
+
+    assert cache.get("s", "b") is None
+    assert cache.get("s", "a") == "1"
+    time.sleep(0.15)
+    assert cache.get("s", "c") is None
+
+
+def test_invalidate_drops_in_flight_answers() -> None:
+    cache: ResponseCache = ResponseCache()
+    generation: int = cache.generation
+    cache.invalidate()
+    cache.put("s", "question", "stale answer", generation)
+    assert cache.get("s", "question") is None
+
+
+def test_chat_model_response_cache(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    agent: FakeAgent = FakeAgent(lambda prompt_text, memory: f"answer {agent.runs}")
+    model: ChatModel = make_model(monkeypatch, tmp_path, agent)
+    model.enable_response_cache(semantic=False)
+
+    assert model.prompt("What is the refund policy?") == "answer 1"
+    # later in the same conversation the prompt may mean something else
+    assert model.prompt("what is the refund policy") == "answer 2"
+    assert len(model.memory.messages) == 4
+
+    # a new conversation with the same opening reuses the answer
+    fresh: FakeMemory = model.new_memory()
+    assert str(asyncio.run(model.aprompt("what is the refund policy", fresh))) == "answer 1"
+    assert model.agent.runs == 2
+    assert len(fresh.messages) == 2
+
+    events = asyncio.run(collect(model.astream("What is the refund policy?", model.new_memory())))
+    assert [event.kind for event in events] == ["token", "done"] and events[-1].text == "answer 1"
+    followed: FakeMemory = model.new_memory()
+    asyncio.run(followed.aput_messages(model.memory.messages[:2]))
+    assert str(asyncio.run(model.aprompt("What is the refund policy?", followed))) == "answer 2"
+    assert model.agent.runs == 2
+
+    file = tmp_path / "doc.txt"
+    file.write_text("new document")
+    model.extraction_router.add_extractor("text", lambda path: [])
+    model.extraction_router.add_file_mapping("text", ["txt"])
+    model.add_documents([str(file)])
+
+    assert str(asyncio.run(model.aprompt("What is the refund policy?", model.new_memory()))) == "answer 3"
+
+
+async def collect(stream) -> list:
+    return [event async for event in stream]
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import asyncio
+
+from pathlib import Path
+from llama_index.core import Document, VectorStoreIndex, MockEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.llms import MockLLM
+
+from src.chat_model.chat_model import create_rag_tool
+from src.chat_model.retrieval import CachedRetriever
+from src.chat_model.vector_store import MmapVectorStore
+from tests.fakes import CountingEmbedding
+
+
+DIMENSIONS: int = 16
+
+
+class CountingRetriever(BaseRetriever):
+
+    def __init__(self, inner: BaseRetriever) -> None:
+        super().__init__()
+        self.inner = inner
+        self.calls: int = 0
+
+    def _retrieve(self, query_bundle):
+        self.calls += 1
+        assert query_bundle.embedding is not None
+        return self.inner.retrieve(query_bundle)
+
+
+def make_retriever(tmp_path: Path) -> tuple[CachedRetriever, CountingRetriever, CountingEmbedding, VectorStoreIndex]:
+    embedding: CountingEmbedding = CountingEmbedding(embed_dim=DIMENSIONS)
+    index: VectorStoreIndex = VectorStoreIndex.from_vector_store(
+        MmapVectorStore(tmp_path, DIMENSIONS), embed_model=embedding
+    )
+    index.insert(Document(text="the refund policy is thirty days"))
+    inner: CountingRetriever = CountingRetriever(index.as_retriever(similarity_top_k=2))
+    return CachedRetriever(inner, index, embedding, max_results=2), inner, embedding, index
+
+
+def test_repeated_queries_hit_the_cache(tmp_path: Path) -> None:
+    retriever, inner, embedding, _ = make_retriever(tmp_path)
+
+    first = retriever.retrieve("Refund policy?")
+    second = retriever.retrieve("  refund   POLICY ")
+
+    assert [node.node.node_id for node in first] == [node.node.node_id for node in second]
+    assert inner.calls == 1 and len(embedding._queries) == 1
+    assert retriever.metrics["result_hits"] == 1
+
+
+def test_insert_invalidates_results_but_keeps_embeddings(tmp_path: Path) -> None:
+    retriever, inner, embedding, index = make_retriever(tmp_path)
+    retriever.retrieve("refund policy")
+
+    index.insert(Document(text="shipping takes a week"))
+    results = retriever.retrieve("refund policy")
+
+    assert len(results) == 2
+    assert inner.calls == 2 and len(embedding._queries) == 1
+    assert retriever.metrics["embedding_hits"] == 1
+
+
+def test_results_are_bounded(tmp_path: Path) -> None:
+    retriever, inner, _, _ = make_retriever(tmp_path)
+    for query in ("a", "b", "c", "a"):
+        asyncio.run(retriever.aretrieve(query))
+
+    assert retriever.metrics["results"] == 2
+    assert inner.calls == 4
+
+
+def test_rag_tool_uses_cached_retriever(tmp_path: Path) -> None:
+    embedding: MockEmbedding = MockEmbedding(embed_dim=DIMENSIONS)
+    tool, index = create_rag_tool(MockLLM(), embedding, "docs", 2, MmapVectorStore(tmp_path, DIMENSIONS))
+    assert isinstance(tool.query_engine.retriever, CachedRetriever)
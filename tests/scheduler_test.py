@@ -0,0 +1,128 @@
+from __future__ import annotations
+import time, asyncio
+from threading import Thread, Lock
+
+import pytest
+from llama_index.core import MockEmbedding
+
+from src.chat_model.scheduler import RequestScheduler, EmbeddingBatcher, ScheduledEmbedding, Priority
+
+
+def test_interactive_jumps_background_queue() -> None:
+    scheduler: RequestScheduler = RequestScheduler({Priority.BACKGROUND: 1}, total_limit=1)
+    order: list[str] = []
+    lock: Lock = Lock()
+
+    def work(name: str, priority: Priority) -> None:
+        with scheduler.slot(priority):
+            with lock:
+                order.append(name)
+            time.sleep(0.05)
+
+    scheduler.acquire(Priority.BACKGROUND)
+    threads: list[Thread] = [Thread(target=work, args=(f"bg{i}", Priority.BACKGROUND)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    interactive: Thread = Thread(target=work, args=("chat", Priority.INTERACTIVE))
+    interactive.start()
+    time.sleep(0.05)
+
+    assert scheduler.metrics["classes"]["background"]["queued"] == 3
+    scheduler.release(Priority.BACKGROUND)
+    for thread in [*threads, interactive]:
+        thread.join()
+
+    assert order[0] == "chat"
+    metrics = scheduler.metrics["classes"]
+    assert metrics["background"]["granted"] == 4 and metrics["interactive"]["granted"] == 1
+    assert metrics["background"]["max_wait"] > 0
+
+
+def test_class_limits_are_enforced() -> None:
+    scheduler: RequestScheduler = RequestScheduler({Priority.BACKGROUND: 1, Priority.INTERACTIVE: 2}, total_limit=2)
+
+    assert scheduler.acquire(Priority.BACKGROUND)
+    assert not scheduler.acquire(Priority.BACKGROUND, timeout=0.05)
+    assert scheduler.acquire(Priority.INTERACTIVE, timeout=0.05)
+    assert not scheduler.acquire(Priority.INTERACTIVE, timeout=0.05)
+    assert scheduler.metrics["running"] == 2
+    assert scheduler.metrics["classes"]["background"]["queued"] == 0
+
+
+def test_cancelled_async_waiter_does_not_leak() -> None:
+    scheduler: RequestScheduler = RequestScheduler(total_limit=1)
+
+    async def scenario() -> None:
+        await scheduler.aacquire()
+        waiter: asyncio.Task = asyncio.create_task(scheduler.aacquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release()
+        async with scheduler.aslot(Priority.BACKGROUND):
+            assert scheduler.metrics["running"] == 1
+
+    asyncio.run(scenario())
+    assert scheduler.metrics["running"] == 0
+
+
+def test_batcher_coalesces_concurrent_calls() -> None:
+    calls: list[int] = []
+
+    def embed_batch(texts: list[str]) -> list[list[float]]:
+        calls.append(len(texts))
+        time.sleep(0.02)
+        return [[float(len(text))] for text in texts]
+
+    batcher: EmbeddingBatcher = EmbeddingBatcher(embed_batch, RequestScheduler(), max_batch=32, max_delay=0.05, workers=1)
+    results: dict[int, list] = dict()
+
+    def call(i: int) -> None:
+        results[i] = batcher.embed(["x" * i, "y" * i])
+
+    threads: list[Thread] = [Thread(target=call, args=(i,)) for i in range(1, 17)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert all(results[i] == [[float(i)], [float(i)]] for i in range(1, 17))
+    assert sum(calls) == 32
+    assert len(calls) < 16
+    assert batcher.metrics["batches"] == len(calls)
+
+
+def test_batcher_propagates_errors() -> None:
+    def embed_batch(texts: list[str]) -> list[list[float]]:
+        raise ConnectionError("backend down")
+
+    batcher: EmbeddingBatcher = EmbeddingBatcher(embed_batch, max_delay=0)
+    with pytest.raises(ConnectionError):
+        batcher.embed(["text"])
+    batcher.close()
+
+
+def test_scheduled_embedding_matches_inner() -> None:
+    inner: MockEmbedding = MockEmbedding(embed_dim=4)
+    embedding: ScheduledEmbedding = ScheduledEmbedding(inner, RequestScheduler())
+
+    assert embedding.get_text_embedding_batch(["a", "b"]) == inner.get_text_embedding_batch(["a", "b"])
+    assert embedding.get_query_embedding("q") == inner.get_query_embedding("q")
+    assert asyncio.run(embedding.aget_text_embedding("a")) == inner.get_text_embedding("a")
+
+
+def test_batcher_threads_start_on_use_and_stop_on_close() -> None:
+    embedding: ScheduledEmbedding = ScheduledEmbedding(MockEmbedding(embed_dim=4))
+    workers: list[Thread] = embedding.batcher.workers
+    assert not any(worker.is_alive() for worker in workers)
+
+    embedding.get_text_embedding("a")
+    assert all(worker.is_alive() for worker in workers)
+
+    embedding.close()
+    assert not any(worker.is_alive() for worker in workers)
+    with pytest.raises(RuntimeError):
+        embedding.get_text_embedding("b")
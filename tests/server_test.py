@@ -0,0 +1,100 @@
+from __future__ import annotations
+import os, sys, time, socket, signal
+
+import pytest
+from pathlib import Path
+
+from src.chat_model.server import OllamaSupervisor, probe
+
+
+FAKE_SERVER: str = """
+import sys, time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"Ollama is running")
+
+    def log_message(self, *args):
+        pass
+
+time.sleep(float(sys.argv[2]))
+HTTPServer(("127.0.0.1", int(sys.argv[1])), Handler).serve_forever()
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_supervisor(tmp_path: Path, delay: float = 0.3, **kwargs) -> OllamaSupervisor:
+    script: Path = tmp_path / "fake_ollama.py"
+    script.write_text(FAKE_SERVER)
+    port: int = free_port()
+    return OllamaSupervisor(
+        [sys.executable, str(script), str(port), str(delay)], url=f"http://127.0.0.1:{port}", **kwargs
+    )
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline: float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_start_waits_for_readiness(tmp_path: Path) -> None:
+    supervisor: OllamaSupervisor = make_supervisor(tmp_path)
+    try:
+        assert supervisor.start()
+        assert probe(supervisor.url)
+        metrics = supervisor.metrics
+        assert metrics["starts"] == 1 and metrics["ready"]
+        assert 0.3 <= metrics["last_startup_seconds"] < 10
+    finally:
+        supervisor.stop()
+
+    assert not probe(supervisor.url)
+
+
+def test_running_server_is_reused(tmp_path: Path) -> None:
+    first: OllamaSupervisor = make_supervisor(tmp_path)
+    try:
+        assert first.start()
+        second: OllamaSupervisor = OllamaSupervisor(["false"], url=first.url)
+        assert second.start()
+        assert second.metrics["reused"]
+        assert second.metrics["starts"] == 0
+    finally:
+        first.stop()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses process groups")
+def test_crashed_server_is_restarted(tmp_path: Path) -> None:
+    supervisor: OllamaSupervisor = make_supervisor(tmp_path, delay=0.0)
+    try:
+        assert supervisor.start()
+        os.killpg(supervisor.process.pid, signal.SIGKILL)
+
+        assert wait_for(lambda: supervisor.metrics["restarts"] == 1 and supervisor.metrics["ready"])
+        assert supervisor.metrics["starts"] == 2
+        assert probe(supervisor.url)
+    finally:
+        supervisor.stop()
+
+
+def test_start_fails_when_server_exits(tmp_path: Path) -> None:
+    supervisor: OllamaSupervisor = OllamaSupervisor(
+        [sys.executable, "-c", "raise SystemExit(1)"], url=f"http://127.0.0.1:{free_port()}", restart=False
+    )
+    started: float = time.monotonic()
+
+    assert not supervisor.start()
+    assert time.monotonic() - started < 5
+    supervisor.stop()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import time, asyncio
+
+import pytest
+from llama_index.core import MockEmbedding
+
+from src.chat_model import SessionManager
+from src.chat_model.scheduler import ScheduledEmbedding
+from tests.fakes import FakeAgent, FakeMemory, make_model
+
+
+def reply(prompt_text: str, memory: FakeMemory) -> str:
+    # numbers the turn so tests can tell the session memories apart
+    return f"{prompt_text}:{len(memory.messages) // 2 + 1}"
+
+
+def make_manager(monkeypatch: pytest.MonkeyPatch, tmp_path, delay: float = 0.0, **kwargs) -> SessionManager:
+    return SessionManager(make_model(monkeypatch, tmp_path, FakeAgent(reply, delay=delay)), **kwargs)
+
+
+def test_sessions_keep_separate_memory(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path)
+    try:
+        assert manager.prompt("a", "hi") == "hi:1"
+        assert manager.prompt("a", "again") == "again:2"
+        assert manager.prompt("b", "hi") == "hi:1"
+        assert len(manager.model.agent.memories) == 2
+        assert manager.session_count == 2
+    finally:
+        manager.shutdown()
+
+
+def test_concurrent_prompts_share_one_loop(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path, delay=0.2)
+
+    async def ask_all() -> list[str]:
+        return await asyncio.gather(*(manager.aprompt(f"user-{i}", "hi") for i in range(10)))
+
+    try:
+        started: float = time.monotonic()
+        results: list[str] = asyncio.run(ask_all())
+        assert time.monotonic() - started < 1.5
+        assert results == ["hi:1"] * 10
+    finally:
+        manager.shutdown()
+
+
+def test_same_session_runs_in_order(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path, delay=0.05)
+    try:
+        futures = [manager.submit("a", str(i)) for i in range(5)]
+        assert sorted(future.result() for future in futures) == [f"{i}:{i + 1}" for i in range(5)]
+    finally:
+        manager.shutdown()
+
+
+def test_idle_sessions_are_evicted(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path, idle_timeout=0.1, max_sessions=2)
+    try:
+        for session_id in ("a", "b", "c"):
+            manager.open_session(session_id)
+        assert set(manager.sessions) == {"b", "c"}
+
+        time.sleep(0.2)
+        assert sorted(manager.evict_idle()) == ["b", "c"]
+        assert manager.session_count == 0
+    finally:
+        manager.shutdown()
+
+
+def test_stream_through_session(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path)
+    try:
+        events = list(manager.stream("a", "hi"))
+        assert [event.kind for event in events] == ["done"]
+        assert events[0].text == "hi:1"
+    finally:
+        manager.shutdown()
+
+
+def test_shutdown_stops_the_embedding_batcher(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    manager: SessionManager = make_manager(monkeypatch, tmp_path)
+    manager.model.embedding = ScheduledEmbedding(MockEmbedding(embed_dim=8))
+    manager.model.embedding.get_text_embedding("warm up")
+    workers = manager.model.embedding.batcher.workers
+    assert manager.prompt("a", "hi") == "hi:1"
+
+    manager.shutdown()
+    assert not any(worker.is_alive() for worker in workers)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from llama_index.core import VectorStoreIndex, MockEmbedding
+from llama_index.core.node_parser import LangchainNodeParser
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from src.extractors import ExtractionCache, ExtractionRouter, plain_extractor
+from src.chat_model.bm25 import BM25Index
+from src.chat_model.sync import DirectorySync, SyncManifest
+from src.chat_model.vector_store import MmapVectorStore
+from tests.fakes import CountingEmbedding
+
+
+DIMENSIONS: int = 8
+
+
+def failing_extractor(file_path: str):
+    raise ValueError("broken file")
+
+
+def make_router() -> ExtractionRouter:
+    splitter: LangchainNodeParser = LangchainNodeParser(
+        RecursiveCharacterTextSplitter(chunk_size=64, chunk_overlap=0)
+    )
+    router: ExtractionRouter = ExtractionRouter()
+    router.add_extractor("text", plain_extractor, splitter)
+    router.add_file_mapping("text", ["txt"])
+    router.add_extractor("broken", failing_extractor, splitter)
+    router.add_file_mapping("broken", ["bad"])
+    return router
+
+
+def make_sync(tmp_path: Path) -> tuple[DirectorySync, CountingEmbedding, MmapVectorStore, BM25Index]:
+    embedding: CountingEmbedding = CountingEmbedding(embed_dim=DIMENSIONS)
+    store: MmapVectorStore = MmapVectorStore(tmp_path / "store", DIMENSIONS)
+    index: VectorStoreIndex = VectorStoreIndex.from_vector_store(store, embed_model=embedding)
+    keywords: BM25Index = BM25Index(tmp_path / "store")
+    sync: DirectorySync = DirectorySync(
+        make_router(), embedding, index, SyncManifest(tmp_path / "store"), keywords
+    )
+    return sync, embedding, store, keywords
+
+
+def write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_sync_only_ingests_changes(tmp_path: Path) -> None:
+    share: Path = tmp_path / "share"
+    write(share / "a.txt", "alpha report about pumps")
+    write(share / "nested" / "b.txt", "beta report about valves")
+    write(share / "c.txt", "gamma report about code X-991")
+    write(share / "ignored.bin", "not a supported type")
+    sync, embedding, store, keywords = make_sync(tmp_path)
+
+    first = sync.sync(share)
+    assert sorted(Path(path).name for path in first.added) == ["a.txt", "b.txt", "c.txt"]
+    assert store.node_count == 3 and len(embedding._texts) == 3
+
+    again = sync.sync(share)
+    assert again.unchanged == 3 and not (again.added or again.updated or again.removed)
+    assert len(embedding._texts) == 3
+
+    # a new mtime with the same content is only hashed
+    os.utime(share / "a.txt", ns=(0, 10**9))
+    assert sync.sync(share).unchanged == 3 and len(embedding._texts) == 3
+
+    write(share / "nested" / "b.txt", "beta report about gauges")
+    (share / "c.txt").unlink()
+    write(share / "d.txt", "delta report")
+    report = sync.sync(share)
+
+    assert [Path(path).name for path in report.updated] == ["b.txt"]
+    assert [Path(path).name for path in report.removed] == ["c.txt"]
+    assert [Path(path).name for path in report.added] == ["d.txt"]
+    assert report.unchanged == 1 and len(embedding._texts) == 5
+
+    texts: list[str] = sorted(node.get_content() for node in store.get_nodes())
+    assert texts == ["alpha report about pumps", "beta report about gauges", "delta report"]
+    assert keywords.search("x-991", 5) == [] and keywords.search("valves", 5) == []
+    assert keywords.metrics["documents"] == 3
+
+
+def test_failed_files_are_retried(tmp_path: Path) -> None:
+    share: Path = tmp_path / "share"
+    write(share / "good.txt", "good file")
+    write(share / "broken.bad", "cannot be read")
+    sync, _, store, _ = make_sync(tmp_path)
+
+    report = sync.sync(share)
+    assert [Path(path).name for path in report.failed] == ["broken.bad"]
+    assert sync.sync(share).failed == report.failed
+    assert store.node_count == 1
+
+
+def test_manifest_is_scoped_to_the_synced_folder(tmp_path: Path) -> None:
+    write(tmp_path / "one" / "a.txt", "first folder")
+    write(tmp_path / "two" / "b.txt", "second folder")
+    sync, _, store, _ = make_sync(tmp_path)
+
+    sync.sync(tmp_path / "one")
+    report = sync.sync(tmp_path / "two")
+    assert report.removed == [] and len(report.added) == 1
+    assert store.node_count == 2
+
+    result = store.query(VectorStoreQuery(query_embedding=[1.0] * DIMENSIONS, similarity_top_k=5))
+    assert len(result.ids) == 2
+
+
+def test_sync_with_in_memory_index(tmp_path: Path) -> None:
+    write(tmp_path / "share" / "a.txt", "in memory")
+    embedding: MockEmbedding = MockEmbedding(embed_dim=DIMENSIONS)
+    index: VectorStoreIndex = VectorStoreIndex([], embed_model=embedding)
+    sync: DirectorySync = DirectorySync(make_router(), embedding, index, SyncManifest(tmp_path))
+
+    sync.sync(tmp_path / "share")
+    (tmp_path / "share" / "a.txt").unlink()
+    assert len(sync.sync(tmp_path / "share").removed) == 1
+    assert len(index.index_struct.nodes_dict) == 0
+
+
+def test_files_with_the_same_content_keep_their_own_nodes(tmp_path: Path) -> None:
+    text: str = "\n".join(f"copied line {i} about the same report" for i in range(10))
+    write(tmp_path / "share" / "a.txt", text)
+    write(tmp_path / "share" / "b.txt", text)
+    sync, _, store, keywords = make_sync(tmp_path)
+    sync.router.cache = ExtractionCache(tmp_path / "cache")
+
+    sync.sync(tmp_path / "share")
+    entries = sync.manifest.entries(str(tmp_path / "share"))
+    ids: list[set[str]] = [set(state.node_ids) for state in entries.values()]
+    assert len(ids) == 2 and len(ids[0]) > 0 and not ids[0] & ids[1]
+    assert store.node_count == len(ids[0]) + len(ids[1])
+
+    (tmp_path / "share" / "b.txt").unlink()
+    assert len(sync.sync(tmp_path / "share").removed) == 1
+    assert store.node_count == len(ids[0]) == keywords.metrics["documents"]
+    assert {node.metadata["file_path"] for node in store.get_nodes()} == {str(tmp_path / "share" / "a.txt")}
+
+
+def test_node_ids_owned_by_another_file_are_not_deleted(tmp_path: Path) -> None:
+    write(tmp_path / "share" / "a.txt", "first file")
+    write(tmp_path / "share" / "b.txt", "second file")
+    sync, _, store, _ = make_sync(tmp_path)
+    sync.sync(tmp_path / "share")
+
+    # an older manifest where both files claim the same nodes
+    entries = sync.manifest.entries(str(tmp_path / "share"))
+    shared: list[str] = [node_id for state in entries.values() for node_id in state.node_ids]
+    for state in entries.values():
+        state.node_ids = shared
+    sync.manifest.put(list(entries.values()))
+
+    (tmp_path / "share" / "b.txt").unlink()
+    sync.sync(tmp_path / "share")
+    assert store.node_count == 2
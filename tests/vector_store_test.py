@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from pathlib import Path
+
+from llama_index.core import Document, VectorStoreIndex, MockEmbedding
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from src.chat_model.vector_store import MmapVectorStore, VECTORS_FILE, stored_dimensions
+
+
+DIMENSIONS: int = 16
+
+
+def make_nodes(vectors: np.ndarray, prefix: str = "node") -> list[TextNode]:
+    return [
+        TextNode(id_=f"{prefix}-{i}", text=f"text {i}", embedding=vector.tolist(), metadata={"row": i})
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_query_matches_exact_search(tmp_path: Path) -> None:
+    rng: np.random.Generator = np.random.default_rng(0)
+    vectors: np.ndarray = rng.normal(size=(300, DIMENSIONS)).astype(np.float32)
+
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    store.add(make_nodes(vectors[:100]))
+    store.add(make_nodes(vectors[100:], prefix="more"))
+
+    query: np.ndarray = rng.normal(size=DIMENSIONS).astype(np.float32)
+    result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5))
+
+    normalized: np.ndarray = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected: np.ndarray = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+
+    assert [node.metadata["row"] for node in result.nodes] == [
+        int(row) if row < 100 else int(row) - 100 for row in expected
+    ]
+    assert result.similarities == sorted(result.similarities, reverse=True)
+
+
+def test_store_persists_and_deletes(tmp_path: Path) -> None:
+    vectors: np.ndarray = np.eye(DIMENSIONS, dtype=np.float32)
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    store.add(make_nodes(vectors))
+    store.delete_nodes(["node-3"])
+
+    reopened: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    assert reopened.node_count == DIMENSIONS - 1
+
+    result = reopened.query(VectorStoreQuery(query_embedding=vectors[3].tolist(), similarity_top_k=1))
+    assert result.ids != ["node-3"]
+
+    result = reopened.query(VectorStoreQuery(query_embedding=vectors[4].tolist(), similarity_top_k=1))
+    assert result.ids == ["node-4"]
+    assert result.nodes[0].get_content() == "text 4"
+
+
+def test_interrupted_append_is_truncated(tmp_path: Path) -> None:
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    store.add(make_nodes(np.eye(DIMENSIONS, dtype=np.float32)[:4]))
+
+    with open(tmp_path / VECTORS_FILE, "ab") as file:
+        file.write(np.ones((2, DIMENSIONS), dtype=np.float32).tobytes())
+
+    reopened: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    assert reopened.node_count == 4
+    assert (tmp_path / VECTORS_FILE).stat().st_size == 4 * DIMENSIONS * 4
+
+
+def test_wrong_width_is_rejected(tmp_path: Path) -> None:
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    with pytest.raises(ValueError):
+        store.add(make_nodes(np.ones((1, DIMENSIONS + 1), dtype=np.float32)))
+
+
+def test_store_keeps_its_width(tmp_path: Path) -> None:
+    assert stored_dimensions(tmp_path) is None
+    store: MmapVectorStore = MmapVectorStore(tmp_path, DIMENSIONS)
+    store.add(make_nodes(np.eye(DIMENSIONS, dtype=np.float32)[:4]))
+    assert stored_dimensions(tmp_path) == DIMENSIONS
+
+    with pytest.raises(ValueError, match=f"holds {DIMENSIONS} wide vectors"):
+        MmapVectorStore(tmp_path, DIMENSIONS * 2)
+    assert MmapVectorStore(tmp_path, DIMENSIONS).node_count == 4
+
+    # stores written before the width was recorded get it from the vectors file
+    store.client.execute("DELETE FROM meta")
+    store.client.commit()
+    with pytest.raises(ValueError):
+        MmapVectorStore(tmp_path, DIMENSIONS // 2)
+    assert MmapVectorStore(tmp_path, DIMENSIONS).node_count == 4
+
+
+def test_index_round_trip(tmp_path: Path) -> None:
+    embedding: MockEmbedding = MockEmbedding(embed_dim=DIMENSIONS)
+    index: VectorStoreIndex = VectorStoreIndex.from_vector_store(
+        MmapVectorStore(tmp_path, DIMENSIONS), embed_model=embedding
+    )
+    index.insert(Document(text="hello world", metadata={"file_name": "hello"}))
+
+    reloaded: VectorStoreIndex = VectorStoreIndex.from_vector_store(
+        MmapVectorStore(tmp_path, DIMENSIONS), embed_model=embedding
+    )
+    nodes = reloaded.as_retriever(similarity_top_k=1).retrieve("hello")
+
+    assert nodes[0].node.get_content() == "hello world"
+    assert nodes[0].node.metadata["file_name"] == "hello"
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import sys, asyncio
+
+import pytest
+from pathlib import Path
+
+from src import workers
+from src.workers import ModelPullManager, PullEvent, parse_progress
+
+
+# prints progress the way ollama does: bars redrawn with cursor escapes and \r
+FAKE_OLLAMA: str = r"""
+import os, sys, time
+
+command, model = sys.argv[1:3]
+running = os.path.join(os.environ["PULL_FOLDER"], model)
+open(running, "w").close()
+with open(os.path.join(os.environ["PULL_FOLDER"], "log"), "a") as log:
+    log.write(f"{len([name for name in os.listdir(os.environ['PULL_FOLDER']) if name != 'log'])}\n")
+
+def say(text):
+    sys.stdout.write("\x1b[?25l\x1b[1G" + text + "\x1b[K\r")
+    sys.stdout.flush()
+
+say("pulling manifest")
+if model == "missing":
+    print("Error: pull model manifest: file does not exist")
+    os.remove(running)
+    sys.exit(1)
+for step in range(1, 5):
+    say(f"pulling 8934d96d3f08... {step * 25}% ▕{'█' * step}▏ {step * 0.5:.1f} GB/2.0 GB  25 MB/s  {4 - step}m0s")
+    say(f"pulling 8934d96d3f08... {step * 25}% ▕{'█' * step}▏ {step * 0.5:.1f} GB/2.0 GB  25 MB/s  {4 - step}m0s")
+    time.sleep(30 if model in ("slow", "starting") else 0.1)
+say("verifying sha256 digest")
+say("writing manifest")
+print("success")
+os.remove(running)
+"""
+
+
+def make_manager(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, **kwargs) -> ModelPullManager:
+    script: Path = tmp_path / "ollama.py"
+    script.write_text(FAKE_OLLAMA, encoding="utf-8")
+    monkeypatch.setenv("PULL_FOLDER", str(tmp_path / "pulls"))
+    monkeypatch.setenv("PYTHONIOENCODING", "utf-8")
+    (tmp_path / "pulls").mkdir()
+    return ModelPullManager([sys.executable, str(script)], **kwargs)
+
+
+def test_progress_lines_are_parsed() -> None:
+    event: PullEvent | None = parse_progress(
+        "qwen", "pulling 8934d96d3f08... 45% ▕███     ▏ 1.7 GB/3.8 GB  25 MB/s  1m23s"
+    )
+    assert event.kind == "progress" and event.status == "pulling 8934d96d3f08"
+    assert (event.completed, event.total, event.rate, event.eta) == (1_700_000_000, 3_800_000_000, 25e6, 83.0)
+
+    assert parse_progress("qwen", "pulling manifest") == PullEvent(model="qwen", kind="status", status="pulling manifest")
+    assert parse_progress("qwen", "   ") is None
+
+
+def test_pulls_stream_progress_and_respect_the_cap(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    manager: ModelPullManager = make_manager(tmp_path, monkeypatch, max_concurrent=2)
+
+    async def run() -> tuple[list[PullEvent], dict[str, PullEvent]]:
+        results: asyncio.Task = asyncio.ensure_future(manager.pull_all(["a", "b", "c", "a"]))
+        await asyncio.sleep(0)
+        events: list[PullEvent] = [event async for event in manager.events()]
+        return events, await results
+
+    events, results = asyncio.run(run())
+
+    assert {model: event.kind for model, event in results.items()} == {"a": "done", "b": "done", "c": "done"}
+    progress: list[PullEvent] = [event for event in events if event.model == "a" and event.kind == "progress"]
+    # the repeated redraw of every step is dropped
+    assert [event.completed for event in progress] == [500_000_000, 1_000_000_000, 1_500_000_000, 2_000_000_000]
+    assert progress[0].eta == 180.0
+    statuses: list[str] = [event.status for event in events if event.model == "a" and event.kind == "status"]
+    assert statuses == ["pulling manifest", "verifying sha256 digest", "writing manifest", "success"]
+    assert max(int(line) for line in (tmp_path / "pulls" / "log").read_text().split()) <= 2
+
+
+def test_duplicate_pulls_share_one_process(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    manager: ModelPullManager = make_manager(tmp_path, monkeypatch)
+
+    async def run() -> bool:
+        first: asyncio.Task = manager.pull("a")
+        second: asyncio.Task = manager.pull("a")
+        await first
+        return first is second
+
+    assert asyncio.run(run())
+    assert (tmp_path / "pulls" / "log").read_text().split() == ["1"]
+
+
+def test_failed_and_cancelled_pulls(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    manager: ModelPullManager = make_manager(tmp_path, monkeypatch)
+
+    async def run() -> dict[str, PullEvent]:
+        slow: asyncio.Task = manager.pull("slow")
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if manager.status("slow").kind == "progress":
+                break
+        assert manager.cancel("slow")
+        assert not manager.cancel("unknown")
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+
+        # cancelled while the process is being started
+        starting: asyncio.Task = manager.pull("starting")
+        await asyncio.sleep(0)
+        manager.cancel("starting")
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(starting, 10)
+        return await manager.pull_all(["missing"])
+
+    results: dict[str, PullEvent] = asyncio.run(run())
+
+    assert manager.status("slow").kind == "cancelled"
+    assert manager.status("starting").kind == "cancelled"
+    assert manager.active == []
+    assert results["missing"].kind == "failed" and results["missing"].returncode == 1
+    assert results["missing"].status == "Error: pull model manifest: file does not exist"
+
+
+def test_download_model_reports_on_the_status_queue(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    manager: ModelPullManager = make_manager(tmp_path, monkeypatch)
+    monkeypatch.setattr(workers, "default_pull_command", lambda: manager.command)
+
+    workers.download_model("missing")
+    assert workers.status_queue.get(timeout=5) == {"download_model": "missing", "return": 1}
+
+
+def test_pull_models_reports_every_event(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    manager: ModelPullManager = make_manager(tmp_path, monkeypatch)
+    events: list[PullEvent] = []
+
+    results: dict[str, PullEvent] = asyncio.run(
+        workers.pull_models(["a", "missing"], manager.command, report=events.append)
+    )
+
+    assert {model: event.kind for model, event in results.items()} == {"a": "done", "missing": "failed"}
+    assert [event.kind for event in events if event.model == "a"][0] == "queued"
+    assert {event.kind for event in events} >= {"queued", "status", "progress", "done", "failed"}